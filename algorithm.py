@@ -5,23 +5,66 @@ Created on Tue Sep 24 09:35:00 2024
 @author: Oriana.Rahman
 """
 
-import requests
-from time import sleep
-import numpy as np
+import argparse
+import os
+from math import isnan
+from requests.adapters import HTTPAdapter
+from time import perf_counter, sleep
 import pandas as pd
 
-# Creates a session object to manage and persist settings across multiple API requests
-s = requests.Session()
+import checkpoint
+from market_data import MarketData, parse_book
+from eventlog import log
+from gateway import OrderGateway, OrderIntent, record_ack
+from governor import Governor, GovernedSession, REDUCE, hints
+from ledger import FillLedger
+from metrics import registry
+from policy import PolicyBook
+from positions import PositionCache
+from quotes import QuoteManager
+from scheduler import Budget, QuotingScheduler
+from recorder import Recorder
+from risk import RiskEngine
+from signals import SignalMatrix
+from tape import TapeFollower
+from timeseries import RollingStore
+from unwind import UnwindEngine
+
+BASE_URL = 'http://localhost:9999/v1'  # Root of the RIT client REST API
+TICKERS = ['OWL', 'CROW', 'DOVE', 'DUCK']
+
+# Requests per second per endpoint group ('orders' covers order entry and cancels, '*' every request).
+# Empty: nothing is held back until the server answers 429, then the group waits out its hint.
+REQUEST_RATES = {}
+QUOTE_MAX_AGE = 0.25  # Seconds a new quote may queue behind the rate limit before it is dropped as stale
+
+# Creates a session object to manage and persist settings across multiple API requests;
+# every call waits its turn in the governor, cancels and unwinds ahead of new quotes
+s = GovernedSession(Governor(REQUEST_RATES))
 s.headers.update({'X-API-key': ' '}) # Adds an API key to the session headers for authentication
+s.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=16)) # Keep-alive pool big enough for concurrent requests
+registry.instrument(s) # Per-endpoint latency histograms; free until the registry is enabled
 
 # Global variables for managing risk and order constraints
 MAX_LONG_EXPOSURE = 250000  # Maximum allowable long position exposure
 MAX_SHORT_EXPOSURE = -250000  # Maximum allowable short position exposure
 ORDER_LIMIT = 5000  # Maximum allowable order size per transaction
+MAX_DRAWDOWN = None  # Stop adding to positions once PnL falls this far below its peak (None: no limit)
+
+# Requote budgets: how often a ticker may requote per tick, how many order/cancel requests it may spend
+# per tick and how old its book may be when its orders go out. DOVE moves most and gets the most room.
+TICKER_BUDGETS = {
+    'OWL': Budget(runs_per_tick=1, requests_per_tick=10, latency=0.25),
+    'CROW': Budget(runs_per_tick=4, requests_per_tick=60, latency=0.25),
+    'DOVE': Budget(runs_per_tick=6, requests_per_tick=100, latency=0.15),
+    'DUCK': Budget(runs_per_tick=4, requests_per_tick=60, latency=0.25),
+}
+
+recorder = None  # Tick-data Recorder, set by main() when a recording directory is given
 
 # Function to fetch the current tick and status of the case
 def get_tick():
-    resp = s.get('http://localhost:9999/v1/case')  # Sends a GET request to fetch case details
+    resp = s.get(BASE_URL + '/case')  # Sends a GET request to fetch case details
     if resp.ok:  # Checks if the request was successful
         case = resp.json()  # Parses the response JSON
         return case['tick'], case['status']  # Returns the current tick and case status
@@ -29,101 +72,37 @@ def get_tick():
 # Function to get the best bid and ask prices for a given ticker
 def get_bid_ask(ticker):
     payload = {'ticker': ticker}  # Defines the request parameters for the ticker
-    resp = s.get ('http://localhost:9999/v1/securities/book', params=payload)  # Sends a GET request to fetch the order book
+    resp = s.get (BASE_URL + '/securities/book', params=payload)  # Sends a GET request to fetch the order book
     if resp.ok:  # Checks if the request was successful
         book = resp.json()  # Parses the response JSON
-        bid_side_book = book['bids']  # Extracts the bid-side order book
-        ask_side_book = book['asks']  # Extracts the ask-side order book
-        
-        bid_prices_book = [item['price'] for item in bid_side_book]  # Gets all bid prices
-        ask_prices_book = [item['price'] for item in ask_side_book]  # Gets all ask prices
-        
-        bid_volume_book = [item['quantity'] for item in bid_side_book]
-        ask_volume_book = [item['quantity'] for item in ask_side_book]
-
-        bidVol = np.sum(bid_volume_book)
-        askVol = np.sum(ask_volume_book)
-        
-
-        if bidVol > askVol:
-            trend = bidVol/askVol
-        else:
-            trend = -1*(askVol/bidVol)
-
-        best_bid_price = bid_prices_book[0]  # Selects the best (highest) bid price
-        best_ask_price = ask_prices_book[0]  # Selects the best (lowest) ask price
-
+        best_bid_price, best_ask_price, trend = parse_book(book)
         return best_bid_price, best_ask_price, trend  # Returns the best bid and ask prices
 
-# Function to get the time and sales data (trade quantities) for a given ticker
+# Only prints newer than the last one seen are requested, so polls cost the same late in the case
+tape = TapeFollower(s, BASE_URL, TICKERS)
+
+# Function to get the time and sales data (trade quantities) printed since the last poll of a ticker
 def get_time_sales(ticker):
-    payload = {'ticker': ticker}  # Defines the request parameters for the ticker
-    resp = s.get ('http://localhost:9999/v1/securities/tas', params=payload)  # Sends a GET request to fetch the time and sales data
-    if resp.ok:  # Checks if the request was successful
-        book = resp.json()  # Parses the response JSON
-        time_sales_book = [item["quantity"] for item in book]  # Extracts the quantities from the time and sales data
-        return time_sales_book  # Returns the trade quantities
+    prints = tape.poll(ticker, tape[ticker].tick)  # Sends a GET request for the new time and sales data only
+    time_sales_book = [item["quantity"] for item in prints]  # Extracts the quantities from the time and sales data
+    return time_sales_book  # Returns the trade quantities
+
+# Every order is checked against the exposure limits before it is sent
+risk = RiskEngine(TICKERS, gross_limit=MAX_LONG_EXPOSURE, long_limit=MAX_LONG_EXPOSURE,
+                  short_limit=MAX_SHORT_EXPOSURE, order_limit=ORDER_LIMIT, max_drawdown=MAX_DRAWDOWN)
+
+# Positions are read from /securities at most once per iteration; main() invalidates after sending orders
+positions = PositionCache(s, BASE_URL, on_refresh=risk.reconcile_positions)
 
 # Function to calculate the total position across all securities
 def get_long_position():
-    resp = s.get ('http://localhost:9999/v1/securities')  # Sends a GET request to fetch securities data
-    if resp.ok:  # Checks if the request was successful
-        book = resp.json()  # Parses the response JSON
-        pos1 = book[0]['position'] # OWL
-        pos2 = book[1]['position'] # CROW
-        pos3 = book[2]['position'] # DOVE
-        pos4 = book[3]['position'] # DUCK
-
-        # No contribution to long if negative
-        if (pos1<0):
-            pos1 = 0
-        if (pos2<0):
-            pos2 = 0
-        if (pos3<0):
-            pos3 = 0
-        if (pos4<0):
-            pos4 = 0
-
-        return pos1+pos2+pos3+pos4 # Returns the sum of positions for all securities
+    return positions.long() # Returns the sum of long positions for all securities
     
 def get_short_position():
-    resp = s.get ('http://localhost:9999/v1/securities')  # Sends a GET request to fetch securities data
-    if resp.ok:  # Checks if the request was successful
-        book = resp.json()  # Parses the response JSON
-        pos1 = book[0]['position'] # OWL
-        pos2 = book[1]['position'] # CROW
-        pos3 = book[2]['position'] # DOVE
-        pos4 = book[3]['position'] # DUCK
-
-        # No contribution to long if negative
-        if (pos1>0):
-            pos1 = 0
-        if (pos2>0):
-            pos2 = 0
-        if (pos3>0):
-            pos3 = 0
-        if (pos4>0):
-            pos4 = 0
-
-        return pos1+pos2+pos3+pos4 # Returns the sum of positions for all securities
+    return positions.short() # Returns the sum of short positions for all securities
     
 def indPos(security):
-    resp = s.get ('http://localhost:9999/v1/securities')  # Sends a GET request to fetch securities data
-    if resp.ok:  # Checks if the request was successful
-        book = resp.json()  # Parses the response JSON
-        pos1 = book[0]['position'] # OWL
-        pos2 = book[1]['position'] # CROW
-        pos3 = book[2]['position'] # DOVE
-        pos4 = book[3]['position'] # DUCK
-
-    if (security == 'OWL'):
-        return pos1
-    if (security == 'CROW'):
-        return pos2
-    if (security == 'DOVE'):
-        return pos3
-    if (security == 'DUCK'):
-        return pos4
+    return positions.position(security)
 
 # def velocity(ticker_symbol, current_tick):
     
@@ -133,7 +112,7 @@ def indPos(security):
 # Function to get the open buy and sell orders for a given ticker
 def get_open_orders(ticker):
     payload = {'ticker': ticker}  # Defines the request parameters for the ticker
-    resp = s.get ('http://localhost:9999/v1/orders', params=payload)  # Sends a GET request to fetch open orders
+    resp = s.get (BASE_URL + '/orders', params=payload)  # Sends a GET request to fetch open orders
     if resp.ok:  # Checks if the request was successful
         orders = resp.json()  # Parses the response JSON
         buy_orders = [item for item in orders if item["action"] == "BUY"]  # Filters for buy orders
@@ -142,432 +121,359 @@ def get_open_orders(ticker):
 
 # Function to get the status of a specific order by its ID
 def get_order_status(order_id):
-    resp = s.get ('http://localhost:9999/v1/orders' + '/' + str(order_id))  # Sends a GET request to fetch the status of a specific order
+    resp = s.get (BASE_URL + '/orders/' + str(order_id))  # Sends a GET request to fetch the status of a specific order
     if resp.ok:  # Checks if the request was successful
         order = resp.json()  # Parses the response JSON
         return order['status']  # Returns the status of the order
     
+# Quoting tables per ticker; edits to policy.json are picked up while the case runs
+policies = PolicyBook(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'policy.json'))
+
+# Realized/unrealized PnL, fees and rebates per ticker, updated on every fill we observe
+ledger = FillLedger(TICKERS, {t: policies[t].fee for t in TICKERS}, {t: policies[t].rebate for t in TICKERS})
+risk.ledger = ledger
+
+# Best bid per ticker per tick, bounded no matter how long the case runs
+prices = RollingStore(TICKERS, windows=(10, 30, 60), spans=(10, 30))
+
+# Rolling returns of all four tickers together; their covariance turns the whole book into one risk figure
+signals = SignalMatrix(TICKERS, window=60)
+
 def get_moving_average(security, currentTick):
-    if (security == 'OWL'):
-        if currentTick < 10:
-            return owl_prices[currentTick]
-        if (owl_prices[currentTick-10] == 0):
-            pastTick = currentTick-9
-        else:
-            pastTick = currentTick-10
-        if (owl_prices[currentTick] == 0):
-            currentTick-=1
-        movingAve = (owl_prices[currentTick] + owl_prices[pastTick])/2
-        return movingAve
-    
-    if (security == 'CROW'):
-        if currentTick < 10:
-            return crow_prices[currentTick]
-        if (crow_prices[currentTick-10] == 0):
-            pastTick = currentTick-9
-        else:
-            pastTick = currentTick-10
-        if (crow_prices[currentTick] == 0):
-            currentTick-=1
-        movingAve = (crow_prices[currentTick] + crow_prices[pastTick])/2
-        return movingAve
-    
-    if (security == 'DUCK'):
-        if currentTick < 10:
-            return duck_prices[currentTick]
-        if (duck_prices[currentTick-10] == 0):
-            pastTick = currentTick-9
-        else:
-            pastTick = currentTick-10
-        if (duck_prices[currentTick] == 0):
-            currentTick-=1
-        movingAve = (duck_prices[currentTick] + duck_prices[pastTick])/2
-        return movingAve
-    
-    if (security == 'DOVE'):
-        if currentTick < 10:
-            return dove_prices[currentTick]
-        if (dove_prices[currentTick-10] == 0):
-            pastTick = currentTick-9
-        else:
-            pastTick = currentTick-10
-        if (dove_prices[currentTick] == 0):
-            currentTick-=1
-        movingAve = (dove_prices[currentTick] + dove_prices[pastTick])/2
-        return movingAve
+    series = prices[security]
+    current = series.at(currentTick)
+    if isnan(current):
+        current = series.at(currentTick - 1)  # Nothing stored for this tick yet, use the previous one
+    past = series.at(currentTick - 10)
+    if isnan(past):
+        past = series.at(currentTick - 9)
+    if isnan(current):
+        return 0  # No history at all; main() falls back to the live bid
+    if isnan(past):
+        return current  # Less than ten ticks of history
+    movingAve = (current + past)/2
+    return movingAve
 
 def adjusted_order (movingAvePrice, currentPrice):
     adjustedPrice = abs(movingAvePrice - currentPrice)/movingAvePrice
     return 1-adjustedPrice
 
-# Check for bid-ask spreads and make trades based on difference
+# Spread tiers, offsets and the minimum edge after rebates come from the ticker's policy table
 def market_making (ticker_symbol, buy_price, sell_price):
-    difference = sell_price - buy_price
-    if (ticker_symbol == 'DUCK'): # +0.03/share to trade (less difference cuz less volatile)
-        if (difference > 0.40): # Most people will attempt to take advantage when spreads are large, reduce profit intake to ensure that some profit is made
-            buy = buy_price + 0.08
-            sell = sell_price - 0.08
-            return buy, sell
-        if (difference > 0.20):
-            buy = buy_price + 0.05
-            sell = sell_price -0.05
-            return buy, sell
-    if (ticker_symbol =='DOVE'):
-        if (difference > 0.20):
-            buy = buy_price + 0.05
-            sell = sell_price - 0.05
-            return buy, sell
-        
-    if (ticker_symbol == 'OWL'): # +0.04/share to trade (less difference cuz less volatile)
-        if (difference > 0.40):
-            buy = buy_price + 0.19
-            sell = sell_price - 0.19
-            return buy, sell
-        # if (difference > 0.30): #changed
-        #     buy = buy_price + 0.14
-        #     sell = sell_price - 0.14
-        #     return buy, sell
-    if (ticker_symbol == 'CROW'): # +0.03/share to trade (less difference cuz less volatile)
-        if (difference > 0.40): # Most people will attempt to take advantage when spreads are large, reduce profit intake to ensure that some profit is made
-            buy = buy_price + 0.10
-            sell = sell_price - 0.10
-            return buy, sell
-        if (difference > 0.20):
-            buy = buy_price + 0.05
-            sell = sell_price -0.05
-            return buy, sell
-        # if (difference > 0.20):
-        #     buy = buy_price + 0.08
-        #     sell = sell_price - 0.08
-        #     return buy, sell
-        # if (difference > 0.40):
-        #     buy = buy_price + 0.08
-        #     sell = sell_price - 0.08
-        #     return buy, sell
-        # if (difference > 0.05): # Small profit available
-        #     buy = buy_price + 0.02
-        #     sell = sell_price - 0.02
-        #     return buy, sell
-    return 0, 0
-    # if (ticker_symbol == 'CROW'): # -0.03/share to trade (need a bigger difference to take advantage)
-    # if (ticker_symbol == 'DOVE'): # -0.04/share to trade (need a bigger difference to take advantage)
-    
+    return policies[ticker_symbol].prices(buy_price, sell_price)
+
 
 def place_order(ticker, order_type, quantity, price, action):
     """
-    Helper function to place orders.
+    Helper function to place orders. Returns None without sending if the risk engine vetoes the order.
     """
+    check = risk.check(ticker, quantity, action)
+    if not check.quantity:
+        registry.count('orders.vetoed')
+        log.info('vetoed', ticker, action, quantity, check.reason)
+        return None
+    quantity = check.quantity
+    sent = perf_counter()
     resp = s.post(
-        'http://localhost:9999/v1/orders',
+        BASE_URL + '/orders',
         params={
             'ticker': ticker,
             'type': order_type,
             'quantity': quantity,
             'price': price,
             'action': action
-        }
+        },
+        **hints(s, REDUCE) # Only unwinds are sent from here
     )
+    registry.order_sent(sent, resp.status_code)
     if resp.status_code != 200:
-        print(f"Error placing {action} order: {resp.status_code}, {resp.text}")
+        log.error('order_error', ticker, action, quantity, resp.status_code, resp.text)
+        risk.release(ticker, quantity, action)
+    else:
+        order = resp.json()
+        risk.on_ack(ticker, quantity, action, order.get('order_id'), order.get('status'), order.get('quantity_filled', 0))
+        ledger.apply(ticker, action, order.get('vwap') or price, order.get('quantity_filled', 0), passive=False)
+    if recorder is not None:
+        order = resp.json() if resp.status_code == 200 else {}
+        record_ack(recorder, OrderIntent(ticker, order_type, quantity, price, action), order.get('order_id'),
+                   order.get('status', 'REJECTED'), order.get('quantity_filled', 0), order.get('vwap'))
     return resp
 
-owl_prices = np.zeros(600, dtype=float)
-crow_prices = np.zeros(600, dtype=float)
-dove_prices = np.zeros(600, dtype=float)
-duck_prices = np.zeros(600, dtype=float)
-    
-def main():
+# Inventory outside the band is worked down on the ticker's unwind schedule instead of fixed MARKET orders
+unwinds = UnwindEngine(place_order, tape.flows, signals)
+
+def quote_ticker(quotes, ticker_symbol, buy_price, sell_price, average):
+    """
+    Builds one ticker's desired ladder on quotes, or works its unwind program, as its policy says.
+    """
+    unwind = risk.unwind_quantity(ticker_symbol) # Exposure past 80% of the limits is worked down first
+    if unwind > 0:
+        place_order(ticker_symbol, 'MARKET', unwind, buy_price, 'BUY')
+    elif unwind < 0:
+        place_order(ticker_symbol, 'MARKET', -unwind, sell_price, 'SELL')
+    policy = policies[ticker_symbol] # One lookup per decision, so a reload never mixes two tables
+    if not policy.enabled:
+        return
+    position = indPos(ticker_symbol)
+    hedged = policy.hedged(position, signals.exposure(ticker_symbol)) # The book's risk through this ticker
+    if policy.in_band(average, buy_price, hedged):
+        adjusted_buy, adjusted_sell = policy.prices(buy_price, sell_price)
+        if adjusted_buy != 0 and adjusted_sell != 0:
+            for quantity, price, action in policy.ladder(adjusted_buy, adjusted_sell, hedged):
+                quotes.want(ticker_symbol, quantity, price, action)
+            return
+    unwinds.work(quotes, ticker_symbol, position, policy)
+
+
+
+def main(record=None, metrics_port=None, metrics_dump=None, log_path=None, log_level=None, log_sample=None,
+         checkpoint_path=None):
+    global recorder
+    log.open(log_path, log_level, log_sample) # Events go to stdout as JSON lines unless a file is given
+    if record:
+        recorder = Recorder(record, TICKERS) # Books, orders and fills are written off the hot path
+    if metrics_port is not None or metrics_dump:
+        registry.enabled = True # Can be switched off and on again at runtime through the metrics endpoint
+        if metrics_port is not None:
+            registry.serve(metrics_port)
+        if metrics_dump:
+            registry.dump_every(metrics_dump)
     tick, status = get_tick()
-    ticker_list = ['OWL','CROW','DOVE','DUCK']
-
-    while status == 'ACTIVE':        
-
-        for i in range(4):
-            buy_price_owl, sell_price_owl, trendOwl = get_bid_ask('OWL')
-            buy_price_crow, sell_price_crow, trendCrow = get_bid_ask('CROW')
-            buy_price_dove, sell_price_dove, trendDove = get_bid_ask('DOVE')
-            buy_price_duck, sell_price_duck, trendDuck = get_bid_ask('DUCK')
-            
-            # current_ave_owl = get_moving_average(buy_price_owl, past_price_owl)
-            # current_ave_crow = get_moving_average(buy_price_crow, past_price_crow)
-            # current_ave_dove = get_moving_average(buy_price_dove, past_price_dove)
-            # current_ave_duck = get_moving_average(buy_price_duck, past_price_duck)      
-            
-            tick1, status1 = get_tick()           
-            print("%d %d \n", tick1, status1)
-
-            crowAve = get_moving_average('CROW', tick)
-            owlAve = get_moving_average('OWL', tick)
-            doveAve = get_moving_average('DOVE', tick)
-            duckAve = get_moving_average('DUCK', tick)
-            if crowAve < buy_price_crow/2 + 1:
-                crowAve=buy_price_crow
-            if owlAve < buy_price_owl/2 + 1:
-                owlAve=buy_price_owl
-            if doveAve < buy_price_dove/2 + 1:
-                doveAve=buy_price_dove
-            if duckAve < buy_price_duck/2 + 1:
-                duckAve=buy_price_duck
-
-            print(crowAve)
-            print(buy_price_crow)
-            print(owlAve)
-            print(buy_price_owl)
-            print(duckAve)
-            print(buy_price_duck)
-            print(doveAve)
-            print(buy_price_dove)
-            
-            # past_price_owl = buy_price_owl
-            # past_price_crow = buy_price_crow
-            # past_price_dove = buy_price_dove
-            # past_price_duck = buy_price_duck
-
-            ticker_symbol = ticker_list[i]
-            long_position = get_long_position()
-            short_position = get_short_position()
-            best_bid_price, best_ask_price, hi= get_bid_ask('OWL')
-
-            grossPos = long_position+abs(short_position)
-
-            crow_prices[tick1] = buy_price_crow
-            owl_prices[tick1] = buy_price_owl
-            dove_prices[tick1] = buy_price_dove
-            duck_prices[tick1] = buy_price_duck
-
-            adjusted_buy_duck, adjusted_sell_duck = market_making('DUCK', buy_price_duck, sell_price_duck)
-            adjusted_buy_dove, adjusted_sell_dove = market_making('DOVE', buy_price_dove, sell_price_dove)
-            adjusted_buy_owl, adjusted_sell_owl = market_making('OWL', buy_price_owl, sell_price_owl)
-            adjusted_buy_crow, adjusted_sell_crow = market_making('CROW', buy_price_crow, sell_price_crow)
-
-            if abs(duckAve - buy_price_duck) < 1 and abs(indPos('DUCK'))<20000:
-                if adjusted_buy_duck != 0 and adjusted_sell_duck != 0:
-                    # if (indPos('DUCK') > 5000):
-                    #     place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck-0.10, 'SELL')
-                    #     place_order('DUCK', 'LIMIT', 500, adjusted_buy_duck, 'BUY')
-                    #     print("bought for more")
-                    #     # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_sell_owl-0.15, 'action': 'SELL'})
-                    #     # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_buy_owl, 'action': 'BUY'})
-                    # elif (indPos('DUCK') < -5000):
-                    #     place_order('DUCK', 'LIMIT', 500, adjusted_sell_duck, 'SELL')
-                    #     place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck+0.10, 'BUY')
-                    #     print("sold for less")
-                    #     # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_buy_owl+0.15, 'action': 'BUY'})
-                    #     # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_sell_owl, 'action': 'SELL'})
-                    # else:
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck, 'SELL')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck, 'BUY')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck, 'SELL')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck, 'BUY')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck, 'SELL')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck, 'BUY')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck, 'SELL')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck, 'BUY')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_sell_duck, 'SELL')
-                        place_order('DUCK', 'LIMIT', 2000, adjusted_buy_duck, 'BUY')
-                    # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 2000, 'price': adjusted_buy_owl, 'action': 'BUY'})
-                    # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 2000, 'price': adjusted_sell_owl, 'action': 'SELL'})
-                elif (abs(indPos('DUCK'))>1000):
-                    if indPos('DUCK') < 0:
-                        place_order('DUCK', 'MARKET', 1000, buy_price_duck, 'BUY')
-                    if indPos('DUCK') > 0:
-                        place_order('DUCK', 'MARKET', 1000, sell_price_duck, 'SELL')
-            elif (abs(indPos('DUCK'))>1000):
-                if indPos('DUCK') < 0:
-                    place_order('DUCK', 'MARKET', 1000, buy_price_duck, 'BUY')
-                if indPos('DUCK') > 0:
-                    place_order('DUCK', 'MARKET', 1000, sell_price_duck, 'SELL')
-            if abs(doveAve - buy_price_dove) < 0.75:
-                if adjusted_buy_dove != 0 and adjusted_sell_dove != 0:
-                    if (indPos('DOVE') > 5000):
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove-0.10, 'SELL')
-                        place_order('DOVE', 'LIMIT', 500, adjusted_buy_dove, 'BUY')
-                        print("bought for more")
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_sell_owl-0.15, 'action': 'SELL'})
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_buy_owl, 'action': 'BUY'})
-                    elif (indPos('DOVE') < -5000):
-                        place_order('DOVE', 'LIMIT', 500, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove+0.10, 'BUY')
-                        print("sold for less")
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_buy_owl+0.15, 'action': 'BUY'})
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_sell_owl, 'action': 'SELL'})
-                    else:
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_sell_dove, 'SELL')
-                        place_order('DOVE', 'LIMIT', 2000, adjusted_buy_dove, 'BUY')
-                elif (abs(indPos('DOVE'))>1000):
-                    if indPos('DOVE') < 0:
-                        place_order('DOVE', 'MARKET', 1000, buy_price_dove, 'BUY')
-                    if indPos('DOVE') > 0:
-                        place_order('DOVE', 'MARKET', 1000, sell_price_dove, 'SELL')
-                    
-            elif (abs(indPos('DOVE'))>1000):
-                if indPos('DOVE') < 0:
-                    place_order('DOVE', 'MARKET', 1000, buy_price_dove, 'BUY')
-                if indPos('DOVE') > 0:
-                    place_order('DOVE', 'MARKET', 1000, sell_price_dove, 'SELL')
-            
-            # if abs(owlAve - buy_price_owl) < 2.5:
-            #     if adjusted_buy_owl != 0 and adjusted_sell_owl != 0:
-            #         if (indPos('OWL') > 5000):
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_sell_owl-0.10, 'SELL')
-            #             place_order('OWL', 'LIMIT', 500, adjusted_buy_owl, 'BUY')
-            #             print("bought for more owl")
-            #             # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_sell_owl-0.15, 'action': 'SELL'})
-            #             # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_buy_owl, 'action': 'BUY'})
-            #         elif (indPos('OWL') < -5000):
-            #             place_order('OWL', 'LIMIT', 500, adjusted_sell_owl, 'SELL')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_buy_owl+0.10, 'BUY')
-            #             print("sold for less owl")
-            #             # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_buy_owl+0.15, 'action': 'BUY'})
-            #             # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_sell_owl, 'action': 'SELL'})
-            #         else:
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_sell_owl, 'SELL')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_buy_owl, 'BUY')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_sell_owl, 'SELL')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_buy_owl, 'BUY')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_sell_owl, 'SELL')
-            #             place_order('OWL', 'LIMIT', 2000, adjusted_buy_owl, 'BUY')
-            #     elif (abs(indPos('OWL'))>=1000):
-            #         if indPos('OWL') < 0:
-            #             place_order('OWL', 'MARKET', 1000, buy_price_owl, 'BUY')
-            #         elif indPos('OWL') > 0:
-            #             place_order('OWL', 'MARKET', 1000, sell_price_owl, 'SELL')
-            # elif (abs(indPos('OWL'))>=1000):
-            #         if indPos('OWL') < 0:
-            #             place_order('OWL', 'MARKET', 1000, buy_price_owl, 'BUY')
-            #         elif indPos('OWL') > 0:
-            #             place_order('OWL', 'MARKET', 1000, sell_price_owl, 'SELL')
-
-            if abs(crowAve - buy_price_crow) < 2.5:
-                if adjusted_buy_crow != 0 and adjusted_sell_crow != 0:
-                    if (indPos('CROW') > 5000):
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow-0.10, 'SELL')
-                        place_order('CROW', 'LIMIT', 500, adjusted_buy_crow, 'BUY')
-                        print("bought for more CROW")
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_sell_owl-0.15, 'action': 'SELL'})
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_buy_owl, 'action': 'BUY'})
-                    elif (indPos('CROW') < -5000):
-                        place_order('CROW', 'LIMIT', 500, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow+0.10, 'BUY')
-                        print("sold for less crow")
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 3000, 'price': adjusted_buy_owl+0.15, 'action': 'BUY'})
-                        # resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': 500, 'price': adjusted_sell_owl, 'action': 'SELL'})
-                    else:
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_sell_crow, 'SELL')
-                        place_order('CROW', 'LIMIT', 2000, adjusted_buy_crow, 'BUY')
-                elif (abs(indPos('CROW'))>=1000):
-                    if indPos('CROW') < 0:
-                        place_order('CROW', 'MARKET', 1000, buy_price_crow, 'BUY')
-                    elif indPos('CROW') > 0:
-                        place_order('CROW', 'MARKET', 1000, sell_price_crow, 'SELL')
-                elif (abs(indPos('CROW'))>=1000):
-                        if indPos('CROW') < 0:
-                            place_order('CROW', 'MARKET', 1000, buy_price_crow, 'BUY')
-                        elif indPos('CROW') > 0:
-                            place_order('CROW', 'MARKET', 1000, sell_price_crow, 'SELL')
-            # if (tick<40):
-            #     if trendOwl > -50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl, 'action': 'BUY'})
-                    
-            #     if trendCrow > -50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow, 'action': 'BUY'})
-
-            #     if trendDove > -50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove, 'action': 'BUY'})
-
-            #     if trendDuck > -50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck, 'action': 'BUY'})
-
-            #     if trendOwl < 50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl, 'action': 'SELL'})
-                    
-            #     if trendCrow < 50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow, 'action': 'SELL'})
-
-            #     if trendDove < 50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove, 'action': 'SELL'})
-
-            #     if trendDuck < 50000:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck, 'action': 'SELL'})
-
-            # if (tick>40) and grossPos < 250000:
-            #     if trendOwl > -50000 and buy_price_owl < owlAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl-0.01, 'action': 'BUY'})
-                    
-            #     if trendCrow > -50000 and buy_price_crow < crowAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow-0.01, 'action': 'BUY'})
-
-            #     if trendDove > -50000 and buy_price_dove < doveAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove-0.01, 'action': 'BUY'})
-
-            #     if trendDuck > -50000 and buy_price_duck < duckAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck-0.01, 'action': 'BUY'})
-
-            #     if trendOwl < 50000 and buy_price_owl > owlAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl+0.01, 'action': 'SELL'})
-                    
-            #     if trendCrow < 50000 and buy_price_crow > crowAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow+0.01, 'action': 'SELL'})
-
-            #     if trendDove < 50000 and buy_price_dove > doveAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove+0.01, 'action': 'SELL'})
-
-            #     if trendDuck < 50000 and buy_price_duck > duckAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck+0.01, 'action': 'SELL'})
-
-            # else: 
-            #     if trendOwl > -50000 and indPos('OWL') < 0 and buy_price_owl < owlAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl, 'action': 'BUY'})
-                    
-            #     if trendCrow > -50000 and indPos('CROW') < 0 and buy_price_crow < crowAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow, 'action': 'BUY'})
-
-            #     if trendDove > -50000 and indPos('DOVE') < 0 and buy_price_dove < doveAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove, 'action': 'BUY'})
-
-            #     if trendDuck > -50000 and indPos('DUCK') < 0 and buy_price_duck < duckAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck, 'action': 'BUY'})
-            
-            #     if trendOwl < 50000 and indPos('OWL') > 0 and buy_price_owl > owlAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl, 'action': 'SELL'})
-                    
-            #     if trendCrow < 50000 and indPos('CROW') > 0 and buy_price_crow > crowAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow, 'action': 'SELL'})
-
-            #     if trendDove < 50000 and indPos('DOVE') > 0 and buy_price_dove > doveAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove, 'action': 'SELL'})
-
-            #     if trendDuck < 50000 and indPos('DUCK') > 0 and buy_price_duck > duckAve:
-            #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck, 'action': 'SELL'})
-
-            # if position > MAX_SHORT_EXPOSURE:
-            #     resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': ticker_symbol, 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': best_ask_price, 'action': 'SELL'})
-
-            #took out sleep here
-
-            s.post('http://localhost:9999/v1/commands/cancel', params = {'ticker': ticker_symbol})
-
-        tick, status = get_tick()
+    market_data = MarketData(s, TICKERS, BASE_URL)
+    gateway = OrderGateway(s, BASE_URL, ORDER_LIMIT, recorder=recorder, risk=risk,
+                            ledger=ledger, max_age=QUOTE_MAX_AGE) # Sends order batches concurrently, merged under ORDER_LIMIT
+    quotes = QuoteManager(s, BASE_URL, TICKERS, gateway, recorder=recorder, ledger=ledger) # Only the difference between wanted and live ladders is sent
+    scheduler = QuotingScheduler(TICKERS, TICKER_BUDGETS) # Requotes a ticker only when its book, position or the tick moved
+    tape.recorder = recorder
+    tape_tick = None
+    policies.watch()
+    checkpoints = None
+    warm_state = None
+    if checkpoint_path:
+        checkpoints = checkpoint.Checkpointer(checkpoint_path) # State is saved once per tick off the loop
+        warm_state = checkpoints.load()
+
+    while status == 'ACTIVE':
+        # Every decision in this pass reads from the same snapshot
+        mark = registry.now()
+        snapshot = market_data.snapshot()
+        if snapshot.tick is None:
+            continue # /case failed, poll again
+        registry.loop(snapshot.tick)
+        registry.decision(snapshot.received)
+        mark = registry.lap('snapshot', mark)
+        tick, status = snapshot.tick, snapshot.status
+        ledger.mark_all(snapshot) # Unrealized PnL and the drawdown follow the book
+        unwinds.observe(snapshot)
+        if status != 'ACTIVE':
+            break
+        if None in snapshot.quotes.values():
+            continue # A book request failed; decide on the next complete snapshot instead of crashing on it
+        if warm_state is not None: # Resume from the last checkpoint instead of a cold ramp-up
+            if checkpoint.restore(warm_state, snapshot.tick, snapshot.ticks_per_period, prices, ledger, quotes, tape,
+                                  signals):
+                positions.refresh() # Positions come from the server, and the order listing settles fills since
+                quotes.live_orders()
+                log.info('warm_start', snapshot.tick, warm_state['tick'], len(quotes.tracked))
+                for ticker in TICKERS:
+                    if ledger[ticker].position != risk.position[ticker]:
+                        log.warning('checkpoint_drift', ticker, ledger[ticker].position, risk.position[ticker])
+            warm_state = None
+        if recorder is not None:
+            recorder.tick = snapshot.tick
+            for ticker, book in snapshot.books.items():
+                if book is not None:
+                    recorder.book(ticker, book)
+        buy_price_owl, sell_price_owl, trendOwl = snapshot['OWL']
+        buy_price_crow, sell_price_crow, trendCrow = snapshot['CROW']
+        buy_price_dove, sell_price_dove, trendDove = snapshot['DOVE']
+        buy_price_duck, sell_price_duck, trendDuck = snapshot['DUCK']
+
+        # current_ave_owl = get_moving_average(buy_price_owl, past_price_owl)
+        # current_ave_crow = get_moving_average(buy_price_crow, past_price_crow)
+        # current_ave_dove = get_moving_average(buy_price_dove, past_price_dove)
+        # current_ave_duck = get_moving_average(buy_price_duck, past_price_duck)      
+
+        tick1, status1 = snapshot.tick, snapshot.status
+        if tick1 != tape_tick: # New prints are absorbed once per tick into the per-ticker trade flow
+            if tape_tick is not None:
+                log.info('quotes', tape_tick, quotes.calls.get(tape_tick, 0), quotes.saved.get(tape_tick, 0))
+                log.info('signals', tape_tick, signals.risk, signals.exposures.round().tolist())
+            tape.poll_all(snapshot, market_data.executor)
+            tape_tick = tick1
+            if checkpoints is not None:
+                checkpoints.submit(checkpoint.capture(tick1, snapshot.ticks_per_period, prices, ledger, quotes, risk,
+                                                      tape, signals))
+            mark = registry.lap('tape', mark)
+
+        crowAve = get_moving_average('CROW', tick)
+        owlAve = get_moving_average('OWL', tick)
+        doveAve = get_moving_average('DOVE', tick)
+        duckAve = get_moving_average('DUCK', tick)
+        if crowAve < buy_price_crow/2 + 1:
+            crowAve=buy_price_crow
+        if owlAve < buy_price_owl/2 + 1:
+            owlAve=buy_price_owl
+        if doveAve < buy_price_dove/2 + 1:
+            doveAve=buy_price_dove
+        if duckAve < buy_price_duck/2 + 1:
+            duckAve=buy_price_duck
+
+        prices.update('CROW', tick1, buy_price_crow)
+        prices.update('OWL', tick1, buy_price_owl)
+        prices.update('DOVE', tick1, buy_price_dove)
+        prices.update('DUCK', tick1, buy_price_duck)
+        signals.observe(snapshot) # One return row and outer-product update per tick for all four tickers
+
+        due = scheduler.due(snapshot, indPos) # Changes since a ticker last ran are coalesced into one run
+        mark = registry.lap('positions', mark)
+        if not due:
+            scheduler.idle()
+            continue
+
+        # One queued record instead of nine synchronous prints; formatted and written off the loop
+        log.debug('averages', tick1, status1, owlAve, buy_price_owl, crowAve, buy_price_crow, doveAve, buy_price_dove,
+                  duckAve, buy_price_duck)
+
+        # past_price_owl = buy_price_owl
+        # past_price_crow = buy_price_crow
+        # past_price_dove = buy_price_dove
+        # past_price_duck = buy_price_duck
+
+        long_position = get_long_position()
+        short_position = get_short_position()
+
+        grossPos = long_position+abs(short_position)
+        signals.revalue(indPos) # Book risk, exposures and contributions once for every ticker this pass
+
+        averages = {'OWL': owlAve, 'CROW': crowAve, 'DOVE': doveAve, 'DUCK': duckAve}
+        for ticker in due:
+            bid, ask, _ = snapshot[ticker]
+            quote_ticker(quotes, ticker, bid, ask, averages[ticker])
+
+        # if (tick<40):
+        #     if trendOwl > -50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl, 'action': 'BUY'})
+
+        #     if trendCrow > -50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow, 'action': 'BUY'})
+
+        #     if trendDove > -50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove, 'action': 'BUY'})
+
+        #     if trendDuck > -50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck, 'action': 'BUY'})
+
+        #     if trendOwl < 50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl, 'action': 'SELL'})
+
+        #     if trendCrow < 50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow, 'action': 'SELL'})
+
+        #     if trendDove < 50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove, 'action': 'SELL'})
+
+        #     if trendDuck < 50000:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck, 'action': 'SELL'})
+
+        # if (tick>40) and grossPos < 250000:
+        #     if trendOwl > -50000 and buy_price_owl < owlAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl-0.01, 'action': 'BUY'})
+
+        #     if trendCrow > -50000 and buy_price_crow < crowAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow-0.01, 'action': 'BUY'})
+
+        #     if trendDove > -50000 and buy_price_dove < doveAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove-0.01, 'action': 'BUY'})
+
+        #     if trendDuck > -50000 and buy_price_duck < duckAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck-0.01, 'action': 'BUY'})
+
+        #     if trendOwl < 50000 and buy_price_owl > owlAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl+0.01, 'action': 'SELL'})
+
+        #     if trendCrow < 50000 and buy_price_crow > crowAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow+0.01, 'action': 'SELL'})
+
+        #     if trendDove < 50000 and buy_price_dove > doveAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove+0.01, 'action': 'SELL'})
+
+        #     if trendDuck < 50000 and buy_price_duck > duckAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck+0.01, 'action': 'SELL'})
+
+        # else: 
+        #     if trendOwl > -50000 and indPos('OWL') < 0 and buy_price_owl < owlAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_owl, 'action': 'BUY'})
+
+        #     if trendCrow > -50000 and indPos('CROW') < 0 and buy_price_crow < crowAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_crow, 'action': 'BUY'})
+
+        #     if trendDove > -50000 and indPos('DOVE') < 0 and buy_price_dove < doveAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_dove, 'action': 'BUY'})
+
+        #     if trendDuck > -50000 and indPos('DUCK') < 0 and buy_price_duck < duckAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': buy_price_duck, 'action': 'BUY'})
+
+        #     if trendOwl < 50000 and indPos('OWL') > 0 and buy_price_owl > owlAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'OWL', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_owl, 'action': 'SELL'})
+
+        #     if trendCrow < 50000 and indPos('CROW') > 0 and buy_price_crow > crowAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'CROW', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_crow, 'action': 'SELL'})
+
+        #     if trendDove < 50000 and indPos('DOVE') > 0 and buy_price_dove > doveAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DOVE', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_dove, 'action': 'SELL'})
+
+        #     if trendDuck < 50000 and indPos('DUCK') > 0 and buy_price_duck > duckAve:
+        #         resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': 'DUCK', 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': sell_price_duck, 'action': 'SELL'})
+
+        # if position > MAX_SHORT_EXPOSURE:
+        #     resp = s.post('http://localhost:9999/v1/orders', params = {'ticker': ticker_symbol, 'type': 'LIMIT', 'quantity': ORDER_LIMIT, 'price': best_ask_price, 'action': 'SELL'})
+
+        mark = registry.lap('decide', mark) # Strategy logic, including any MARKET unwinds it sent
+        for ticker in scheduler.expired(snapshot, due): # Decided on a book older than the ticker's latency budget
+            quotes.discard(ticker)
+            due.remove(ticker)
+        quotes.sync(tick1, due) # Replaces cancel-all: stale levels are cancelled, missing size is added
+        scheduler.spent(quotes.ticker_calls)
+        positions.invalidate() # Orders were sent and cancelled, so the next read must refetch
+        registry.lap('sync', mark)
+
+    log.close() # Flushes the queued events before the reports
+    if tape_tick is not None:
+        print(quotes.report(tape_tick))
+    print(scheduler.report())
+    print(risk.report())
+    print(unwinds.report())
+    print(signals.report())
+    print(s.governor.report())
+    quotes.live_orders(settle=True) # Settles orders that filled, or that the case stop cancelled, after the last sync
+    print(ledger.report())
+    if checkpoints is not None:
+        if tape_tick is not None:
+            checkpoints.submit(checkpoint.capture(tape_tick, snapshot.ticks_per_period, prices, ledger, quotes, risk,
+                                                  tape, signals))
+        checkpoints.close()
+        print(checkpoints.report())
+
+    if recorder is not None:
+        recorder.close()
+    if metrics_dump:
+        registry.dump(metrics_dump)
+    if registry.enabled:
+        print(registry.to_text())
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='RIT market making algorithm')
+    parser.add_argument('--record', metavar='DIR', help='record books, orders and fills to this directory')
+    parser.add_argument('--metrics', type=int, metavar='PORT', help='enable latency metrics and serve them on this port')
+    parser.add_argument('--metrics-dump', metavar='FILE', help='enable latency metrics and write them to this JSON file every few seconds')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='save strategy state to this file every tick and resume from it on restart')
+    parser.add_argument('--log', metavar='FILE', help='write JSON-lines events to this file instead of stdout')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--log-sample', action='append', default=[], metavar='EVENT=N',
+                        help='keep one in N of an event, e.g. averages=10 (repeatable)')
+    args = parser.parse_args()
+    sample = dict(item.split('=', 1) for item in args.log_sample)
+    main(record=args.record, metrics_port=args.metrics, metrics_dump=args.metrics_dump, log_path=args.log,
+         log_level=args.log_level, log_sample=sample, checkpoint_path=args.checkpoint)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized backtest engine for the market_making parameters.
+
+Replays recorded books and tape (see recorder.py) for one ticker and
+evaluates a whole grid of strategy parameters at once: every combination is
+one lane of a NumPy vector, so a tick costs a handful of array operations no
+matter how many combinations are being tested. Chunks of the grid are spread
+over a process pool, and every worker memory-maps the same recordings.
+
+    python backtest.py --simulate 20 --ticks 600 cases/
+    python backtest.py cases/* --ticker DUCK --out duck.csv
+
+Fill model: quotes are set from the book at the end of tick t and rest
+through tick t+1. A print on our side of the mid fills us if it traded
+through our price, or at our price once the size displayed ahead of us at
+that price has traded.
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import recorder
+from simulator import SECURITIES, Simulator
+
+# Parameter grid; defaults bracket the hand-tuned values in policy.json
+DEFAULT_GRID = {
+    'wide_spread': [0.30, 0.40, 0.50],  # Spread above which the wide offset is used
+    'wide_offset': [0.05, 0.08, 0.10, 0.19],
+    'narrow_spread': [0.15, 0.20, 0.25],  # Spread above which the narrow offset is used
+    'narrow_offset': [0.03, 0.05],
+    'band': [0.5, 0.75, 1.0, 2.5],  # Quote only while |moving average - bid| is below this
+    'size': [6000, 12000],  # Total ladder size per side
+    'cap': [5000, 20000],  # Stop quoting at this absolute inventory
+    'skew': [5000, 1000000],  # Inventory beyond which the unwinding side is leaned on (1e6 disables)
+    'unwind_trigger': [1000],  # Unwind once out of band and above this inventory (modelled as MARKET at the touch)
+    'unwind_size': [1000],
+}
+MA_LAG = 10  # get_moving_average averages the bid now and ten ticks back
+
+
+def expand_grid(grid):
+    """
+    Returns {name: 1-D array} with one entry per combination of the grid.
+    """
+    names = list(grid)
+    combos = np.array(list(itertools.product(*(grid[name] for name in names))), dtype=float)
+    return {name: combos[:, i] for i, name in enumerate(names)}
+
+
+def load_market(root, ticker):
+    """
+    Reduces one recording to per-tick arrays for a ticker: last book of each
+    tick and that tick's prints padded to a common width.
+    """
+    tickers, tables = recorder.load(root)
+    index = tickers.index(ticker)
+    books = tables['books']
+    rows = np.flatnonzero(books['ticker'] == index)
+    ticks = books['tick'][rows]
+    last = rows[np.r_[ticks[1:] != ticks[:-1], True]]  # Last snapshot of each tick
+    market = {'tick': books['tick'][last]}
+    for column in ('bid_px', 'bid_qty', 'ask_px', 'ask_qty'):
+        market[column] = np.asarray(books[column][last])
+
+    tas = tables['tas']
+    mask = tas['ticker'] == index
+    print_ticks = tas['tick'][mask]
+    prices = tas['price'][mask]
+    quantities = tas['quantity'][mask]
+    if len(print_ticks) == 0:
+        raise ValueError('%s has no tape for %s; record with the tape follower or use --simulate' % (root, ticker))
+    position = np.searchsorted(market['tick'], print_ticks)
+    valid = (position < len(market['tick'])) & (market['tick'][np.minimum(position, len(market['tick']) - 1)] == print_ticks)
+    position, prices, quantities = position[valid], prices[valid], quantities[valid]
+    counts = np.bincount(position, minlength=len(market['tick']))
+    width = max(1, counts.max())
+    order = np.argsort(position, kind='stable')
+    slot = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    market['print_px'] = np.full((len(market['tick']), width), np.nan)
+    market['print_qty'] = np.zeros((len(market['tick']), width))
+    market['print_px'][position[order], slot] = prices[order]
+    market['print_qty'][position[order], slot] = quantities[order]
+    return market
+
+
+def evaluate(markets, params, fee, rebate):
+    """
+    Runs every parameter combination over every market; returns a dict of per-combination statistics.
+    """
+    count = len(next(iter(params.values())))
+    stats = {name: np.zeros(count) for name in ('pnl', 'fees', 'rebates', 'max_inventory', 'mean_inventory',
+                                                 'volume', 'fills')}
+    steps = 0
+    for market in markets:
+        inventory = np.zeros(count)
+        cash = np.zeros(count)
+        bid, ask = market['bid_px'][:, 0], market['ask_px'][:, 0]
+        for t in range(len(bid) - 1):
+            if np.isnan(bid[t]) or np.isnan(ask[t]):
+                continue
+            past = bid[t - MA_LAG] if t >= MA_LAG and not np.isnan(bid[t - MA_LAG]) else bid[t]
+            average = (bid[t] + past) / 2
+            spread = ask[t] - bid[t]
+            offset = np.where(spread > params['wide_spread'], params['wide_offset'],
+                              np.where(spread > params['narrow_spread'], params['narrow_offset'], np.nan))
+            in_band = np.abs(average - bid[t]) < params['band']
+            quoting = ~np.isnan(offset) & in_band & (np.abs(inventory) < params['cap'])
+            offset = np.nan_to_num(offset)  # Lanes that aren't quoting get zero size below
+
+            # Inventory skew: lean the unwinding side 0.10 in and shrink the other side to 500
+            long_skew = inventory > params['skew']
+            short_skew = inventory < -params['skew']
+            our_bid = np.round(bid[t] + offset + np.where(short_skew, 0.10, 0.0), 2)
+            our_ask = np.round(ask[t] - offset - np.where(long_skew, 0.10, 0.0), 2)
+            bid_size = np.where(quoting, np.where(long_skew, 500, params['size']), 0)
+            ask_size = np.where(quoting, np.where(short_skew, 500, params['size']), 0)
+
+            # Displayed size already queued at our price when we join an existing level
+            ahead_bid = (market['bid_qty'][t] * (np.abs(market['bid_px'][t] - our_bid[:, None]) < 1e-9)).sum(axis=1)
+            ahead_ask = (market['ask_qty'][t] * (np.abs(market['ask_px'][t] - our_ask[:, None]) < 1e-9)).sum(axis=1)
+
+            px = market['print_px'][t + 1]
+            qty = market['print_qty'][t + 1]
+            mid = (bid[t] + ask[t]) / 2
+            sells = np.where(px < mid, qty, 0.0)  # Prints on the bid side hit resting bids
+            buys = np.where(px >= mid, qty, 0.0)  # A print at mid counts once, on the ask side
+            through_bid = (sells * (px < our_bid[:, None] - 1e-9)).sum(axis=1)
+            at_bid = (sells * (np.abs(px - our_bid[:, None]) < 1e-9)).sum(axis=1)
+            through_ask = (buys * (px > our_ask[:, None] + 1e-9)).sum(axis=1)
+            at_ask = (buys * (np.abs(px - our_ask[:, None]) < 1e-9)).sum(axis=1)
+            bought = np.minimum(bid_size, through_bid + np.maximum(0.0, at_bid - ahead_bid))
+            sold = np.minimum(ask_size, through_ask + np.maximum(0.0, at_ask - ahead_ask))
+
+            inventory += bought - sold
+            cash += sold * our_ask - bought * our_bid
+            stats['rebates'] += (bought + sold) * rebate
+            stats['fills'] += (bought > 0).astype(float) + (sold > 0)
+
+            # Out of band with inventory: the strategy's MARKET unwind at the touch
+            unwind = ~quoting & (np.abs(inventory) > params['unwind_trigger'])
+            unwind_size = np.where(unwind, np.minimum(params['unwind_size'], np.abs(inventory)), 0.0)
+            direction = np.sign(inventory)
+            exit_bid = bid[t + 1] if not np.isnan(bid[t + 1]) else bid[t]
+            exit_ask = ask[t + 1] if not np.isnan(ask[t + 1]) else ask[t]
+            cash += unwind_size * np.where(direction > 0, exit_bid, -exit_ask)
+            inventory -= unwind_size * direction
+            stats['fees'] += unwind_size * fee
+
+            stats['volume'] += bought + sold + unwind_size
+            stats['max_inventory'] = np.maximum(stats['max_inventory'], np.abs(inventory))
+            stats['mean_inventory'] += np.abs(inventory)
+            steps += 1
+
+        valid = np.flatnonzero(~np.isnan(bid) & ~np.isnan(ask))
+        final_mid = (bid[valid[-1]] + ask[valid[-1]]) / 2
+        stats['pnl'] += cash + inventory * final_mid
+    stats['pnl'] += stats['rebates'] - stats['fees']
+    stats['mean_inventory'] /= max(steps, 1)
+    return stats
+
+
+def _evaluate_chunk(job):
+    roots, ticker, params = job
+    markets = [load_market(root, ticker) for root in roots]
+    spec = SECURITIES[ticker]
+    return evaluate(markets, params, spec['fee'], spec['rebate'])
+
+
+def run(roots, ticker, grid, workers=None, chunk=256):
+    """
+    Evaluates the full grid over the recordings on a process pool; returns a DataFrame sorted by PnL.
+    """
+    params = expand_grid(grid)
+    count = len(next(iter(params.values())))
+    jobs = [(roots, ticker, {name: values[start:start + chunk] for name, values in params.items()})
+            for start in range(0, count, chunk)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(_evaluate_chunk, jobs))
+    frame = pd.DataFrame(params)
+    for name in results[0]:
+        frame[name] = np.concatenate([result[name] for result in results])
+    return frame.sort_values('pnl', ascending=False).reset_index(drop=True)
+
+
+def simulate_recordings(root, cases, ticks, seed=0):
+    """
+    Plays `cases` simulator periods without HTTP and records their books and tape; returns the recording paths.
+    """
+    paths = []
+    for case in range(cases):
+        path = os.path.join(root, 'case%03d' % case)
+        simulator = Simulator(ticks=ticks, seed=seed + case)
+        tape_seen = {ticker: 0 for ticker in SECURITIES}
+        rec = recorder.Recorder(path, list(SECURITIES))
+        while simulator.status == 'ACTIVE':
+            simulator.step()
+            for ticker in SECURITIES:
+                rec.book(ticker, simulator.securities_book({'ticker': ticker, 'limit': rec.depth}), tick=simulator.tick)
+                tape = simulator.tape[ticker]
+                rec.tape(ticker, tape[tape_seen[ticker]:], tick=simulator.tick)
+                tape_seen[ticker] = len(tape)
+        rec.close()
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest market_making parameters over recorded cases')
+    parser.add_argument('recordings', nargs='+', help='recording directories (or the output root with --simulate)')
+    parser.add_argument('--ticker', default='DUCK', choices=list(SECURITIES))
+    parser.add_argument('--grid', help='JSON file of {parameter: [values]} overriding the default grid')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', help='write the full results table to this CSV')
+    parser.add_argument('--simulate', type=int, metavar='CASES', help='generate this many synthetic cases first')
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    roots = args.recordings
+    if args.simulate:
+        roots = simulate_recordings(roots[0], args.simulate, args.ticks, args.seed)
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+
+    results = run(roots, args.ticker, grid, workers=args.workers)
+    if args.out:
+        results.to_csv(args.out, index=False)
+    print(results.head(20).to_string())
+
+
+if __name__ == '__main__':
+    main()
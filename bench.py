@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Performance regression benchmark for the strategy loop.
+
+Each scenario runs algorithm.main() unchanged against the local simulator
+on a free port. Scenarios are seeded synthetic sessions, or a recording
+(see recorder.py) whose per-tick mids the simulator replays as its fair
+value. Every run reports:
+
+    iterations_per_second   loop passes that took a snapshot, per wall-clock second
+    calls_per_tick          REST requests the simulator served per tick, in total and per endpoint
+    decision_to_order_us    snapshot arrival to order sent, p50/p90/p99 from the metrics registry
+    retained_blocks_per_iteration
+                            net memory blocks (sys.getallocatedblocks) still held after the run, per
+                            iteration; growth here is a leak, blocks allocated and freed again do not show
+    gc_per_1k_iterations    generation-0 collections per thousand iterations, the allocation-rate proxy
+
+Each scenario runs --repeat times (3 by default) and every metric is the
+median of the runs: the loop shares the machine with the simulator, so a
+single run's wall-clock figures, and the per-tick call counts that follow
+the loop's speed, swing too much to hold a threshold.
+
+Results are compared with a stored baseline and any metric that got worse
+by more than the threshold is flagged; the exit status is 1 if one was.
+Wall-clock figures depend on the machine, so refresh the baseline with
+--update when moving to a new one.
+
+    python bench.py                                  # every scenario against bench_baseline.json
+    python bench.py --scenario calm --threshold 0.1
+    python bench.py --scenario throttled --repeat 5
+    python bench.py --recording cases/case000        # adds a 'replay' scenario
+    python bench.py --update                         # store these results as the baseline
+"""
+
+import argparse
+import gc
+import importlib
+import io
+import json
+import os
+import sys
+import threading
+from contextlib import redirect_stdout
+from time import perf_counter
+
+import numpy as np
+
+import recorder
+from metrics import registry
+from simulator import Simulator, serve
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+SCENARIOS = {
+    'calm': {'ticks': 60, 'tick_seconds': 0.1, 'seed': 1, 'volatility': 0.5},
+    'volatile': {'ticks': 60, 'tick_seconds': 0.1, 'seed': 2, 'volatility': 2.0},
+    'throttled': {'ticks': 60, 'tick_seconds': 0.1, 'seed': 3, 'order_rate': 50},
+}
+
+# Metrics where a higher value is better; every other metric is better lower
+HIGHER_IS_BETTER = ('iterations_per_second',)
+
+# Per-metric thresholds by name prefix, for the noisier figures
+THRESHOLDS = {
+    'decision_to_order_us': 0.5,
+    'retained_blocks_per_iteration': 1.0,
+}
+
+
+def recorded_paths(root):
+    """
+    Mid price per tick for each ticker of a recording, gaps carried forward.
+    """
+    tickers, tables = recorder.load(root)
+    books = tables['books']
+    ticks = np.asarray(books['tick'])
+    mids = (np.asarray(books['bid_px'])[:, 0] + np.asarray(books['ask_px'])[:, 0]) / 2
+    paths = {}
+    for index, ticker in enumerate(tickers):
+        rows = np.flatnonzero(np.asarray(books['ticker']) == index)
+        if not len(rows):
+            continue
+        path = np.full(int(ticks[rows].max()), np.nan)
+        path[ticks[rows] - 1] = mids[rows]  # Later rows of a tick overwrite earlier ones
+        valid = np.flatnonzero(~np.isnan(path))
+        if not len(valid):
+            continue
+        path[:valid[0]] = path[valid[0]]
+        filled = np.maximum.accumulate(np.where(np.isnan(path), 0, np.arange(len(path))))
+        paths[ticker] = path[filled]
+    return paths
+
+
+def load_strategy(base_url):
+    """
+    Imports algorithm afresh, so no state carries over between scenarios, and points it at `base_url`.
+    """
+    if 'algorithm' in sys.modules:
+        sys.modules['algorithm'].policies.close()
+        algorithm = importlib.reload(sys.modules['algorithm'])
+    else:
+        algorithm = importlib.import_module('algorithm')
+    algorithm.BASE_URL = base_url
+    algorithm.tape.base_url = base_url
+    algorithm.positions.base_url = base_url
+    algorithm.s.headers['X-API-key'] = 'BENCH'
+    return algorithm
+
+
+def run_scenario(ticks, tick_seconds, seed, volatility=1.0, order_rate=0, paths=None):
+    """
+    Runs one case against a fresh simulator; returns the scenario's metrics.
+    """
+    simulator = Simulator(ticks=ticks, seed=seed, volatility=volatility, order_rate=order_rate, paths=paths)
+    server = serve(simulator, port=0)
+    try:
+        algorithm = load_strategy('http://%s:%d/v1' % server.server_address[:2])
+        registry.reset()
+        registry.enabled = True
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        collections = gc.get_stats()[0]['collections']
+        threading.Thread(target=simulator.run_clock, args=(tick_seconds,), name='bench-clock', daemon=True).start()
+        start = perf_counter()
+        with redirect_stdout(io.StringIO()):
+            algorithm.main(log_path=os.devnull)
+        elapsed = perf_counter() - start
+        blocks = sys.getallocatedblocks() - blocks
+        collections = gc.get_stats()[0]['collections'] - collections
+        algorithm.policies.close()
+    finally:
+        registry.enabled = False
+        server.shutdown()
+        server.server_close()
+
+    data = registry.to_dict()
+    iterations = max(data['stages'].get('snapshot', {}).get('count', 0), 1)
+    latency = data['decision_to_order']
+    requests = dict(simulator.requests)
+    return {
+        'iterations_per_second': iterations / elapsed,
+        'calls_per_tick': sum(requests.values()) / ticks,
+        'calls_per_tick_by_endpoint': {name: count / ticks for name, count in sorted(requests.items())},
+        'decision_to_order_us': {'p50': latency['p50'], 'p90': latency['p90'], 'p99': latency['p99']},
+        'retained_blocks_per_iteration': blocks / iterations,
+        'gc_per_1k_iterations': collections * 1000 / iterations,
+    }
+
+
+def median(results):
+    """
+    Per-metric median of several run_scenario() results; a metric missing from a run, such as an endpoint it never
+    called, counts as 0.
+    """
+    names = list(dict.fromkeys(name for result in results for name in result))
+    merged = {}
+    for name in names:
+        values = [result.get(name) for result in results]
+        if any(isinstance(value, dict) for value in values):
+            merged[name] = median([value or {} for value in values])
+        else:
+            merged[name] = float(np.median([value or 0 for value in values]))
+    return merged
+
+
+def flatten(result, prefix=''):
+    flat = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + '.'))
+        else:
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns (rows, regressed): a row per metric present in both, as
+    (scenario, metric, baseline, current, relative change, flag).
+    """
+    rows = []
+    regressed = False
+    for scenario, result in results.items():
+        before = flatten(baseline.get(scenario, {}))
+        for metric, value in flatten(result).items():
+            old = before.get(metric)
+            if old is None or old == 0:
+                continue
+            change = (value - old) / abs(old)
+            worse = change if not metric.startswith(HIGHER_IS_BETTER) else -change
+            limit = next((limit for prefix, limit in THRESHOLDS.items() if metric.startswith(prefix)), threshold)
+            flag = worse > limit
+            regressed |= flag
+            rows.append((scenario, metric, old, value, change, flag))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the strategy loop against the local simulator')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS) + ['replay'],
+                        help='scenario to run (repeatable; default all)')
+    parser.add_argument('--recording', help='recording directory to replay as the "replay" scenario')
+    parser.add_argument('--ticks', type=int, help='override every scenario\'s ticks')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario; metrics are their medians')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative change that counts as a regression')
+    parser.add_argument('--update', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--out', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    scenarios = {name: dict(params) for name, params in SCENARIOS.items()}
+    if args.recording:
+        paths = recorded_paths(args.recording)
+        scenarios['replay'] = {'ticks': max(len(path) for path in paths.values()), 'tick_seconds': 0.1, 'seed': 0,
+                               'paths': paths}
+    names = args.scenario or list(scenarios)
+    results = {}
+    for name in names:
+        params = scenarios[name]
+        if args.ticks:
+            params['ticks'] = args.ticks
+        results[name] = median([run_scenario(**params) for _ in range(max(args.repeat, 1))])
+        result = results[name]
+        print('%-10s %8.1f it/s %7.1f calls/tick  decision->order p50 %7.0fus p99 %7.0fus  %6.2f retained blocks/it' % (
+            name, result['iterations_per_second'], result['calls_per_tick'], result['decision_to_order_us']['p50'],
+            result['decision_to_order_us']['p99'], result['retained_blocks_per_iteration']))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Baseline written to %s' % args.baseline)
+        return
+    if not os.path.exists(args.baseline):
+        print('No baseline at %s; run with --update to create one' % args.baseline)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressed = compare(results, baseline, args.threshold)
+    print('%-10s %-50s %12s %12s %8s' % ('scenario', 'metric', 'baseline', 'current', 'change'))
+    for scenario, metric, old, value, change, flag in rows:
+        print('%-10s %-50s %12.2f %12.2f %+7.0f%%%s' % (scenario, metric, old, value, change * 100,
+                                                          '  REGRESSION' if flag else ''))
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Crash-safe strategy checkpoints.
+
+Once per tick the loop captures a small dict of strategy state: the
+committed price history, the cross-asset return matrix, positions, the
+tracked order map, fill ledger totals and the tape cursor. A background thread pickles the dict into a
+memory-mapped file, so the loop only pays for the copy.
+
+The file holds a header and two slots. Every write goes to the slot not
+holding the newest checkpoint, in this order: payload, then length and
+CRC-32, then the sequence number. A process killed mid-write leaves that
+slot with a CRC that does not match, and loading falls back to the other
+one. Each slot has room for `slot_size` bytes of payload; a checkpoint
+that does not fit is skipped and counted.
+
+On a warm start the newest valid checkpoint is restored only if it comes
+from the same case: the same period length, and a tick not ahead of the
+server's. After that the usual /orders and /securities reads reconcile it
+with what happened while the process was down.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+MAGIC = b'RITCKPT1'
+HEADER = struct.Struct('<8sQ')  # magic, slot size
+SLOT = struct.Struct('<QQI')  # sequence, payload length, CRC-32 of the payload
+
+
+class CheckpointFile:
+    """
+    Two-slot checkpoint file mapped into memory.
+    """
+
+    def __init__(self, path, slot_size=1 << 20):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size
+        if exists:
+            with open(path, 'rb') as f:
+                magic, stored = HEADER.unpack(f.read(HEADER.size))
+            if magic == MAGIC:
+                slot_size = stored
+            else:
+                exists = False  # Not ours, or torn before the header landed; start over
+        self.slot_size = slot_size
+        self.size = HEADER.size + 2 * (SLOT.size + slot_size)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if os.path.getsize(path) < self.size:
+            self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        if not exists:
+            self.map[:HEADER.size] = HEADER.pack(MAGIC, slot_size)
+            self.map.flush()
+        self.seq = max((seq for seq, _ in self._valid()), default=0)
+
+    def _offset(self, slot):
+        return HEADER.size + slot * (SLOT.size + self.slot_size)
+
+    def _valid(self):
+        for slot in (0, 1):
+            offset = self._offset(slot)
+            seq, length, crc = SLOT.unpack_from(self.map, offset)
+            if not seq or length > self.slot_size:
+                continue
+            payload = self.map[offset + SLOT.size:offset + SLOT.size + length]
+            if zlib.crc32(payload) == crc:
+                yield seq, payload
+
+    def load(self):
+        """
+        Returns the newest intact checkpoint, or None.
+        """
+        newest = max(self._valid(), default=None, key=lambda item: item[0])
+        if newest is None:
+            return None
+        try:
+            return pickle.loads(newest[1])
+        except Exception:
+            return None
+
+    def write(self, state):
+        """
+        Writes `state` over the older slot; returns False if it does not fit.
+        """
+        payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size:
+            return False
+        seq = self.seq + 1
+        offset = self._offset(seq % 2)
+        self.map[offset:offset + 8] = b'\0' * 8  # Invalidate first, so a torn write never looks newest
+        start = offset + SLOT.size
+        self.map[start:start + len(payload)] = payload
+        self.map[offset:offset + SLOT.size] = SLOT.pack(0, len(payload), zlib.crc32(payload))
+        self.map[offset:offset + 8] = struct.pack('<Q', seq)
+        self.map.flush()
+        self.seq = seq
+        return True
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Checkpointer:
+    """
+    Writes the latest submitted state on a daemon thread.
+
+    submit() never blocks: when the writer is still busy with the previous
+    checkpoint, a newer submission replaces the waiting one.
+    """
+
+    def __init__(self, path, slot_size=1 << 20):
+        self.file = CheckpointFile(path, slot_size)
+        self.pending = None
+        self.ready = threading.Condition()
+        self.stop = False
+        self.written = 0
+        self.skipped = 0  # Too large for a slot
+        self.replaced = 0  # Superseded before the writer got to them
+        self.thread = threading.Thread(target=self._run, name='checkpoint', daemon=True)
+        self.thread.start()
+
+    def load(self):
+        return self.file.load()
+
+    def submit(self, state):
+        with self.ready:
+            if self.pending is not None:
+                self.replaced += 1
+            self.pending = state
+            self.ready.notify()
+
+    def _run(self):
+        while True:
+            with self.ready:
+                while self.pending is None and not self.stop:
+                    self.ready.wait()
+                if self.pending is None:
+                    return
+                state, self.pending = self.pending, None
+            if self.file.write(state):
+                self.written += 1
+            else:
+                self.skipped += 1
+
+    def close(self):
+        """
+        Writes any waiting checkpoint and releases the file.
+        """
+        with self.ready:
+            self.stop = True
+            self.ready.notify()
+        self.thread.join(timeout=5.0)
+        self.file.close()
+
+    def report(self):
+        return 'checkpoints %d written (seq %d), %d replaced, %d too large' % (
+            self.written, self.file.seq, self.replaced, self.skipped)
+
+
+def capture(tick, ticks_per_period, prices, ledger, quotes, risk, tape, signals=None):
+    """
+    Copies the strategy state worth keeping across a restart; cheap enough to run once per tick.
+    """
+    state = {
+        'tick': tick,
+        'ticks_per_period': ticks_per_period,
+        'prices': prices.export(),
+        'positions': dict(risk.position),
+        'orders': quotes.export(),
+        'ledger': ledger.export(),
+        'tape': dict(tape.last_id),
+    }
+    if signals is not None:
+        state['signals'] = signals.export()
+    return state
+
+
+def restore(state, tick, ticks_per_period, prices, ledger, quotes, tape, signals=None):
+    """
+    Loads a captured state into fresh strategy objects; returns False if it belongs to another case.
+
+    Positions are not restored: the caller refreshes them from /securities,
+    and the first /orders listing settles the restored orders.
+    """
+    if state is None or state['ticks_per_period'] != ticks_per_period or state['tick'] > tick:
+        return False
+    prices.restore(state['prices'])
+    ledger.restore(state['ledger'])
+    quotes.restore(state['orders'])
+    for ticker, last_id in state['tape'].items():
+        if ticker in tape.last_id:
+            tape.last_id[ticker] = last_id
+    if signals is not None and 'signals' in state:
+        signals.restore(state['signals'])
+    return True
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous structured event log.
+
+The hot path only builds a small tuple and stores it in a preallocated ring;
+a daemon thread formats the records as JSON lines and writes them out. An
+event is a name plus positional fields, and EVENTS names the fields so each
+output line is a self-describing JSON object:
+
+    log.info('vetoed', 'CROW', 'BUY', 2000, 'gross')
+    {"t": 1727185000.123, "level": "INFO", "event": "vetoed", "ticker": "CROW", "action": "BUY", ...}
+
+Producers take a slot from a shared counter (one C call, atomic under the
+GIL) and store (seq, time, level, event, fields) in it without a lock. Each
+record carries its sequence number, so the writer can tell a slot that has
+not been filled yet from one that was lapped. A slot not filled yet is read
+on the next pass. A lapped slot means the writer fell a whole ring behind;
+those records are counted as lost and skipped. Events below the log level
+return after one comparison, and `sample` keeps 1 in N of chosen noisy
+events.
+
+    python algorithm.py --log events.jsonl --log-level DEBUG --log-sample averages=10
+"""
+
+import itertools
+import json
+import sys
+import threading
+from functools import partial
+from time import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# Field names per event; unlisted events are written with a plain `fields` list
+EVENTS = {
+    'averages': ('tick', 'status', 'owl_average', 'owl_bid', 'crow_average', 'crow_bid', 'dove_average', 'dove_bid',
+                 'duck_average', 'duck_bid'),
+    'quotes': ('tick', 'calls', 'saved'),
+    'signals': ('tick', 'risk', 'exposures'),
+    'vetoed': ('ticker', 'action', 'quantity', 'reason'),
+    'order_error': ('ticker', 'action', 'quantity', 'status_code', 'message'),
+    'cancel_error': ('order_id', 'status_code', 'message'),
+    'policy_error': ('message',),
+    'warm_start': ('tick', 'checkpoint_tick', 'orders'),
+    'checkpoint_drift': ('ticker', 'ledger_position', 'server_position'),
+}
+
+
+def level_number(level):
+    """
+    Accepts 'info', 'INFO' or 20.
+    """
+    if isinstance(level, int):
+        return level
+    names = {name: number for number, name in LEVELS.items()}
+    return names[level.upper()]
+
+
+class EventLog:
+    """
+    Ring buffer of event tuples drained by a writer thread.
+
+    `stream` is any text file object (stdout by default); `capacity` is
+    rounded up to a power of two.
+    """
+
+    def __init__(self, stream=None, level=INFO, capacity=1 << 16, sample=None, interval=0.05):
+        size = 1 << max(capacity - 1, 1).bit_length()
+        self.ring = [None] * size
+        self.mask = size - 1
+        self.seq = itertools.count()
+        self.head = 0  # One past the highest slot taken; a hint for the writer
+        self.level = level_number(level)
+        self.sample = {}
+        self.counts = {}
+        self.stream = stream
+        self.interval = interval
+        self.read = 0
+        self.lost = 0
+        self.written = 0
+        self.stop = threading.Event()
+        self.writer = None
+        self.lock = threading.Lock()  # Writer side only: drain() from close() and the thread
+        for event, every in (sample or {}).items():
+            self.set_sample(event, every)
+        # Bound once: a partial is called in C, a wrapper method would double the per-event cost
+        self.debug = partial(self.emit, DEBUG)
+        self.info = partial(self.emit, INFO)
+        self.warning = partial(self.emit, WARNING)
+        self.error = partial(self.emit, ERROR)
+
+    def set_sample(self, event, every):
+        """
+        Keeps one in `every` `event` records; 1 keeps all of them.
+        """
+        self.sample[event] = max(int(every), 1)
+        self.counts.setdefault(event, itertools.count())
+
+    def emit(self, level, event, *fields):
+        """
+        Queues one record; debug(), info(), warning() and error() are this with the level bound.
+        """
+        if level < self.level:
+            return
+        if event in self.sample and next(self.counts[event]) % self.sample[event]:
+            return
+        seq = next(self.seq)
+        self.ring[seq & self.mask] = (seq, time(), level, event, fields)
+        self.head = seq + 1
+        if self.writer is None:
+            self.start()
+
+    # --- Writer side ----------------------------------------------------------
+
+    def start(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._run, name='event-log', daemon=True)
+                self.writer.start()
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.drain()
+
+    def format(self, record):
+        _, stamp, level, event, fields = record
+        line = {'t': round(stamp, 6), 'level': LEVELS.get(level, level), 'event': event}
+        names = EVENTS.get(event)
+        if names is not None and len(names) == len(fields):
+            line.update(zip(names, fields))
+        elif fields:
+            line['fields'] = list(fields)
+        return json.dumps(line, default=str)
+
+    def drain(self):
+        """
+        Formats and writes every record published so far; returns how many were written.
+        """
+        with self.lock:
+            lines = []
+            size = self.mask + 1
+            head = self.head
+            if head - self.read > size:
+                self.lost += head - size - self.read
+                self.read = head - size
+            while self.read < head:
+                record = self.ring[self.read & self.mask]
+                if record is None or record[0] < self.read:
+                    break  # Slot taken but not stored yet; picked up next time
+                if record[0] > self.read:
+                    self.lost += 1  # Overwritten by a producer a whole ring ahead
+                else:
+                    lines.append(self.format(record))
+                self.read += 1
+            if lines:
+                stream = self.stream or sys.stdout
+                stream.write('\n'.join(lines) + '\n')
+                stream.flush()
+                self.written += len(lines)
+            return len(lines)
+
+    def close(self):
+        """
+        Stops the writer and writes whatever is left; a file stream is closed and stdout used again.
+        """
+        self.stop.set()
+        if self.writer is not None:
+            self.writer.join(timeout=1.0)
+        self.drain()
+        if self.stream is not None and self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+            self.stream = None
+        self.writer = None  # The next event starts a new writer
+        self.stop.clear()
+
+    def open(self, path=None, level=None, sample=None):
+        """
+        Points the log at `path` (stdout when None) and applies a new level and sample rates.
+        """
+        self.drain()
+        if path:
+            self.stream = open(path, 'a', buffering=1 << 16)
+        if level is not None:
+            self.level = level_number(level)
+        for event, every in (sample or {}).items():
+            self.set_sample(event, every)
+        return self
+
+
+# Shared log; writes JSON lines to stdout until main() points it elsewhere
+log = EventLog()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Pipelined order gateway.
+
+Takes a batch of order intents, merges duplicates into the fewest orders
+allowed under the order size limit, passes each through the risk engine when
+one is attached and sends them concurrently over the pooled session with a
+bounded number in flight. Over a GovernedSession cancels go first and new
+quotes queue behind risk-reducing orders; a quote that waits longer than
+`max_age` for the rate limit is dropped instead of sent stale.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from eventlog import log
+from governor import CANCEL, QUOTE, RequestDropped, hints, order_priority
+from metrics import registry
+
+OrderIntent = namedtuple('OrderIntent', ['ticker', 'type', 'quantity', 'price', 'action'])
+OrderResult = namedtuple('OrderResult', ['intent', 'order_id', 'status', 'quantity_filled', 'status_code', 'message'])
+
+
+def merge_intents(intents, order_limit):
+    """
+    Sums intents with the same ticker, type, action and price, then splits each
+    total into as few orders of at most order_limit as possible.
+    """
+    totals = {}
+    for intent in intents:
+        price = None if intent.type == 'MARKET' else round(intent.price, 2)  # Market orders ignore price
+        key = (intent.ticker, intent.type, intent.action, price)
+        if key in totals:
+            totals[key][1] += intent.quantity
+        else:
+            totals[key] = [intent if price is None else intent._replace(price=price), intent.quantity]
+
+    merged = []
+    for intent, total in totals.values():
+        while total > 0:
+            quantity = min(order_limit, total)
+            merged.append(intent._replace(quantity=quantity))
+            total -= quantity
+    return merged
+
+
+def record_ack(recorder, intent, order_id, status, quantity_filled, vwap):
+    """
+    Records an order ack and, if it filled on arrival, the fill at its average price.
+    """
+    recorder.order(intent.ticker, order_id, intent.action, intent.type, intent.price, intent.quantity, status)
+    if quantity_filled:
+        recorder.fill(intent.ticker, order_id, intent.action, vwap or intent.price, quantity_filled)
+
+
+class OrderGateway:
+    """
+    Sends order batches concurrently and returns an OrderResult per order sent.
+
+    With a recorder attached every ack, and any fill it reports, is recorded.
+    With a FillLedger attached fills reported on acks are applied to it as
+    aggressive executions.
+    With a RiskEngine attached every order is checked before it is sent:
+    vetoed orders come back with status 'VETOED' without a request being made.
+    """
+
+    def __init__(self, session, base_url, order_limit, max_in_flight=8, recorder=None, risk=None,
+                 ledger=None, max_age=None):
+        self.session = session
+        self.base_url = base_url
+        self.order_limit = order_limit
+        self.recorder = recorder
+        self.risk = risk
+        self.ledger = ledger
+        self.max_age = max_age  # Seconds a quote may queue behind the rate limit before it is dropped
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='order-gateway')
+
+    def _priority(self, intent):
+        if self.risk is None:
+            return QUOTE
+        return order_priority(self.risk.position[intent.ticker], intent.action)
+
+    @staticmethod
+    def _lots(intents):
+        # Position of each order among the batch's orders at the same level; a split level is several lots
+        seen = {}
+        lots = []
+        for intent in intents:
+            level = (intent.ticker, intent.action, intent.price)
+            lots.append(seen.get(level, 0))
+            seen[level] = lots[-1] + 1
+        return lots
+
+    def _send(self, intent, lot=0):
+        # A newer quote for the same lot of a level supersedes one still queued; lots of one batch never do
+        key = (intent.ticker, intent.action, round(intent.price, 2), lot) if intent.type == 'LIMIT' else None
+        sent = perf_counter()
+        try:
+            resp = self.session.post(self.base_url + '/orders', params={
+                'ticker': intent.ticker,
+                'type': intent.type,
+                'quantity': intent.quantity,
+                'price': intent.price,
+                'action': intent.action
+            }, **hints(self.session, self._priority(intent), key, self.max_age))
+        except RequestDropped as e:
+            if self.risk is not None:
+                self.risk.release(intent.ticker, intent.quantity, intent.action)
+            return OrderResult(intent, None, 'DROPPED', 0, None, str(e))
+        if resp.status_code != 200:
+            log.error('order_error', intent.ticker, intent.action, intent.quantity, resp.status_code, resp.text)
+            result = OrderResult(intent, None, 'REJECTED', 0, resp.status_code, resp.text)
+        else:
+            order = resp.json()
+            result = OrderResult(intent, order.get('order_id'), order.get('status'), order.get('quantity_filled', 0),
+                                 resp.status_code, None)
+        registry.order_sent(sent, resp.status_code, result.status)
+        if self.risk is not None:
+            if result.order_id is None:
+                self.risk.release(intent.ticker, intent.quantity, intent.action)
+            else:
+                self.risk.on_ack(intent.ticker, intent.quantity, intent.action, result.order_id, result.status,
+                                 result.quantity_filled)
+        vwap = order.get('vwap') if result.order_id else None
+        if self.ledger is not None and result.quantity_filled:
+            self.ledger.apply(intent.ticker, intent.action, vwap or intent.price, result.quantity_filled, passive=False)
+        if self.recorder is not None:
+            record_ack(self.recorder, intent, result.order_id, result.status, result.quantity_filled, vwap)
+        return result
+
+    def _cancel(self, order_id):
+        resp = self.session.delete(self.base_url + '/orders/' + str(order_id), **hints(self.session, CANCEL))
+        registry.count('cancels.sent')
+        if not resp.ok:
+            # ORDER_CLOSED: it filled or lapsed first and the next /orders listing settles it
+            closed = resp.status_code == 400 and 'ORDER_CLOSED' in resp.text
+            registry.count('cancels.closed' if closed else 'cancels.failed')
+            if not closed:
+                log.error('cancel_error', order_id, resp.status_code, resp.text)
+        elif self.risk is not None:
+            self.risk.on_cancel(order_id)
+        return resp.ok
+
+    def submit(self, intents):
+        """
+        Merges and sends intents; results come back in the order the merged orders were built.
+        """
+        merged = merge_intents(intents, self.order_limit)
+        if self.risk is None:
+            return list(self.executor.map(self._send, merged, self._lots(merged)))
+
+        # Checks run here, one at a time, so each sees the reservations of the ones before it
+        results = []
+        approved = []
+        for intent in merged:
+            check = self.risk.check(intent.ticker, intent.quantity, intent.action)
+            if check.quantity:
+                results.append(None)
+                approved.append(intent._replace(quantity=check.quantity))
+            else:
+                results.append(OrderResult(intent, None, 'VETOED', 0, None, check.reason))
+                registry.count('orders.vetoed')
+        sent = iter(self.executor.map(self._send, approved, self._lots(approved)))
+        return [next(sent) if result is None else result for result in results]
+
+    def cancel(self, order_ids):
+        """
+        Cancels orders concurrently; returns whether each cancel was accepted.
+        """
+        return list(self.executor.map(self._cancel, order_ids))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
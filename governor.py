@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Rate-limit-aware request governor.
+
+Every REST call made through a GovernedSession waits for a token from its
+endpoint group's bucket before it goes on the wire. Groups default to one
+per endpoint; order entry and cancels share the 'orders' group, because
+RIT's order rate limit counts both. An optional '*' bucket limits every
+request on top of its group.
+
+Buckets start with the configured rates, or unlimited when none is given.
+A 429 blocks the group for the server's hint (Retry-After, the body's
+`wait`, or the "retry in N seconds" message), and the request is retried
+once the group opens again. The group's rate is also cut to just under what
+it sent in the last second, so a limit that was not configured is learned
+from the first few 429s instead of being hit again on every burst. A
+learned rate is not kept for the rest of the case: every `recovery`
+seconds without a 429 it grows by a tenth of what was learned. It goes
+back to the configured rate once it reaches it, or to unlimited once it
+has doubled when no rate was configured.
+
+While requests wait, they are released in priority order: cancels, then
+risk-reducing orders, then reads, then new quotes. A queued request is
+dropped rather than sent when a newer one with the same key supersedes
+it, or when it has waited longer than its `max_age`. A dropped request
+raises RequestDropped instead of spending budget on a stale quote.
+"""
+
+import heapq
+import itertools
+import re
+import threading
+from collections import deque
+from time import monotonic
+
+import requests
+
+from metrics import endpoint_name, registry
+
+# Priorities, most urgent first
+CANCEL = 0
+REDUCE = 1
+READ = 2
+QUOTE = 3
+
+ORDER_GROUPS = {
+    'POST /v1/orders': 'orders',
+    'DELETE /v1/orders/{id}': 'orders',
+    'POST /v1/commands/cancel': 'orders',
+}
+
+_RETRY_IN = re.compile(r'retry in ([\d.]+) second')
+
+
+class RequestDropped(Exception):
+    """
+    Raised for a queued request that was superseded or waited past its max_age.
+    """
+
+
+def order_priority(position, action):
+    """
+    REDUCE for an order that brings `position` towards flat, QUOTE otherwise.
+    """
+    return REDUCE if (position > 0 and action == 'SELL') or (position < 0 and action == 'BUY') else QUOTE
+
+
+def retry_after(resp, default=0.1):
+    """
+    Seconds a 429 response asks us to wait: Retry-After, then the body's `wait`, then its message.
+    """
+    header = resp.headers.get('Retry-After')
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        body = resp.json()
+    except ValueError:
+        return default
+    if isinstance(body, dict):
+        if body.get('wait') is not None:
+            return float(body['wait'])
+        match = _RETRY_IN.search(str(body.get('message', '')))
+        if match:
+            return float(match.group(1))
+    return default
+
+
+class Bucket:
+    """
+    Token bucket; `rate` None means unlimited until the server blocks us.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp', 'blocked_until', 'base', 'base_capacity', 'learned', 'clean_since')
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.stamp = monotonic()
+        self.blocked_until = 0.0
+        self.base = rate  # Configured rate and burst, restored once a learned rate has recovered
+        self.base_capacity = self.capacity
+        self.learned = None  # Rate learned from the last 429, None while running at the configured rate
+        self.clean_since = 0.0  # Start of the current stretch without a 429
+
+    def learn(self, rate, now):
+        """
+        Lowers the rate to `rate` after a 429; a higher one than the current rate is ignored.
+        """
+        if self.rate is None or rate < self.rate:
+            self.rate = rate
+            self.capacity = max(1.0, rate)
+            self.tokens = min(self.tokens, self.capacity)
+            self.learned = rate
+        self.clean_since = now
+
+    def recover(self, now, interval):
+        """
+        Raises a learned rate by a tenth of the learned value per `interval` seconds without a 429.
+        """
+        if self.learned is None or now - self.clean_since < interval:
+            return
+        periods = int((now - self.clean_since) / interval)
+        self.clean_since += periods * interval
+        rate = self.rate + periods * max(0.1 * self.learned, 1.0)
+        if self.base is not None and rate >= self.base:
+            self.rate, self.capacity, self.learned = self.base, self.base_capacity, None
+        elif self.base is None and rate >= 2 * self.learned:
+            self.rate, self.capacity, self.learned = None, self.base_capacity, None
+        else:
+            self.rate = rate
+            self.capacity = max(1.0, rate)
+
+    def delay(self, now):
+        """
+        Seconds until a token can be taken, 0 if one can be taken now.
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rate is None:
+            self.stamp = now
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate is not None:
+            self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+        if self.rate is not None:
+            self.tokens = 0.0  # The server's window is spent; don't burst straight back into it
+
+
+class Ticket:
+    __slots__ = ('priority', 'seq', 'key', 'enqueued', 'max_age', 'dropped')
+
+    def __init__(self, priority, seq, key, enqueued, max_age):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.enqueued = enqueued
+        self.max_age = max_age
+        self.dropped = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Governor:
+    """
+    Buckets and priority queues per endpoint group.
+
+    `rates` maps group -> requests per second (or (rate, burst)); '*' applies
+    to every request. `groups` maps endpoint name -> group and defaults to
+    ORDER_GROUPS; unlisted endpoints are their own group.
+    """
+
+    def __init__(self, rates=None, groups=None, retries=3, recovery=1.0):
+        self.rates = dict(rates or {})
+        self.groups = ORDER_GROUPS if groups is None else groups
+        self.retries = retries
+        self.recovery = recovery  # Seconds without a 429 per step back up from a learned rate
+        self.condition = threading.Condition()
+        self.buckets = {}
+        self.queues = {}  # group -> heap of Tickets
+        self.keys = {}  # key -> newest Ticket
+        self.history = {}  # group -> send times over the last second
+        self.seq = itertools.count()
+        self.shared = self._bucket('*') if '*' in self.rates else None
+        self.sent = 0
+        self.throttled = 0
+        self.retried = 0
+        self.dropped = 0
+        self.waited = 0.0
+
+    def _bucket(self, group):
+        rate = self.rates.get(group)
+        if isinstance(rate, (tuple, list)):
+            return Bucket(*rate)
+        return Bucket(rate)
+
+    def group(self, method, url):
+        name = endpoint_name(method, url)
+        return self.groups.get(name, name)
+
+    def _delay(self, group, now):
+        bucket = self.buckets[group]
+        bucket.recover(now, self.recovery)
+        delay = bucket.delay(now)
+        if self.shared is not None:
+            delay = max(delay, self.shared.delay(now))
+        return delay
+
+    def _drop(self, ticket):
+        ticket.dropped = True
+        self.dropped += 1
+        registry.count('governor.dropped')
+
+    def ticket(self, priority=READ, key=None, max_age=None):
+        return Ticket(priority, next(self.seq), key, monotonic(), max_age)
+
+    def acquire(self, group, ticket):
+        """
+        Blocks until `ticket` may be sent on `group`; raises RequestDropped if it is superseded or too old.
+        """
+        with self.condition:
+            if group not in self.buckets:
+                self.buckets[group] = self._bucket(group)
+                self.queues[group] = []
+                self.history[group] = deque()
+            queue = self.queues[group]
+            if ticket.key is not None:
+                previous = self.keys.get(ticket.key)
+                if previous is not None and previous is not ticket and not previous.dropped:
+                    self._drop(previous)  # A newer request for the same thing replaces the queued one
+                    self.condition.notify_all()
+                self.keys[ticket.key] = ticket
+            ticket.dropped = False
+            heapq.heappush(queue, ticket)
+            start = monotonic()
+            try:
+                while True:
+                    while queue and queue[0].dropped:
+                        heapq.heappop(queue)
+                    if ticket.dropped:
+                        raise RequestDropped('superseded')
+                    now = monotonic()
+                    timeout = None
+                    if ticket.max_age is not None:
+                        timeout = ticket.enqueued + ticket.max_age - now
+                        if timeout <= 0:
+                            self._drop(ticket)
+                            raise RequestDropped('waited %.3fs' % (now - ticket.enqueued))
+                    if queue[0] is ticket:
+                        delay = self._delay(group, now)
+                        if not delay:
+                            heapq.heappop(queue)
+                            self.buckets[group].take()
+                            if self.shared is not None:
+                                self.shared.take()
+                            self.sent += 1
+                            history = self.history[group]
+                            history.append(now)
+                            while history[0] < now - 1.0:
+                                history.popleft()
+                            self.condition.notify_all()
+                            return
+                        timeout = delay if timeout is None else min(delay, timeout)
+                    self.condition.wait(timeout)
+            finally:
+                self.waited += monotonic() - start
+                if ticket.key is not None and self.keys.get(ticket.key) is ticket:
+                    del self.keys[ticket.key]
+
+    def block(self, group, wait):
+        """
+        Holds `group` closed for `wait` seconds after a 429 and lowers its rate to what got through, for now.
+        """
+        with self.condition:
+            self.throttled += 1
+            now = monotonic()
+            history = self.history[group]
+            while history and history[0] < now - 1.0:
+                history.popleft()  # Only trimmed on sends otherwise
+            bucket = self.buckets[group]
+            bucket.learn(max(0.9 * len(history), 1.0), now + wait)  # Recovery counts from when the block lifts
+            bucket.block(now + wait)
+            self.condition.notify_all()
+        registry.count('governor.throttled')
+
+    def report(self):
+        return 'governor %d sent, %d throttled, %d retried, %d dropped, %.2fs queued' % (
+            self.sent, self.throttled, self.retried, self.dropped, self.waited)
+
+
+class GovernedSession(requests.Session):
+    """
+    requests.Session whose requests go through a Governor.
+
+    request() also takes `priority`, `key` and `max_age`. A 429 is retried up
+    to the governor's limit with the same priority and place in line; the
+    last 429 is returned if it persists.
+    """
+
+    def __init__(self, governor=None):
+        super().__init__()
+        self.governor = governor or Governor()
+
+    def request(self, method, url, *args, priority=READ, key=None, max_age=None, **kwargs):
+        governor = self.governor
+        group = governor.group(method, url)
+        ticket = governor.ticket(priority, key, max_age)
+        for attempt in range(governor.retries + 1):
+            if attempt:
+                governor.retried += 1
+                registry.count('governor.retried')
+            governor.acquire(group, ticket)
+            resp = super().request(method, url, *args, **kwargs)
+            if resp.status_code != 429:
+                return resp
+            governor.block(group, retry_after(resp))
+        return resp
+
+
+def hints(session, priority, key=None, max_age=None):
+    """
+    Governor keyword arguments for `session`, or none for a plain requests.Session.
+    """
+    if isinstance(session, GovernedSession):
+        return {'priority': priority, 'key': key, 'max_age': max_age}
+    return {}
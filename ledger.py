@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming fill ledger.
+
+Every execution we learn about is applied once, in O(1): fills reported on
+an order's ack (aggressive, pays the market-order fee) and fills on our
+resting orders seen between /orders listings (passive, earns or pays the
+limit-order rebate). Per ticker the ledger keeps position, average cost,
+realized PnL, fees paid, rebates earned and traded volume, and marks the
+open position to the latest price for unrealized PnL, so current figures
+can be read at any moment without a request.
+
+Fee and rebate signs follow the README table: a positive fee is paid, a
+negative one is received; a positive rebate is received, a negative one is
+paid.
+"""
+
+import threading
+from math import isnan, nan
+
+
+class TickerBook:
+    """
+    Running PnL for one ticker.
+    """
+
+    __slots__ = ('position', 'cost', 'realized', 'fees', 'rebates', 'volume', 'fills', 'mark')
+
+    def __init__(self):
+        self.position = 0
+        self.cost = 0.0  # Average price of the open position
+        self.realized = 0.0
+        self.fees = 0.0  # Market-order fees paid (negative when received)
+        self.rebates = 0.0  # Limit-order rebates earned (negative when paid)
+        self.volume = 0
+        self.fills = 0
+        self.mark = nan
+
+    def apply(self, signed_quantity, price):
+        position = self.position
+        if position == 0 or (position > 0) == (signed_quantity > 0):
+            total = position + signed_quantity
+            self.cost = (self.cost * position + price * signed_quantity) / total
+            self.position = total
+            return
+        closing = min(abs(signed_quantity), abs(position))
+        self.realized += closing * (price - self.cost) * (1 if position > 0 else -1)
+        self.position = position + signed_quantity
+        if self.position == 0:
+            self.cost = 0.0
+        elif (self.position > 0) != (position > 0):
+            self.cost = price  # Flipped through flat; the remainder opens at this price
+
+    def unrealized(self):
+        if not self.position or isnan(self.mark):
+            return 0.0
+        return (self.mark - self.cost) * self.position
+
+    def total(self):
+        return self.realized + self.unrealized() + self.rebates - self.fees
+
+
+class FillLedger:
+    """
+    TickerBooks keyed by ticker, fed by the gateway and the quote manager.
+
+    `fees` and `rebates` map ticker -> per-share figure.
+    """
+
+    def __init__(self, tickers, fees, rebates):
+        self.fees = dict(fees)
+        self.rebates = dict(rebates)
+        self.books = {ticker: TickerBook() for ticker in tickers}
+        self.lock = threading.Lock()
+        self.peak = 0.0  # Highest total PnL seen at a mark, for drawdown
+
+    def apply(self, ticker, action, price, quantity, passive):
+        """
+        Applies one execution of ours: `passive` for a resting limit order, otherwise aggressive.
+        """
+        if not quantity:
+            return
+        with self.lock:
+            book = self.books[ticker]
+            book.apply(quantity if action == 'BUY' else -quantity, price)
+            if passive:
+                book.rebates += self.rebates[ticker] * quantity
+            else:
+                book.fees += self.fees[ticker] * quantity
+            book.volume += quantity
+            book.fills += 1
+
+    def mark(self, ticker, price):
+        """
+        Sets the price the open position is valued at; NaN prices are ignored.
+        """
+        if price is not None and not isnan(price):
+            self.books[ticker].mark = price
+
+    def mark_all(self, snapshot):
+        """
+        Marks every ticker in a market-data snapshot at its mid and updates the PnL peak.
+        """
+        for ticker, quote in snapshot.quotes.items():
+            if quote is not None:
+                self.mark(ticker, (quote.bid + quote.ask) / 2)
+        self.peak = max(self.peak, self.total())
+
+    def total(self):
+        return sum(book.total() for book in self.books.values())
+
+    def drawdown(self):
+        return self.peak - self.total()
+
+    def __getitem__(self, ticker):
+        return self.books[ticker]
+
+    def export(self):
+        with self.lock:
+            return {'peak': self.peak,
+                    'books': {ticker: [getattr(book, name) for name in TickerBook.__slots__]
+                              for ticker, book in self.books.items()}}
+
+    def restore(self, exported):
+        with self.lock:
+            self.peak = exported['peak']
+            for ticker, values in exported['books'].items():
+                if ticker in self.books:
+                    for name, value in zip(TickerBook.__slots__, values):
+                        setattr(self.books[ticker], name, value)
+
+    def report(self):
+        lines = ['%-5s %7s %9s %10s %10s %9s %9s %10s' % ('', 'pos', 'avg cost', 'realized', 'unrealized', 'fees',
+                                                          'rebates', 'total')]
+        for ticker, book in self.books.items():
+            lines.append('%-5s %7d %9.2f %10.2f %10.2f %9.2f %9.2f %10.2f' % (
+                ticker, book.position, book.cost, book.realized, book.unrealized(), book.fees, book.rebates,
+                book.total()))
+        lines.append('%-5s %71.2f' % ('total', self.total()))
+        return '\n'.join(lines)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Market-data snapshot layer.
+
+Fetches the case clock and every order book at the same time over the pooled
+session so that all quoting decisions in an iteration read from one
+consistent view of the market.
+
+Books are decoded in a single pass into preallocated NumPy structured arrays,
+computing depth, imbalance, microprice and a pressure-weighted mid on the way.
+orjson is used for the JSON decode when it is installed.
+"""
+
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from math import isnan, nan
+from time import perf_counter
+
+import numpy as np
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Top of book plus the crude bid/ask volume ratio the strategy has always used
+Quote = namedtuple('Quote', ['bid', 'ask', 'trend'])
+
+# One aggregated price level; depth is the cumulative quantity from the touch down to this level
+BOOK_LEVEL = np.dtype([('price', 'f8'), ('quantity', 'f8'), ('depth', 'f8')])
+
+
+class BookFeatures:
+    """
+    Signals derived from one book. `bids` and `asks` are views into the
+    decoder's buffers and stay valid until that decoder decodes again.
+    """
+
+    __slots__ = ('bid', 'ask', 'bid_size', 'ask_size', 'bid_volume', 'ask_volume', 'trend', 'imbalance',
+                 'microprice', 'weighted_mid', 'bids', 'asks')
+
+    def quote(self):
+        return Quote(self.bid, self.ask, self.trend)
+
+
+class BookDecoder:
+    """
+    Decodes /securities/book responses into preallocated per-side level arrays.
+
+    Entries at the same price (the API lists individual orders) are merged
+    into one level. `levels` is how many levels the imbalance and the
+    pressure-weighted mid look at.
+    """
+
+    def __init__(self, depth=20, levels=5):
+        self.depth = depth
+        self.levels = levels
+        self.bids = np.zeros(depth, dtype=BOOK_LEVEL)
+        self.asks = np.zeros(depth, dtype=BOOK_LEVEL)
+
+    def _side(self, entries, out):
+        """
+        Fills `out` in one pass; returns (levels filled, total quantity, top-N quantity, top-N notional).
+        """
+        count = 0
+        depth = self.depth
+        levels = self.levels
+        price = None
+        level = 0.0  # Quantity of the level being built
+        cumulative = 0.0  # Depth through the level being built
+        total = 0.0
+        top = 0.0
+        notional = 0.0
+        for item in entries:
+            quantity = item['quantity'] - item.get('quantity_filled', 0)
+            total += quantity  # Past `depth` levels only the side's total volume is kept
+            if count == depth:
+                continue
+            if item['price'] != price:
+                if price is not None:
+                    out[count] = (price, level, cumulative)  # One write per completed level
+                    count += 1
+                    if count == depth:
+                        continue
+                price = item['price']
+                level = 0.0
+            level += quantity
+            cumulative += quantity
+            if count < levels:
+                top += quantity
+                notional += price * quantity
+        if price is not None and count < depth:
+            out[count] = (price, level, cumulative)
+            count += 1
+        return count, total, top, notional
+
+    def decode(self, book):
+        """
+        Returns BookFeatures for a decoded (dict) or raw (bytes) book response.
+        """
+        if isinstance(book, (bytes, str)):
+            book = loads(book)
+        bid_count, bid_volume, bid_top, bid_notional = self._side(book['bids'], self.bids)
+        ask_count, ask_volume, ask_top, ask_notional = self._side(book['asks'], self.asks)
+
+        features = BookFeatures()
+        features.bids = self.bids[:bid_count]
+        features.asks = self.asks[:ask_count]
+        features.bid_volume = bid_volume
+        features.ask_volume = ask_volume
+        features.bid = float(self.bids[0]['price']) if bid_count else nan
+        features.ask = float(self.asks[0]['price']) if ask_count else nan
+        features.bid_size = float(self.bids[0]['quantity']) if bid_count else 0.0
+        features.ask_size = float(self.asks[0]['quantity']) if ask_count else 0.0
+
+        # Same ratio the strategy always used, without dividing by an empty side
+        if bid_volume > ask_volume:
+            features.trend = bid_volume / ask_volume if ask_volume else bid_volume
+        else:
+            features.trend = -(ask_volume / bid_volume) if bid_volume else -ask_volume
+
+        top = bid_top + ask_top
+        features.imbalance = (bid_top - ask_top) / top if top else 0.0
+        touch = features.bid_size + features.ask_size
+        if bid_count and ask_count and touch:
+            features.microprice = (features.bid * features.ask_size + features.ask * features.bid_size) / touch
+            # Microprice over the top N levels: each side's VWAP weighted by the opposite side's size
+            features.weighted_mid = ((bid_notional / bid_top) * ask_top + (ask_notional / ask_top) * bid_top) / top
+        else:
+            features.microprice = nan
+            features.weighted_mid = nan
+        return features
+
+
+_decoder = BookDecoder()
+
+
+def parse_book(book):
+    """
+    Reduces a /securities/book response to a Quote.
+    """
+    return _decoder.decode(book).quote()
+
+
+class Snapshot:
+    """
+    One consistent view of the case: tick, status and a Quote per ticker.
+    """
+
+    def __init__(self, tick, status, quotes, features, books, latency, received, ticks_per_period=None):
+        self.tick = tick
+        self.status = status
+        self.ticks_per_period = ticks_per_period  # Length of the period, None if /case did not say
+        self.quotes = quotes  # ticker -> Quote, None if the book request failed or a side was empty
+        self.features = features  # ticker -> BookFeatures, None if the book request failed
+        self.books = books  # ticker -> raw decoded book, kept for recording
+        self.latency = latency  # Seconds from first request sent to last response parsed
+        self.received = received  # perf_counter() when the last response was parsed
+
+    def __getitem__(self, ticker):
+        return self.quotes[ticker]
+
+    def __repr__(self):
+        return 'Snapshot(tick=%s, status=%s, latency=%.1fms)' % (self.tick, self.status, self.latency * 1000)
+
+
+class MarketData:
+    """
+    Sends /case and one /securities/book request per ticker concurrently.
+
+    The session must have a connection pool at least as large as the number of
+    tickers plus one, otherwise requests queue behind each other and the
+    snapshot degrades back to serial round trips. Each ticker has its own
+    BookDecoder, so a snapshot's features are valid until the next snapshot.
+    """
+
+    def __init__(self, session, tickers, base_url, max_workers=None, depth=20, levels=5):
+        self.session = session
+        self.tickers = list(tickers)
+        self.base_url = base_url
+        self.decoders = {ticker: BookDecoder(depth, levels) for ticker in self.tickers}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(self.tickers) + 1,
+                                           thread_name_prefix='market-data')
+
+    def _fetch_case(self):
+        resp = self.session.get(self.base_url + '/case')
+        if resp.ok:
+            case = loads(resp.content)
+            return case['tick'], case['status'], case.get('ticks_per_period')
+        return None, None, None
+
+    def _fetch_book(self, ticker):
+        resp = self.session.get(self.base_url + '/securities/book', params={'ticker': ticker})
+        if resp.ok:
+            book = loads(resp.content)
+            return book, self.decoders[ticker].decode(book)
+        return None, None
+
+    def snapshot(self, tickers=None):
+        """
+        Returns a Snapshot of the given tickers (all by default) after about one round trip.
+        """
+        tickers = self.tickers if tickers is None else tickers
+        start = perf_counter()
+        case = self.executor.submit(self._fetch_case)
+        pending = [(ticker, self.executor.submit(self._fetch_book, ticker)) for ticker in tickers]
+
+        quotes = {}
+        features = {}
+        books = {}
+        for ticker, future in pending:
+            book, book_features = future.result()
+            books[ticker] = book
+            features[ticker] = book_features
+            if book_features is None or isnan(book_features.bid) or isnan(book_features.ask):
+                quotes[ticker] = None  # Nothing to price quotes from; callers skip tickers without a quote
+            else:
+                quotes[ticker] = book_features.quote()
+        tick, status, ticks_per_period = case.result()
+        received = perf_counter()
+        return Snapshot(tick, status, quotes, features, books, received - start, received, ticks_per_period)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Hot-path latency instrumentation.
+
+Latencies go into HDR-style log-linear histograms: every power of two is
+split into a fixed number of linear sub-buckets, so recording is an integer
+bit_length and a list increment and every percentile is within a few percent
+of the true value whatever the range. There is one histogram per REST
+endpoint (timed from the session's response hook) and one per strategy stage
+(timed with `registry.stage(name)` or `registry.lap`), plus counters for loop iterations per
+tick, tick-to-first-order and decision-to-order latency and orders sent, rejected and throttled.
+
+Everything is behind `registry.enabled`, which can be flipped at any time;
+when it is off every call returns after a single attribute check.
+
+    python algorithm.py --metrics 9100 --metrics-dump metrics.json
+    curl localhost:9100/metrics          # text report
+    curl localhost:9100/metrics.json
+    curl localhost:9100/disable          # or /enable, /reset
+"""
+
+import json
+import re
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+from urllib.parse import urlsplit
+
+SUB_BUCKET_BITS = 5  # 32 linear sub-buckets per power of two from 64 up, exact below: at most 3.1% error
+PERCENTILES = (50, 90, 99, 99.9)
+
+_OFF = nullcontext()
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative integer values (microseconds here).
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max', 'lock')
+
+    def __init__(self, max_bits=40):
+        self.counts = [0] * ((max_bits + 1) << SUB_BUCKET_BITS)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def index(value):
+        # Values below 64 are exact; above, value >> shift keeps the top six bits, 32..63
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def highest_at(index):
+        """
+        Highest value that falls into bucket `index`.
+        """
+        shift = max(0, (index >> SUB_BUCKET_BITS) - 1)
+        sub = index - (shift << SUB_BUCKET_BITS)
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = min(self.index(value), len(self.counts) - 1)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        target = max(1, round(self.count * percent / 100.0))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return max(self.min, min(self.highest_at(index), self.max))
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        summary = {'count': self.count, 'mean': self.total / self.count, 'min': self.min, 'max': self.max}
+        for percent in PERCENTILES:
+            summary['p%s' % percent] = self.percentile(percent)
+        return summary
+
+
+class _Stage:
+    """
+    Context manager that records its wall time into one histogram.
+    """
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record((perf_counter() - self.start) * 1e6)
+        return False
+
+
+def endpoint_name(method, url):
+    """
+    'GET http://host/v1/orders/1234?x=1' -> 'GET /v1/orders/{id}'.
+    """
+    return method + ' ' + re.sub(r'/\d+(?=/|$)', '/{id}', urlsplit(url).path)
+
+
+class Metrics:
+    """
+    Registry of histograms and counters. Latencies are stored in microseconds.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.stages = {}
+            self.counters = {}
+            self.iterations = Histogram()  # Loop iterations per tick (a count, not a latency)
+            self.first_order = Histogram()  # From the first iteration of a tick to its first order sent
+            self.decision_to_order = Histogram()  # From the snapshot a decision was made on to each order sent
+            self.decision_start = None
+            self.tick = None
+            self.tick_start = None
+            self.tick_iterations = 0
+            self.tick_ordered = False
+            self.started = time()
+
+    def _histogram(self, table, name):
+        histogram = table.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = table.setdefault(name, Histogram())
+        return histogram
+
+    # --- Hot path ------------------------------------------------------------
+
+    def instrument(self, session):
+        """
+        Times every request made through a requests.Session, keyed by endpoint.
+        """
+        session.hooks['response'].append(self.on_response)
+
+    def on_response(self, resp, *args, **kwargs):
+        if not self.enabled:
+            return
+        request = resp.request
+        self._histogram(self.endpoints, endpoint_name(request.method, request.url)).record(
+            resp.elapsed.total_seconds() * 1e6)
+
+    def stage(self, name):
+        """
+        `with registry.stage('snapshot'):` times the block; a shared no-op when disabled.
+        """
+        if not self.enabled:
+            return _OFF
+        return _Stage(self._histogram(self.stages, name))
+
+    def lap(self, name, start):
+        """
+        Records the time since `start` as stage `name` and returns the new start,
+        for timing consecutive stages without nesting blocks:
+
+            mark = registry.lap('snapshot', registry.now())
+            ...
+            mark = registry.lap('decide', mark)
+
+        Returns 0 when disabled; a lap from 0 is not recorded.
+        """
+        if not self.enabled:
+            return 0
+        now = perf_counter()
+        if start:
+            self._histogram(self.stages, name).record((now - start) * 1e6)
+        return now
+
+    def now(self):
+        return perf_counter() if self.enabled else 0
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def loop(self, tick):
+        """
+        Marks the start of a loop iteration on `tick`.
+        """
+        if not self.enabled:
+            return
+        if tick != self.tick:
+            if self.tick is not None:
+                self.iterations.record(self.tick_iterations)
+            self.tick = tick
+            self.tick_start = perf_counter()
+            self.tick_iterations = 0
+            self.tick_ordered = False
+        self.tick_iterations += 1
+
+    def decision(self, received):
+        """
+        Marks the perf_counter() at which the snapshot the next orders are decided on arrived.
+        """
+        if self.enabled:
+            self.decision_start = received
+
+    def order_sent(self, sent_at, status_code, status=None):
+        """
+        Counts an order POST by outcome. `sent_at` is the perf_counter() taken
+        just before sending; the first order of a tick sets tick-to-first-order latency.
+        """
+        if not self.enabled:
+            return
+        if not self.tick_ordered and self.tick_start is not None and sent_at >= self.tick_start:
+            self.tick_ordered = True
+            self.first_order.record((sent_at - self.tick_start) * 1e6)
+        if self.decision_start is not None and sent_at >= self.decision_start:
+            self.decision_to_order.record((sent_at - self.decision_start) * 1e6)
+        self.count('orders.sent')
+        if status_code == 429:
+            self.count('orders.throttled')
+        elif status_code != 200 or status == 'REJECTED':
+            self.count('orders.rejected')
+
+    # --- Export ----------------------------------------------------------------
+
+    def to_dict(self):
+        with self.lock:
+            endpoints = dict(self.endpoints)
+            stages = dict(self.stages)
+            counters = dict(self.counters)
+        return {
+            'enabled': self.enabled,
+            'uptime': time() - self.started,
+            'unit': 'us',
+            'endpoints': {name: histogram.summary() for name, histogram in sorted(endpoints.items())},
+            'stages': {name: histogram.summary() for name, histogram in sorted(stages.items())},
+            'iterations_per_tick': self.iterations.summary(),
+            'tick_to_first_order': self.first_order.summary(),
+            'decision_to_order': self.decision_to_order.summary(),
+            'counters': counters,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_text(self):
+        data = self.to_dict()
+        lines = ['metrics %s, %.0fs, latencies in us' % ('on' if data['enabled'] else 'off', data['uptime'])]
+        header = '%-32s %8s %9s %9s %9s %9s %9s %9s' % ('', 'count', 'mean', 'p50', 'p90', 'p99', 'p99.9', 'max')
+        for section in ('endpoints', 'stages'):
+            lines.append(section + header[len(section):])
+            for name, summary in data[section].items():
+                lines.append(_row('  ' + name, summary))
+        lines.append(_row('iterations/tick', data['iterations_per_tick']))
+        lines.append(_row('tick->first order', data['tick_to_first_order']))
+        lines.append(_row('decision->order', data['decision_to_order']))
+        for name, value in sorted(data['counters'].items()):
+            lines.append('%-32s %8d' % (name, value))
+        return '\n'.join(lines)
+
+    def dump_every(self, path, interval=5.0, stop=None):
+        """
+        Writes the JSON report to `path` every `interval` seconds on a daemon thread.
+        """
+        stop = stop or threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.dump(path)
+
+        threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+        return stop
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves /metrics (text), /metrics.json, /enable, /disable and /reset on a daemon thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path == '/enable':
+                    registry.enabled = True
+                elif path == '/disable':
+                    registry.enabled = False
+                elif path == '/reset':
+                    registry.reset()
+                if path == '/metrics.json':
+                    body, kind = registry.to_json(), 'application/json'
+                elif path in ('/metrics', '/enable', '/disable', '/reset'):
+                    body, kind = registry.to_text(), 'text/plain'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+
+def _row(name, summary):
+    if not summary['count']:
+        return '%-32s %8d' % (name, 0)
+    return '%-32s %8d %9.0f %9d %9d %9d %9d %9d' % (name, summary['count'], summary['mean'], summary['p50'],
+                                                     summary['p90'], summary['p99'], summary['p99.9'], summary['max'])
+
+
+# Shared registry; off until main() or a caller enables it
+registry = Metrics()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Per-ticker quoting policy tables.
+
+Everything market_making and the per-ticker branches of main() used to
+hard-code lives in a JSON file (policy.json), one entry per ticker:
+
+    tiers           [[spread, offset], ...]: when the spread is above `spread`,
+                    quote `offset` inside each side. The widest matching tier wins.
+    min_edge        smallest half-spread plus limit rebate per share worth quoting
+    fee, rebate     per-share market-order fee and limit-order rebate (README table)
+    band            quote only while |moving average - bid| is below this
+    cap             quote only while |position| is below this (null: no cap)
+    levels, size    ladder of `levels` orders of `size` on each side,
+    step            spaced `step` apart (0 stacks them at one price)
+    skew            null, or {threshold, improve, lean_size, light_size}: beyond
+                    +/-threshold, lean the unwinding side `improve` inside with
+                    lean_size and shrink the other side to light_size
+    unwind_trigger  outside the band, unwind while |position| is above this
+    unwind_style    'twap', 'pov' or 'iceberg' schedule for the unwind (unwind.py)
+    unwind_horizon  ticks the schedule spreads the position over
+    unwind_participation
+                    POV share of tape volume to trade
+    unwind_display  largest passive child resting at the touch
+    unwind_urgency  ticks before the horizon or case ends to start crossing when behind
+    unwind_size     largest aggressive (MARKET) child
+    hedge_weight    0 to 1: how far the position used for the band cap and the
+                    skew moves from the ticker's own shares to its exposure
+                    to the whole book (signals.py); 0 keeps the cap and skew
+                    on the ticker's own shares
+    enabled         false stops quoting and unwinding the ticker
+
+Entries are compiled into Policy objects. The spread tiers become a sorted
+threshold list searched with bisect, and everything else becomes a plain
+attribute. A PolicyBook watches the file and swaps in a newly compiled set
+with a single reference assignment. The loop therefore always sees either
+the old tables or the new ones, and a file that fails to parse or validate
+leaves the current tables in place.
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+
+from eventlog import log
+from unwind import STYLES
+
+DEFAULTS = {
+    'tiers': [],
+    'min_edge': 0.0,
+    'fee': 0.0,
+    'rebate': 0.0,
+    'band': float('inf'),
+    'cap': None,
+    'levels': 1,
+    'size': 1000,
+    'step': 0.0,
+    'skew': None,
+    'unwind_trigger': 1000,
+    'unwind_style': 'twap',
+    'unwind_horizon': 20,
+    'unwind_participation': 0.2,
+    'unwind_display': 2000,
+    'unwind_urgency': 3,
+    'unwind_size': 1000,
+    'hedge_weight': 0.0,
+    'enabled': True,
+}
+
+
+class Policy:
+    """
+    One ticker's compiled quoting table.
+    """
+
+    __slots__ = ('ticker', 'thresholds', 'offsets', 'min_edge', 'fee', 'rebate', 'band', 'cap', 'levels', 'size',
+                 'step', 'skew', 'unwind_trigger', 'unwind_style', 'unwind_horizon', 'unwind_participation', 'unwind_display',
+                 'unwind_urgency', 'unwind_size', 'hedge_weight', 'enabled')
+
+    def __init__(self, ticker, entry):
+        unknown = set(entry) - set(DEFAULTS)
+        if unknown:
+            raise ValueError('%s: unknown policy keys %s' % (ticker, ', '.join(sorted(unknown))))
+        values = dict(DEFAULTS, **entry)
+        tiers = sorted((float(spread), float(offset)) for spread, offset in values['tiers'])
+        self.ticker = ticker
+        self.thresholds = [spread for spread, _ in tiers]
+        self.offsets = [offset for _, offset in tiers]
+        self.min_edge = float(values['min_edge'])
+        self.fee = float(values['fee'])
+        self.rebate = float(values['rebate'])
+        self.band = float(values['band'])
+        self.cap = None if values['cap'] is None else float(values['cap'])
+        self.levels = int(values['levels'])
+        self.size = int(values['size'])
+        self.step = float(values['step'])
+        skew = values['skew']
+        if skew is not None:
+            skew = (float(skew['threshold']), float(skew['improve']), int(skew['lean_size']), int(skew['light_size']))
+        self.skew = skew
+        self.unwind_trigger = float(values['unwind_trigger'])
+        if values['unwind_style'] not in STYLES:
+            raise ValueError('%s: unwind_style must be one of %s' % (ticker, ', '.join(STYLES)))
+        self.unwind_style = values['unwind_style']
+        self.unwind_horizon = max(int(values['unwind_horizon']), 1)
+        self.unwind_participation = float(values['unwind_participation'])
+        self.unwind_display = int(values['unwind_display'])
+        self.unwind_urgency = int(values['unwind_urgency'])
+        self.unwind_size = int(values['unwind_size'])
+        self.hedge_weight = min(max(float(values['hedge_weight']), 0.0), 1.0)
+        self.enabled = bool(values['enabled'])
+
+    def offset(self, spread):
+        """
+        Offset of the widest tier whose threshold the spread is above, None if below all of them.
+        """
+        tier = bisect_left(self.thresholds, spread) - 1
+        return self.offsets[tier] if tier >= 0 else None
+
+    def prices(self, bid, ask):
+        """
+        Returns (buy price, sell price) to quote, or (0, 0) when the spread or the edge after rebates is too thin.
+        """
+        offset = self.offset(ask - bid)
+        if offset is None:
+            return 0, 0
+        buy = bid + offset
+        sell = ask - offset
+        if (sell - buy) / 2 + self.rebate < self.min_edge:
+            return 0, 0
+        return buy, sell
+
+    def hedged(self, position, exposure):
+        """
+        The position to quote on: own shares, moved `hedge_weight` of the way to the book exposure.
+        """
+        return position + self.hedge_weight * (exposure - position)
+
+    def in_band(self, average, bid, position):
+        return abs(average - bid) < self.band and (self.cap is None or abs(position) < self.cap)
+
+    def ladder(self, buy, sell, position):
+        """
+        Yields (quantity, price, action) for the orders to rest, sell side first as main() always placed them.
+        """
+        if self.skew is not None:
+            threshold, improve, lean_size, light_size = self.skew
+            if position > threshold:
+                yield lean_size, sell - improve, 'SELL'
+                yield light_size, buy, 'BUY'
+                return
+            if position < -threshold:
+                yield light_size, sell, 'SELL'
+                yield lean_size, buy + improve, 'BUY'
+                return
+        for level in range(self.levels):
+            yield self.size, sell + level * self.step, 'SELL'
+            yield self.size, buy - level * self.step, 'BUY'
+
+
+def compile_policies(data):
+    return {ticker: Policy(ticker, entry) for ticker, entry in data.items()}
+
+
+class PolicyBook:
+    """
+    Compiled policies keyed by ticker, reloaded when the file changes.
+
+    Readers should take `book[ticker]` once per decision; a reload replaces
+    the whole dict, never an entry in place.
+    """
+
+    def __init__(self, path, interval=0.5):
+        self.path = path
+        self.interval = interval
+        self.policies = {}
+        self.stamp = None
+        self.reloads = 0
+        self.errors = 0
+        self.stop = threading.Event()
+        self.reload()
+
+    def _stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        """
+        Compiles the file and swaps it in; returns False and keeps the current tables on any error.
+        """
+        try:
+            stamp = self._stamp()
+        except OSError:
+            stamp = None
+        try:
+            with open(self.path) as f:
+                policies = compile_policies(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.stamp = stamp  # Not retried until the file changes again
+            self.errors += 1
+            log.error('policy_error', 'reload failed, keeping current tables: %s' % e)
+            if not self.policies:
+                raise
+            return False
+        self.policies = policies  # Single reference swap: readers see the old or the new set, never a mix
+        self.stamp = stamp
+        self.reloads += 1
+        return True
+
+    def watch(self):
+        """
+        Polls the file's mtime and size on a daemon thread and reloads on change.
+        """
+        def run():
+            while not self.stop.wait(self.interval):
+                try:
+                    changed = self._stamp() != self.stamp
+                except OSError:
+                    continue  # Mid-replace; look again next time
+                if changed:
+                    self.reload()
+
+        threading.Thread(target=run, name='policy-watch', daemon=True).start()
+        return self
+
+    def close(self):
+        self.stop.set()
+
+    def __getitem__(self, ticker):
+        return self.policies[ticker]
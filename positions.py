@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Per-iteration position cache.
+
+Reads /securities at most once until it is invalidated, and serves long,
+short, gross, net and per-ticker positions from memory in between.
+"""
+
+
+class PositionCache:
+    """
+    Positions keyed by ticker, refreshed lazily from /securities.
+
+    Call invalidate() after sending orders; the next read refetches. Fills we
+    already know about can be applied with apply_fill() to keep the cache
+    current without another round trip. `on_refresh`, if given, is called
+    with the new positions after every successful refresh.
+    """
+
+    def __init__(self, session, base_url, on_refresh=None):
+        self.session = session
+        self.base_url = base_url
+        self.on_refresh = on_refresh
+        self.positions = {}  # ticker -> signed position
+        self.stale = True
+        self.fetches = 0  # Number of /securities round trips actually made
+
+    def refresh(self):
+        resp = self.session.get(self.base_url + '/securities')
+        if resp.ok:
+            self.positions = {item['ticker']: item['position'] for item in resp.json()}
+            self.stale = False
+            self.fetches += 1
+            if self.on_refresh is not None:
+                self.on_refresh(self.positions)
+        return self.positions
+
+    def invalidate(self):
+        self.stale = True
+
+    def apply_fill(self, ticker, quantity, action):
+        """
+        Updates a ticker's position from a known fill without refetching.
+        """
+        signed = quantity if action == 'BUY' else -quantity
+        self.positions[ticker] = self.positions.get(ticker, 0) + signed
+
+    def _current(self):
+        if self.stale:
+            self.refresh()
+        return self.positions
+
+    def position(self, ticker):
+        return self._current().get(ticker, 0)
+
+    def long(self):
+        return sum(pos for pos in self._current().values() if pos > 0)
+
+    def short(self):
+        return sum(pos for pos in self._current().values() if pos < 0)
+
+    def gross(self):
+        return sum(abs(pos) for pos in self._current().values())
+
+    def net(self):
+        return sum(self._current().values())
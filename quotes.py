@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Diff-based requoting.
+
+The strategy declares the ladder it wants on the book for each ticker; the
+QuoteManager compares that against the live orders and only cancels or adds
+the orders that differ, so resting orders keep their queue priority.
+"""
+
+from collections import Counter, defaultdict
+
+from gateway import OrderIntent
+
+
+def level_key(action, price):
+    # Prices are compared at the simulator's 0.01 increment so float noise doesn't look like a new level
+    return action, round(price, 2)
+
+
+def remaining(order):
+    return order['quantity'] - order.get('quantity_filled', 0)
+
+
+def diff_level(live_orders, want_total, lot):
+    """
+    Returns (order ids to cancel, quantities to add) for one price level.
+
+    live_orders must be oldest first. Excess is trimmed from the newest orders
+    so the oldest keep their place in the queue; a shortfall is topped up in
+    lots of at most `lot`.
+    """
+    cancels = []
+    live_total = sum(remaining(order) for order in live_orders)
+    for order in reversed(live_orders):
+        if live_total <= want_total:
+            break
+        cancels.append(order['order_id'])
+        live_total -= remaining(order)
+
+    adds = []
+    deficit = want_total - live_total
+    while deficit > 0:
+        adds.append(min(lot, deficit))
+        deficit -= adds[-1]
+    return cancels, adds
+
+
+class QuoteManager:
+    """
+    Keeps the desired ladder per ticker and reconciles it with /orders.
+
+    Cancels and additions are sent as one batch each through the OrderGateway.
+    With a recorder or a ledger attached, fills on our resting orders are
+    tracked as they are observed between syncs and passed on to both.
+    """
+
+    def __init__(self, session, base_url, tickers, gateway, recorder=None, ledger=None, max_lookups=8):
+        self.session = session
+        self.base_url = base_url
+        self.gateway = gateway
+        self.recorder = recorder
+        self.ledger = ledger
+        self.tracking = recorder is not None or ledger is not None
+        self.tracked = {}  # order_id -> [ticker, action, price, quantity, quantity_filled] of our resting orders
+        self.cancelled = set()  # Tracked orders whose cancel the server accepted
+        self.unsettled = {}  # order_id -> tracked row of cancelled orders gone from the book, fills not fetched yet
+        self.vanished = {}  # order_id -> tracked row of orders gone from the book without our cancel
+        self.max_lookups = max_lookups  # GET /orders/{id} calls one listing may spend on unsettled orders
+        self.tickers = list(tickers)
+        self.desired = {ticker: {} for ticker in self.tickers}  # ticker -> {(action, price): [total, lot]}
+        self.requested = {ticker: 0 for ticker in self.tickers}  # Orders the old cancel-and-repost loop would have sent
+        self.reads = 0  # GET /orders and /orders/{id} calls made so far
+        self.calls = defaultdict(int)  # tick -> REST calls made by sync()
+        self.saved = defaultdict(int)  # tick -> REST calls avoided versus cancel-all plus re-post
+        self.ticker_calls = Counter()  # ticker -> cancels and orders sent by the last sync
+
+    def want(self, ticker, quantity, price, action):
+        """
+        Adds quantity at price to this iteration's desired ladder for ticker.
+        """
+        level = self.desired[ticker].setdefault(level_key(action, price), [0, 0])
+        level[0] += quantity
+        level[1] = max(level[1], quantity)
+        self.requested[ticker] += 1
+
+    def discard(self, ticker):
+        """
+        Forgets this iteration's desired ladder for ticker; its live orders are left alone.
+        """
+        self.desired[ticker] = {}
+        self.requested[ticker] = 0
+
+    def live_orders(self, settle=False):
+        """
+        Returns ticker -> {(action, price): [orders oldest first]} from one /orders call.
+
+        A tracked order that left the book after we cancelled it may have
+        filled before the cancel landed, so its final state is fetched, at
+        most `max_lookups` per call. One that left without our cancel filled
+        in full, unless the case stopped and the server cancelled it; it is
+        settled as filled on the next call, which only happens if the case
+        was still running. With `settle`, for the last call once the case
+        has stopped, every such order is looked up instead.
+        """
+        live = {ticker: defaultdict(list) for ticker in self.tickers}
+        self.reads += 1
+        resp = self.session.get(self.base_url + '/orders', params={'status': 'OPEN'})
+        if resp.ok:
+            orders = sorted(resp.json(), key=lambda item: item['order_id'])
+            if self.gateway.risk is not None:
+                self.gateway.risk.reconcile_orders(orders)  # Fills on our resting orders since the last listing
+            if self.tracking:
+                self._track_fills(orders, settle)
+            for order in orders:
+                if order['ticker'] in live and order['type'] == 'LIMIT':
+                    live[order['ticker']][level_key(order['action'], order['price'])].append(order)
+        return live
+
+    def _fill(self, ticker, order_id, action, price, quantity):
+        if self.recorder is not None:
+            self.recorder.fill(ticker, order_id, action, price, quantity)
+        if self.ledger is not None:
+            self.ledger.apply(ticker, action, price, quantity, passive=True)
+
+    def _track_fills(self, orders, settle=False):
+        if not settle:
+            for order_id, (ticker, action, price, quantity, filled) in self.vanished.items():
+                if quantity > filled:
+                    self._fill(ticker, order_id, action, price, quantity - filled)
+            self.vanished = {}
+        open_ids = set()
+        for order in orders:
+            if order['ticker'] not in self.desired:
+                continue  # Another process's ticker
+            order_id = order['order_id']
+            open_ids.add(order_id)
+            tracked = self.tracked.get(order_id)
+            if tracked is None:
+                self.tracked[order_id] = [order['ticker'], order['action'], order['price'], order['quantity'],
+                                          order['quantity_filled']]
+            elif order['quantity_filled'] > tracked[4]:
+                self._fill(tracked[0], order_id, tracked[1], tracked[2], order['quantity_filled'] - tracked[4])
+                tracked[4] = order['quantity_filled']
+        for order_id in [order_id for order_id in self.tracked if order_id not in open_ids]:
+            row = self.tracked.pop(order_id)
+            if order_id in self.cancelled:
+                self.cancelled.discard(order_id)
+                self.unsettled[order_id] = row
+            else:
+                self.vanished[order_id] = row
+        if settle:
+            self.unsettled.update(self.vanished)
+            self.vanished = {}
+
+        # Oldest first; the rest wait for the next listing
+        lookups = list(self.unsettled)[:None if settle else self.max_lookups]
+        self.reads += len(lookups)
+        final = self.gateway.executor.map(self._final_state, lookups)
+        for order_id, order in zip(lookups, final):
+            ticker, action, price, quantity, filled = self.unsettled.pop(order_id)
+            self.ticker_calls[ticker] += 1
+            total = order['quantity_filled'] if order is not None else filled  # Failed: count only the fills we saw
+            if total > filled:
+                self._fill(ticker, order_id, action, price, total - filled)
+
+    def _final_state(self, order_id):
+        resp = self.session.get(self.base_url + '/orders/' + str(order_id))
+        if resp.ok:
+            return resp.json()
+
+    def plan(self, ticker, live):
+        """
+        Returns (order ids to cancel, [(quantity, price, action)] to add) for ticker.
+        """
+        cancels = []
+        adds = []
+        desired = self.desired[ticker]
+        for key, orders in live.items():
+            if key not in desired:
+                cancels.extend(order['order_id'] for order in orders)  # Stale level, nothing wanted here any more
+        for (action, price), (total, lot) in desired.items():
+            level_cancels, level_adds = diff_level(live.get((action, price), []), total, lot)
+            cancels.extend(level_cancels)
+            adds.extend((quantity, price, action) for quantity in level_adds)
+        return cancels, adds
+
+    def sync(self, tick, tickers=None):
+        """
+        Brings the live orders of `tickers` (all by default) in line with their
+        desired ladders, then clears those ladders. Other tickers' orders are left as they are.
+        """
+        tickers = self.tickers if tickers is None else tickers
+        reads = self.reads
+        self.ticker_calls = Counter()
+        live = self.live_orders()
+        baseline = 1 + sum(self.requested[ticker] for ticker in tickers)  # The old loop sent one cancel and re-posted every order
+        cancels = []
+        intents = []
+        for ticker in tickers:
+            ticker_cancels, adds = self.plan(ticker, live[ticker])
+            cancels.extend(ticker_cancels)
+            intents.extend(OrderIntent(ticker, 'LIMIT', quantity, price, action) for quantity, price, action in adds)
+            self.ticker_calls[ticker] += len(ticker_cancels)
+            self.discard(ticker)
+
+        # Cancels go first so the additions are not rejected against exposure we are about to release
+        accepted = self.gateway.cancel(cancels)
+        if self.tracking:  # Cancelled orders stay tracked: they may have filled before the cancel landed
+            self.cancelled.update(order_id for order_id, ok in zip(cancels, accepted)
+                                  if ok and order_id in self.tracked)
+        results = self.gateway.submit(intents)
+        self.ticker_calls.update(result.intent.ticker for result in results)
+        if self.tracking:
+            for result in results:
+                if result.status == 'OPEN':
+                    intent = result.intent
+                    self.tracked[result.order_id] = [intent.ticker, intent.action, intent.price, intent.quantity,
+                                                     result.quantity_filled]
+        sent = sum(result.status_code is not None for result in results)  # Vetoed and dropped orders made no request
+        calls = self.reads - reads + len(cancels) + sent
+        self.saved[tick] += baseline - calls
+        self.calls[tick] += calls
+        return calls
+
+    def export(self):
+        """
+        Returns the tracked orders, and the closed ones still to settle, for a checkpoint.
+        """
+        return {'tracked': {order_id: list(order) for order_id, order in self.tracked.items()},
+                'cancelled': list(self.cancelled),
+                'unsettled': {order_id: list(order) for order_id, order in self.unsettled.items()},
+                'vanished': {order_id: list(order) for order_id, order in self.vanished.items()}}
+
+    def restore(self, exported):
+        """
+        Resumes tracking a checkpoint's orders; the next live_orders() settles whatever happened to them since.
+        """
+        if self.tracking:
+            self.tracked.update((int(order_id), list(order)) for order_id, order in exported['tracked'].items())
+            self.cancelled.update(exported.get('cancelled', ()))
+            for name in ('unsettled', 'vanished'):
+                getattr(self, name).update((int(order_id), list(order))
+                                           for order_id, order in exported.get(name, {}).items())
+
+    def report(self, tick):
+        return 'tick %d: %d quote calls, %d saved' % (tick, self.calls.get(tick, 0), self.saved.get(tick, 0))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Tick-data recorder.
+
+Captures book snapshots, the time-and-sales tape, our orders and our fills in
+an append-only columnar store: one raw binary file per column, so a recording
+can be memory-mapped and read back as NumPy arrays without copying.
+
+    <root>/tickers.json
+    <root>/<table>/schema.json
+    <root>/<table>/<column>.bin
+
+Hot-path calls only put a tuple on a bounded queue; conversion and disk writes
+happen on a background writer thread. When the queue is full the record is
+dropped and counted rather than blocking the quoting loop.
+"""
+
+import json
+import os
+import queue
+import threading
+from time import time
+
+import numpy as np
+
+ACTIONS = {'BUY': 1, 'SELL': -1}
+ORDER_TYPES = {'LIMIT': 0, 'MARKET': 1}
+ORDER_STATUSES = {'OPEN': 0, 'TRANSACTED': 1, 'CANCELLED': 2, 'REJECTED': 3}
+
+
+def schemas(depth):
+    """
+    Column name -> (dtype, width) per table; width > 1 stores a fixed-size row per record.
+    """
+    common = {'ts': ('f8', 1), 'tick': ('i4', 1), 'ticker': ('u1', 1)}
+    return {
+        'books': dict(common, bid_px=('f8', depth), bid_qty=('f8', depth), ask_px=('f8', depth), ask_qty=('f8', depth)),
+        'tas': dict(common, trade_id=('i8', 1), price=('f8', 1), quantity=('f8', 1)),
+        'orders': dict(common, order_id=('i8', 1), action=('i1', 1), type=('u1', 1), price=('f8', 1),
+                       quantity=('f8', 1), status=('u1', 1)),
+        'fills': dict(common, order_id=('i8', 1), action=('i1', 1), price=('f8', 1), quantity=('f8', 1)),
+    }
+
+
+def book_levels(side, depth):
+    """
+    Returns (prices, remaining quantities) of the top `depth` price levels of one raw book side, NaN/0 padded.
+
+    The API lists individual orders in price priority; entries at the same
+    price are summed into one level before the side is cut to `depth`.
+    """
+    prices = np.full(depth, np.nan)
+    quantities = np.zeros(depth)
+    level = -1
+    for item in side:
+        if level < 0 or item['price'] != prices[level]:
+            level += 1
+            if level == depth:
+                break
+            prices[level] = item['price']
+        quantities[level] += item['quantity'] - item.get('quantity_filled', 0)
+    return prices, quantities
+
+
+class Recorder:
+    """
+    Background writer for one recording directory.
+
+    Set `tick` as the loop advances; records that don't pass a tick use it.
+    """
+
+    def __init__(self, root, tickers, depth=10, queue_size=100000, batch=512):
+        self.root = root
+        self.tickers = {ticker: index for index, ticker in enumerate(tickers)}
+        self.depth = depth
+        self.batch = batch
+        self.tick = 0
+        self.dropped = 0
+        self.schemas = schemas(depth)
+        self.queue = queue.Queue(maxsize=queue_size)
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, 'tickers.json'), 'w') as f:
+            json.dump(list(tickers), f)
+        self.files = {}
+        for table, schema in self.schemas.items():
+            os.makedirs(os.path.join(root, table), exist_ok=True)
+            with open(os.path.join(root, table, 'schema.json'), 'w') as f:
+                json.dump(schema, f)
+            self.files[table] = {column: open(os.path.join(root, table, column + '.bin'), 'ab') for column in schema}
+        self.writer = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self.writer.start()
+
+    # --- Hot path: enqueue only ------------------------------------------
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def book(self, ticker, book, tick=None):
+        """
+        Records one raw /securities/book response.
+        """
+        self._put(('books', time(), self.tick if tick is None else tick, ticker, book))
+
+    def tape(self, ticker, prints, tick=None):
+        """
+        Records a batch of /securities/tas prints.
+        """
+        if prints:
+            self._put(('tas', time(), self.tick if tick is None else tick, ticker, prints))
+
+    def order(self, ticker, order_id, action, order_type, price, quantity, status, tick=None):
+        self._put(('orders', time(), self.tick if tick is None else tick, ticker,
+                   (order_id, action, order_type, price, quantity, status)))
+
+    def fill(self, ticker, order_id, action, price, quantity, tick=None):
+        self._put(('fills', time(), self.tick if tick is None else tick, ticker, (order_id, action, price, quantity)))
+
+    # --- Writer thread -----------------------------------------------------
+
+    def _rows(self, table, ts, tick, ticker, payload):
+        base = {'ts': ts, 'tick': tick, 'ticker': self.tickers[ticker]}
+        if table == 'books':
+            bid_px, bid_qty = book_levels(payload['bids'], self.depth)
+            ask_px, ask_qty = book_levels(payload['asks'], self.depth)
+            return [dict(base, bid_px=bid_px, bid_qty=bid_qty, ask_px=ask_px, ask_qty=ask_qty)]
+        if table == 'tas':
+            return [dict(base, trade_id=item['id'], price=item['price'], quantity=item['quantity']) for item in payload]
+        if table == 'orders':
+            order_id, action, order_type, price, quantity, status = payload
+            return [dict(base, order_id=order_id or -1, action=ACTIONS[action], type=ORDER_TYPES[order_type],
+                         price=np.nan if price is None else price, quantity=quantity,
+                         status=ORDER_STATUSES.get(status, ORDER_STATUSES['REJECTED']))]
+        order_id, action, price, quantity = payload
+        return [dict(base, order_id=order_id, action=ACTIONS[action], price=price, quantity=quantity)]
+
+    def _write(self, items):
+        rows = {table: [] for table in self.schemas}
+        for item in items:
+            rows[item[0]].extend(self._rows(*item))
+        for table, table_rows in rows.items():
+            if not table_rows:
+                continue
+            for column, (dtype, width) in self.schemas[table].items():
+                values = np.asarray([row[column] for row in table_rows], dtype=dtype)
+                self.files[table][column].write(values.tobytes())
+        for columns in self.files.values():
+            for f in columns.values():
+                f.flush()
+
+    def _run(self):
+        running = True
+        while running:
+            items = [self.queue.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                items = [item for item in items if item is not None]
+                running = False
+            self._write(items)
+
+    def close(self):
+        """
+        Drains the queue, writes everything still pending and closes the files.
+        """
+        self.queue.put(None)
+        self.writer.join()
+        for columns in self.files.values():
+            for f in columns.values():
+                f.close()
+
+
+def load(root):
+    """
+    Opens a recording read-only: returns (tickers, {table: {column: np.memmap}}).
+
+    Every column of a table is trimmed to the shortest one, so a recording cut
+    off mid-write still reads back with aligned rows.
+    """
+    with open(os.path.join(root, 'tickers.json')) as f:
+        tickers = json.load(f)
+    tables = {}
+    for table in sorted(os.listdir(root)):
+        schema_path = os.path.join(root, table, 'schema.json')
+        if not os.path.exists(schema_path):
+            continue
+        with open(schema_path) as f:
+            schema = json.load(f)
+        sizes = {column: os.path.getsize(os.path.join(root, table, column + '.bin')) // (np.dtype(dtype).itemsize * width)
+                 for column, (dtype, width) in schema.items()}
+        rows = min(sizes.values())
+        columns = {}
+        for column, (dtype, width) in schema.items():
+            path = os.path.join(root, table, column + '.bin')
+            if rows == 0:
+                columns[column] = np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+            else:
+                columns[column] = np.memmap(path, dtype=dtype, mode='r', shape=(rows, width) if width > 1 else (rows,))
+        tables[table] = columns
+    return tickers, tables
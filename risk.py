@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+In-process pre-trade risk engine.
+
+Keeps per-ticker positions, the quantity resting in our open orders and the
+resulting gross/net exposure in memory, updated incrementally from order
+acks, observed fills and cancels, so every order can be approved, resized or
+vetoed before an HTTP request is spent on it.
+
+Limits are checked against the worst case: every resting order on one side
+filling. A ticker's worst-case gross contribution is
+max(|position + resting buys|, |position - resting sells|), and the net
+worst cases are net + all resting buys and net - all resting sells. An order
+is cut down to the largest size that keeps the worst case inside the limits;
+orders that cannot make the worst case any worse are always allowed, so
+unwinds still go out when the book is at its limit.
+
+Between /securities refreshes positions are advanced by acks and fills we
+observe; each refresh replaces them with the server's figures.
+
+With a FillLedger and a drawdown limit set, orders that would leave a
+larger absolute position, opening one from flat included, are vetoed while
+PnL is more than `max_drawdown` below its peak; orders that reduce a
+position still go out.
+"""
+
+import threading
+from collections import namedtuple
+
+Check = namedtuple('Check', ['quantity', 'reason'])
+
+
+class RiskEngine:
+    """
+    Pre-trade checks against gross, long/short net and per-order limits.
+
+    check() reserves the approved quantity as resting exposure until the ack
+    (on_ack) turns it into an open order, a fill or nothing. Thread-safe:
+    acks arrive on the gateway's worker threads.
+    """
+
+    def __init__(self, tickers, gross_limit=250000, long_limit=250000, short_limit=-250000, order_limit=5000,
+                 min_quantity=100, ledger=None, max_drawdown=None):
+        self.gross_limit = gross_limit
+        self.long_limit = long_limit
+        self.short_limit = short_limit
+        self.order_limit = order_limit
+        self.min_quantity = min_quantity  # Resized orders smaller than this are vetoed instead
+        self.ledger = ledger
+        self.max_drawdown = max_drawdown
+        self.lock = threading.Lock()
+        self.position = {ticker: 0 for ticker in tickers}
+        self.buys = {ticker: 0 for ticker in tickers}  # Resting and reserved buy quantity
+        self.sells = {ticker: 0 for ticker in tickers}
+        self.orders = {}  # order_id -> [ticker, action, remaining]
+        self.contribution = {ticker: 0 for ticker in tickers}  # Worst-case gross per ticker
+        self.worst_gross = 0
+        self.net = 0
+        self.total_buys = 0
+        self.total_sells = 0
+        self.vetoed = 0
+        self.resized = 0
+
+    # --- Incremental state ----------------------------------------------------
+
+    def _update(self, ticker, position=0, buys=0, sells=0):
+        # Every change goes through here so the totals stay O(1) to maintain
+        self.position[ticker] += position
+        self.buys[ticker] += buys
+        self.sells[ticker] += sells
+        self.net += position
+        self.total_buys += buys
+        self.total_sells += sells
+        current = self.position[ticker]
+        contribution = max(abs(current + self.buys[ticker]), abs(current - self.sells[ticker]))
+        self.worst_gross += contribution - self.contribution[ticker]
+        self.contribution[ticker] = contribution
+
+    def _resting(self, action, quantity):
+        return (quantity, 0) if action == 'BUY' else (0, quantity)
+
+    def check(self, ticker, quantity, action):
+        """
+        Returns Check(approved quantity, reason); quantity 0 is a veto.
+
+        The approved quantity is reserved until on_ack() or release().
+        """
+        with self.lock:
+            position, buys, sells = self.position[ticker], self.buys[ticker], self.sells[ticker]
+            signed = quantity if action == 'BUY' else -quantity
+            # From flat either side adds; an order that overshoots flat adds once it is past it
+            if self.max_drawdown is not None and self.ledger is not None and abs(position + signed) > abs(position) \
+                    and self.ledger.drawdown() > self.max_drawdown:
+                self.vetoed += 1
+                return Check(0, 'drawdown')
+            current = self.contribution[ticker]
+            # Largest |worst case| this ticker may reach without breaching the gross limit
+            ceiling = max(self.gross_limit - (self.worst_gross - current), current)
+            if action == 'BUY':
+                gross_room = ceiling - (position + buys)
+                net_room = self.long_limit - (self.net + self.total_buys)
+            else:
+                gross_room = ceiling + (position - sells)
+                net_room = (self.net - self.total_sells) - self.short_limit
+            approved = int(min(quantity, self.order_limit, gross_room, net_room))
+            if approved < quantity:
+                if approved < min(self.min_quantity, quantity):
+                    self.vetoed += 1
+                    return Check(0, 'gross' if gross_room <= net_room else 'net')
+                self.resized += 1
+            self._update(ticker, 0, *self._resting(action, approved))
+            return Check(approved, None if approved == quantity else 'resized')
+
+    def release(self, ticker, quantity, action):
+        """
+        Returns a reservation that was never sent or was rejected.
+        """
+        with self.lock:
+            buys, sells = self._resting(action, quantity)
+            self._update(ticker, 0, -buys, -sells)
+
+    def on_ack(self, ticker, quantity, action, order_id, status, quantity_filled):
+        """
+        Converts a reservation of `quantity` into the acked order's fill and resting remainder.
+        """
+        with self.lock:
+            buys, sells = self._resting(action, quantity)
+            self._update(ticker, 0, -buys, -sells)
+            if quantity_filled:
+                self._update(ticker, quantity_filled if action == 'BUY' else -quantity_filled)
+            remaining = quantity - quantity_filled
+            if status == 'OPEN' and remaining > 0:
+                self.orders[order_id] = [ticker, action, remaining]
+                self._update(ticker, 0, *self._resting(action, remaining))
+
+    def on_fill(self, order_id, quantity):
+        """
+        Applies a fill on one of our resting orders.
+        """
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return
+            ticker, action, remaining = order
+            quantity = min(quantity, remaining)
+            buys, sells = self._resting(action, quantity)
+            self._update(ticker, buys - sells, -buys, -sells)
+            order[2] -= quantity
+            if order[2] <= 0:
+                del self.orders[order_id]
+
+    def adopt(self, order_id, ticker, action, remaining):
+        """
+        Starts tracking a resting order that was not acked through this engine.
+        """
+        with self.lock:
+            if order_id not in self.orders and remaining > 0:
+                self.orders[order_id] = [ticker, action, remaining]
+                self._update(ticker, 0, *self._resting(action, remaining))
+
+    def on_cancel(self, order_id):
+        """
+        Releases the remainder of a cancelled order.
+        """
+        with self.lock:
+            order = self.orders.pop(order_id, None)
+            if order is not None:
+                ticker, action, remaining = order
+                buys, sells = self._resting(action, remaining)
+                self._update(ticker, 0, -buys, -sells)
+
+    def reconcile_orders(self, orders):
+        """
+        Applies fills seen in an /orders?status=OPEN listing and forgets our orders that are no longer open.
+
+        Open orders the engine has never seen, such as those left by a run
+        that crashed, are adopted so their exposure counts against the limits.
+        """
+        open_ids = set()
+        for order in orders:  # Locking is left to on_fill/on_cancel/adopt
+            order_id = order['order_id']
+            open_ids.add(order_id)
+            tracked = self.orders.get(order_id)
+            if tracked is None:
+                if order['ticker'] in self.position:
+                    self.adopt(order_id, order['ticker'], order['action'], order['quantity'] - order['quantity_filled'])
+            else:
+                filled = tracked[2] - (order['quantity'] - order['quantity_filled'])
+                if filled > 0:
+                    self.on_fill(order_id, filled)
+        for order_id in [order_id for order_id in list(self.orders) if order_id not in open_ids]:
+            self.on_cancel(order_id)  # Filled or cancelled; a fill shows up in the next position refresh
+
+    def reconcile_positions(self, positions):
+        """
+        Replaces positions with the server's figures (ticker -> position).
+        """
+        with self.lock:
+            for ticker, position in positions.items():
+                if ticker in self.position:
+                    self._update(ticker, position - self.position[ticker])
+
+    # --- Headroom -------------------------------------------------------------
+
+    def gross(self):
+        return sum(abs(position) for position in self.position.values())
+
+    def headroom(self):
+        """
+        Returns (gross, long net, short net) headroom against the limits from current positions.
+        """
+        return self.gross_limit - self.gross(), self.long_limit - self.net, self.net - self.short_limit
+
+    def unwind_quantity(self, ticker, soft=0.8):
+        """
+        Signed quantity to trade in ticker to bring exposure back under `soft` of the limits, 0 if within them.
+
+        The excess is taken from this ticker in proportion to its share of the
+        gross position, capped at its position and the order limit.
+        """
+        with self.lock:
+            position = self.position[ticker]
+            if not position:
+                return 0
+            gross = self.gross()
+            excess = gross - soft * self.gross_limit
+            if position > 0:
+                excess = max(excess * position / gross, self.net - soft * self.long_limit)
+            else:
+                excess = max(excess * -position / gross, soft * self.short_limit - self.net)
+            if excess <= 0:
+                return 0
+            quantity = int(min(excess, abs(position), self.order_limit))
+            return -quantity if position > 0 else quantity
+
+    def report(self):
+        return 'risk gross %d (worst %d) net %d, %d vetoed, %d resized' % (
+            self.gross(), self.worst_gross, self.net, self.vetoed, self.resized)
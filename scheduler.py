@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven quoting scheduler.
+
+Instead of requoting every ticker on every pass, the scheduler wakes a
+ticker's quoting task only when something it decides on has changed since it
+last ran: its top of book, its position or the tick. Changes that arrive
+while a ticker is waiting are coalesced into one run on the latest state.
+
+Each ticker has a Budget: how many times it may requote per tick, how many
+order/cancel requests it may spend per tick, and how old the snapshot behind
+its decision may be when the orders go out. A quiet ticker therefore never
+takes request capacity from a busy one, and a decision made on a stale book
+is dropped and redone on the next snapshot rather than sent.
+"""
+
+from collections import defaultdict, namedtuple
+from time import perf_counter, sleep
+
+Budget = namedtuple('Budget', ['runs_per_tick', 'requests_per_tick', 'latency'])
+
+DEFAULT_BUDGET = Budget(runs_per_tick=4, requests_per_tick=60, latency=0.25)
+
+
+class QuotingScheduler:
+    """
+    Decides which tickers to requote after each snapshot.
+
+    `due()` returns the tickers to run, busiest budget first; `expired()`
+    drops those whose decision is over their latency budget, and `spent()`
+    charges the requests a sync made to each ticker.
+    """
+
+    def __init__(self, tickers, budgets=None, default=DEFAULT_BUDGET, idle=0.01):
+        self.tickers = list(tickers)
+        self.budgets = {ticker: (budgets or {}).get(ticker, default) for ticker in self.tickers}
+        self.idle_wait = idle  # Pause before polling again when nothing changed
+        self.seen = {ticker: None for ticker in self.tickers}  # State each ticker last quoted on
+        self.runs = {ticker: 0 for ticker in self.tickers}  # Runs and requests this tick
+        self.requests = {ticker: 0 for ticker in self.tickers}
+        self.tick = None
+        self.wakeups = defaultdict(int)  # ticker -> runs over the case
+        self.coalesced = defaultdict(int)  # ticker -> passes where a change waited on the budget
+        self.late = defaultdict(int)  # ticker -> decisions dropped for exceeding the latency budget
+
+    def fingerprint(self, snapshot, ticker, position):
+        quote = snapshot.quotes[ticker]
+        if quote is None:
+            return None
+        return snapshot.tick, quote.bid, quote.ask, position
+
+    def due(self, snapshot, position):
+        """
+        Returns the tickers whose state changed and that still have budget this tick.
+
+        `position` is a callable ticker -> current position.
+        """
+        if snapshot.tick != self.tick:
+            self.tick = snapshot.tick
+            for ticker in self.tickers:
+                self.runs[ticker] = 0
+                self.requests[ticker] = 0
+        due = []
+        for ticker in self.tickers:
+            state = self.fingerprint(snapshot, ticker, position(ticker))
+            if state is None or state == self.seen[ticker]:
+                continue
+            budget = self.budgets[ticker]
+            if self.runs[ticker] >= budget.runs_per_tick or self.requests[ticker] >= budget.requests_per_tick:
+                self.coalesced[ticker] += 1  # Picked up on the next tick's first pass
+                continue
+            self.seen[ticker] = state
+            self.runs[ticker] += 1
+            self.wakeups[ticker] += 1
+            due.append(ticker)
+        due.sort(key=lambda ticker: self.budgets[ticker].requests_per_tick - self.requests[ticker], reverse=True)
+        return due
+
+    def expired(self, snapshot, tickers):
+        """
+        Returns the tickers whose latency budget the snapshot has outlived; they are rescheduled.
+        """
+        age = perf_counter() - snapshot.received
+        late = [ticker for ticker in tickers if age > self.budgets[ticker].latency]
+        for ticker in late:
+            self.seen[ticker] = None
+            self.runs[ticker] -= 1
+            self.late[ticker] += 1
+        return late
+
+    def spent(self, calls):
+        """
+        Charges ticker -> requests from the last sync against this tick's budgets.
+        """
+        for ticker, count in calls.items():
+            self.requests[ticker] += count
+
+    def idle(self):
+        sleep(self.idle_wait)
+
+    def report(self):
+        return ', '.join('%s %d runs/%d coalesced/%d late' % (ticker, self.wakeups[ticker], self.coalesced[ticker],
+                                                               self.late[ticker]) for ticker in self.tickers)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-asset signal matrix.
+
+Keeps the last `window` one-tick log returns of every ticker as one
+(window x tickers) ring buffer, with the running sum of the return vectors
+and of their outer products. Committing a tick adds the new row's outer
+product and subtracts the one leaving the window, so the covariance,
+correlation and beta matrices cost one small matrix update per tick however
+many tickers are quoted. They are derived from the sums on first use and
+cached until the next commit.
+
+Samples follow timeseries.Series: one per tick, repeated updates within a
+tick overwrite the pending one. A ticker whose price is missing on a tick
+adds a zero return, and its next return spans the gap.
+
+Once per pass revalue() takes the current positions and computes, with one
+matrix-vector product:
+
+    risk          standard deviation of the book's dollar PnL over one tick
+    exposure      per ticker, the shares of that ticker alone whose PnL best
+                  tracks the whole book, i.e. the position plus every other
+                  position weighted by its hedge ratio onto the ticker; equals
+                  the position when the tickers are uncorrelated
+    contribution  per ticker, its share of `risk` (they sum to `risk`); a
+                  negative one means the position hedges the rest of the book
+
+Until `min_samples` returns are in, exposures are the plain positions and
+contributions are zero.
+"""
+
+from math import nan, sqrt
+
+import numpy as np
+
+
+class SignalMatrix:
+    """
+    Rolling return covariance of `tickers`, and the book's risk seen through it.
+    """
+
+    def __init__(self, tickers, window=60, min_samples=10):
+        self.tickers = list(tickers)
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        size = len(self.tickers)
+        self.window = window
+        self.min_samples = max(min_samples, 2)
+        self.returns = np.zeros((window, size))
+        self.total = np.zeros(size)  # Sum of the returns in the window
+        self.cross = np.zeros((size, size))  # Sum of their outer products
+        self.count = 0  # Returns committed so far; the next one goes to slot count % window
+        self.prices = np.full(size, nan)  # Last price committed per ticker
+        self.tick = None  # Tick of the pending sample
+        self.pending = None
+        self.cached = -1  # self.count the cached matrices were derived at
+        self._covariance = None
+        self.risk = 0.0
+        self.exposures = np.zeros(size)
+        self.contributions = np.zeros(size)
+
+    # --- Samples --------------------------------------------------------------
+
+    def update(self, tick, prices):
+        """
+        Sets the prices for `tick`, in ticker order; a new tick commits the previous one. Older ticks are ignored.
+        """
+        if self.tick is not None and tick < self.tick:
+            return
+        if self.tick is not None and tick > self.tick:
+            self._commit(self.pending)
+        self.tick = tick
+        self.pending = np.asarray(prices, dtype=float)
+
+    def observe(self, snapshot):
+        """
+        Takes the mid of every ticker's book in `snapshot`; tickers without a two-sided book count as missing.
+        """
+        quotes = snapshot.quotes
+        mids = [nan if quotes.get(ticker) is None else (quotes[ticker].bid + quotes[ticker].ask) / 2
+                for ticker in self.tickers]
+        self.update(snapshot.tick, mids)
+
+    def _commit(self, prices):
+        valid = ~np.isnan(prices) & (prices > 0)
+        known = valid & ~np.isnan(self.prices)
+        if known.any():
+            row = np.zeros(len(self.tickers))
+            row[known] = np.log(prices[known] / self.prices[known])
+            slot = self.count % self.window
+            old = self.returns[slot]
+            self.total += row - old  # The slot still holds zeros until the window first fills
+            self.cross += np.outer(row, row) - np.outer(old, old)
+            self.returns[slot] = row
+            self.count += 1
+            if self.count % self.window == 0:
+                self._resum()
+        self.prices[valid] = prices[valid]
+
+    def _resum(self):
+        # Rebuilds the sums from the buffer once per lap so float drift stays bounded
+        self.total = self.returns.sum(axis=0)
+        self.cross = self.returns.T @ self.returns
+
+    # --- Matrices ---------------------------------------------------------------
+
+    def samples(self):
+        return min(self.count, self.window)
+
+    def covariance(self):
+        """
+        Covariance of one-tick log returns, tickers x tickers; None until min_samples returns are in.
+        """
+        if self.cached != self.count:
+            samples = self.samples()
+            if samples < self.min_samples:
+                self._covariance = None
+            else:
+                mean = self.total / samples
+                self._covariance = (self.cross - samples * np.outer(mean, mean)) / (samples - 1)
+            self.cached = self.count
+        return self._covariance
+
+    def correlation(self):
+        covariance = self.covariance()
+        if covariance is None:
+            return None
+        deviation = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+        scale = np.outer(deviation, deviation)
+        return np.divide(covariance, scale, out=np.zeros_like(covariance), where=scale > 0)
+
+    def betas(self):
+        """
+        betas[i, j]: regression slope of ticker i's returns on ticker j's.
+        """
+        covariance = self.covariance()
+        if covariance is None:
+            return None
+        variance = np.diag(covariance)
+        return np.divide(covariance, variance, out=np.zeros_like(covariance), where=variance > 0)
+
+    def hedge_ratio(self, ticker, hedge):
+        """
+        Shares of `hedge` to hold against each share of `ticker` to offset it, 0.0 before min_samples returns.
+        """
+        betas = self.betas()
+        i, j = self.index[ticker], self.index[hedge]
+        if betas is None or not self.prices[j] > 0:
+            return 0.0
+        return -betas[i, j] * self.prices[i] / self.prices[j]
+
+    # --- Book risk --------------------------------------------------------------
+
+    def revalue(self, position):
+        """
+        Recomputes risk, exposures and contributions for the positions `position(ticker)` returns.
+        """
+        shares = np.array([position(ticker) or 0.0 for ticker in self.tickers], dtype=float)
+        covariance = self.covariance()
+        prices = np.nan_to_num(self.prices)
+        if covariance is None or not prices.all():
+            self.risk = 0.0
+            self.exposures = shares
+            self.contributions = np.zeros(len(self.tickers))
+            return self.risk
+        dollars = shares * prices
+        marginal = covariance @ dollars  # Covariance of each ticker's return with the book's dollar PnL
+        variance = float(dollars @ marginal)
+        self.risk = sqrt(variance) if variance > 0 else 0.0
+        diagonal = np.diag(covariance)
+        self.exposures = np.divide(marginal, diagonal * prices, out=shares.copy(), where=diagonal > 0)
+        self.contributions = dollars * marginal / self.risk if self.risk else np.zeros(len(self.tickers))
+        return self.risk
+
+    def exposure(self, ticker):
+        return float(self.exposures[self.index[ticker]])
+
+    def contribution(self, ticker):
+        return float(self.contributions[self.index[ticker]])
+
+    # --- Checkpoints ------------------------------------------------------------
+
+    def export(self):
+        """
+        Returns (tick, committed returns oldest first, last prices, pending prices).
+        """
+        kept = self.samples()
+        slots = [index % self.window for index in range(self.count - kept, self.count)]
+        pending = None if self.pending is None else self.pending.tolist()
+        return self.tick, self.returns[slots].tolist(), self.prices.tolist(), pending
+
+    def restore(self, exported):
+        """
+        Loads an export() into this (empty) matrix; the sums are rebuilt from the returns.
+        """
+        tick, returns, prices, pending = exported
+        rows = np.asarray(returns, dtype=float)[-self.window:].reshape(-1, len(self.tickers))
+        self.returns[:] = 0.0
+        self.returns[:len(rows)] = rows
+        self.count = len(rows)
+        self._resum()
+        self.cached = -1
+        self.prices = np.asarray(prices, dtype=float)
+        self.tick = tick
+        self.pending = None if pending is None else np.asarray(pending, dtype=float)
+
+    def report(self):
+        correlation = self.correlation()
+        if correlation is None:
+            return 'signals %d returns, too few for a covariance' % self.count
+        pairs = ['%s/%s %+.2f' % (self.tickers[i], self.tickers[j], correlation[i, j])
+                 for i in range(len(self.tickers)) for j in range(i + 1, len(self.tickers))]
+        return 'signals %d returns, book risk %.0f per tick, correlation %s' % (self.count, self.risk, ', '.join(pairs))
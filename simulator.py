@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+"""
+Local RIT-compatible case simulator.
+
+Serves the subset of the RIT client REST API that algorithm.py uses, backed by
+a price-time-priority matching engine, background liquidity and the fee,
+rebate and limit table from the README. Point BASE_URL at it (it listens on
+the RIT default port, 9999) to run, profile or load-test the strategy offline:
+
+    python simulator.py --tick-seconds 0.01 --seed 7
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Case parameters from the README; starting levels and per-tick volatility stand in for High/Medium/Low
+SECURITIES = {
+    'OWL':  {'start': 50.00, 'volatility': 0.02, 'fee': 0.03,  'rebate': 0.04},
+    'CROW': {'start': 45.00, 'volatility': 0.05, 'fee': -0.02, 'rebate': -0.03},
+    'DOVE': {'start': 10.00, 'volatility': 0.08, 'fee': -0.03, 'rebate': -0.04},
+    'DUCK': {'start': 25.00, 'volatility': 0.05, 'fee': 0.02,  'rebate': 0.03},
+}
+MAX_ORDER_SIZE = 5000
+GROSS_LIMIT = 250000
+NET_LIMIT = 250000
+TRADER_ID = 'algo'  # Every API request trades as the same trader, like a single RIT client
+
+
+class SimulatorError(Exception):
+    """
+    Rejection surfaced to the client as an HTTP error with RIT's {code, message} body.
+    """
+
+    def __init__(self, status, code, message, wait=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.wait = wait
+
+
+class Order:
+    __slots__ = ('order_id', 'tick', 'trader_id', 'ticker', 'type', 'quantity', 'action', 'price',
+                 'quantity_filled', 'notional', 'status')
+
+    def __init__(self, order_id, tick, trader_id, ticker, order_type, quantity, action, price):
+        self.order_id = order_id
+        self.tick = tick
+        self.trader_id = trader_id
+        self.ticker = ticker
+        self.type = order_type
+        self.quantity = quantity
+        self.action = action
+        self.price = price
+        self.quantity_filled = 0
+        self.notional = 0.0
+        self.status = 'OPEN'
+
+    @property
+    def remaining(self):
+        return self.quantity - self.quantity_filled
+
+    def to_json(self):
+        return {
+            'order_id': self.order_id,
+            'period': 1,
+            'tick': self.tick,
+            'trader_id': self.trader_id,
+            'ticker': self.ticker,
+            'type': self.type,
+            'quantity': self.quantity,
+            'action': self.action,
+            'price': self.price,
+            'quantity_filled': self.quantity_filled,
+            'vwap': round(self.notional / self.quantity_filled, 4) if self.quantity_filled else None,
+            'status': self.status,
+        }
+
+
+class OrderBook:
+    """
+    One ticker's resting orders, best price first and oldest first within a price.
+    """
+
+    def __init__(self):
+        self.bids = []
+        self.bid_keys = []  # (-price, order_id) kept parallel to bids for bisect
+        self.asks = []
+        self.ask_keys = []  # (price, order_id)
+
+    def _side(self, action):
+        return (self.bids, self.bid_keys) if action == 'BUY' else (self.asks, self.ask_keys)
+
+    def _key(self, order):
+        return (-order.price if order.action == 'BUY' else order.price, order.order_id)
+
+    def add(self, order):
+        orders, keys = self._side(order.action)
+        key = self._key(order)
+        index = bisect.bisect(keys, key)
+        keys.insert(index, key)
+        orders.insert(index, order)
+
+    def remove(self, order):
+        orders, keys = self._side(order.action)
+        index = bisect.bisect_left(keys, self._key(order))
+        if index < len(keys) and orders[index] is order:
+            del keys[index]
+            del orders[index]
+
+    def opposite(self, action):
+        return self.asks if action == 'BUY' else self.bids
+
+
+class Account:
+    """
+    Position, average cost, realized PnL and fee/rebate cash for one trader and ticker.
+    """
+
+    def __init__(self):
+        self.position = 0
+        self.cost = 0.0  # Average price of the open position
+        self.realized = 0.0
+        self.fees = 0.0  # Net fee/rebate cash, positive when we were paid
+
+    def apply(self, signed_quantity, price):
+        position = self.position
+        if position == 0 or (position > 0) == (signed_quantity > 0):
+            total = position + signed_quantity
+            self.cost = (self.cost * position + price * signed_quantity) / total
+            self.position = total
+            return
+        closing = min(abs(signed_quantity), abs(position))
+        direction = 1 if position > 0 else -1
+        self.realized += closing * (price - self.cost) * direction
+        self.position = position + signed_quantity
+        if self.position == 0:
+            self.cost = 0.0
+        elif (self.position > 0) != (position > 0):
+            self.cost = price  # Flipped through flat; the remainder opens at this price
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def take(self):
+        """
+        Returns 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Simulator:
+    """
+    Matching engine, case clock and background market for one trading period.
+    """
+
+    def __init__(self, ticks=600, seed=None, volatility=1.0, spread=(0.05, 0.30), levels=8,
+                 taker_rate=2.0, order_rate=0, request_rate=0, paths=None):
+        self.ticks_per_period = ticks
+        self.tick = 0
+        self.status = 'ACTIVE'
+        self.random = random.Random(seed)
+        self.volatility = volatility  # Multiplier on each security's per-tick volatility
+        self.paths = paths or {}  # ticker -> fair value per tick, replayed instead of the random walk while it lasts
+        self.spread = spread  # Range of background half-spreads, drawn per ticker per tick
+        self.levels = levels  # Background price levels per side
+        self.taker_rate = taker_rate  # Mean background market orders per ticker per tick
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+        self.books = {ticker: OrderBook() for ticker in SECURITIES}
+        self.fair = {ticker: spec['start'] for ticker, spec in SECURITIES.items()}
+        self.last = dict(self.fair)
+        self.volume = {ticker: 0 for ticker in SECURITIES}
+        self.tape = {ticker: [] for ticker in SECURITIES}
+        self.orders = {}  # order_id -> Order for our trader only
+        self.accounts = {ticker: Account() for ticker in SECURITIES}
+        self.background = {ticker: [] for ticker in SECURITIES}
+        self.order_bucket = TokenBucket(order_rate) if order_rate else None
+        self.request_bucket = TokenBucket(request_rate) if request_rate else None
+        self.requests = {}  # 'METHOD /path' -> count, for benchmarking
+        with self.lock:
+            for ticker in SECURITIES:
+                self._refresh_background(ticker)
+
+    # --- Matching engine -------------------------------------------------
+
+    def _fill(self, resting, incoming, quantity):
+        price = resting.price
+        for order in (resting, incoming):
+            order.quantity_filled += quantity
+            order.notional += quantity * price
+            if order.remaining == 0:
+                order.status = 'TRANSACTED'
+            if order.trader_id == TRADER_ID:
+                spec = SECURITIES[order.ticker]
+                account = self.accounts[order.ticker]
+                account.apply(quantity if order.action == 'BUY' else -quantity, price)
+                if order is resting:
+                    account.fees += spec['rebate'] * quantity  # Passive fill earns (or pays) the rebate
+                else:
+                    account.fees -= spec['fee'] * quantity  # Aggressive fill pays (or earns) the fee
+        ticker = resting.ticker
+        self.last[ticker] = price
+        self.volume[ticker] += quantity
+        self.tape[ticker].append({'id': next(self.trade_ids), 'period': 1, 'tick': self.tick,
+                                  'price': price, 'quantity': quantity})
+
+    def _match(self, order):
+        book = self.books[order.ticker]
+        opposite = book.opposite(order.action)
+        while order.remaining and opposite:
+            resting = opposite[0]
+            if order.type == 'LIMIT':
+                if order.action == 'BUY' and resting.price > order.price:
+                    break
+                if order.action == 'SELL' and resting.price < order.price:
+                    break
+            self._fill(resting, order, min(order.remaining, resting.remaining))
+            if resting.remaining == 0:
+                book.remove(resting)
+        if order.remaining:
+            if order.type == 'LIMIT':
+                book.add(order)
+            else:
+                order.status = 'TRANSACTED' if order.quantity_filled else 'CANCELLED'  # Unfilled market remainder lapses
+
+    def _new_order(self, trader_id, ticker, order_type, quantity, action, price):
+        order = Order(next(self.ids), self.tick, trader_id, ticker, order_type, quantity, action,
+                      round(price, 2) if price is not None else None)
+        self._match(order)
+        return order
+
+    def _cancel(self, order):
+        if order.status == 'OPEN':
+            self.books[order.ticker].remove(order)
+            order.status = 'CANCELLED'
+            return True
+        return False
+
+    # --- Background market ---------------------------------------------
+
+    def _refresh_background(self, ticker):
+        for order in self.background[ticker]:
+            self._cancel(order)
+        fair = self.fair[ticker]
+        half = self.random.uniform(*self.spread)
+        book = self.books[ticker]
+        # Liquidity providers step back rather than cross orders still resting from the previous tick
+        bid_cap = book.asks[0].price - 0.01 if book.asks else float('inf')
+        ask_floor = book.bids[0].price + 0.01 if book.bids else 0.01
+        orders = []
+        for level in range(self.levels):
+            offset = half + 0.01 * level * self.random.randint(1, 3)
+            for action, price in (('BUY', min(fair - offset, bid_cap - 0.01 * level)),
+                                  ('SELL', max(fair + offset, ask_floor + 0.01 * level))):
+                quantity = 100 * self.random.randint(10, 50)
+                orders.append(self._new_order('market', ticker, 'LIMIT', quantity, action, max(price, 0.01)))
+        self.background[ticker] = [order for order in orders if order.status == 'OPEN']
+
+    def _background_flow(self, ticker):
+        # Poisson-ish number of background market orders, leaning with the fair-value drift
+        count = int(self.random.expovariate(1 / self.taker_rate)) if self.taker_rate else 0
+        book = self.books[ticker]
+        mid = (book.bids[0].price + book.asks[0].price) / 2 if book.bids and book.asks else self.fair[ticker]
+        for _ in range(count):
+            buy_bias = 0.5 + max(-0.3, min(0.3, (self.fair[ticker] - mid) * 2))
+            action = 'BUY' if self.random.random() < buy_bias else 'SELL'
+            self._new_order('market', ticker, 'MARKET', 100 * self.random.randint(1, 30), action, None)
+
+    def step(self):
+        """
+        Advances the case by one tick.
+        """
+        with self.lock:
+            if self.status != 'ACTIVE':
+                return
+            self.tick += 1
+            for ticker, spec in SECURITIES.items():
+                path = self.paths.get(ticker)
+                if path is not None and self.tick <= len(path):
+                    self.fair[ticker] = max(0.5, float(path[self.tick - 1]))
+                else:
+                    self.fair[ticker] = max(0.5, self.fair[ticker] + self.random.gauss(0, spec['volatility'] * self.volatility))
+                self._refresh_background(ticker)
+                self._background_flow(ticker)
+            if self.tick >= self.ticks_per_period:
+                self.status = 'STOPPED'
+                for order in list(self.orders.values()):
+                    self._cancel(order)
+
+    def run_clock(self, tick_seconds, stop=None):
+        """
+        Steps the case every tick_seconds until it stops or `stop` is set.
+        """
+        deadline = time.monotonic()
+        while self.status == 'ACTIVE' and not (stop and stop.is_set()):
+            deadline += tick_seconds
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            self.step()
+
+    # --- REST API --------------------------------------------------------
+
+    def _check_limits(self, ticker, quantity, action):
+        signed = quantity if action == 'BUY' else -quantity
+        positions = {t: account.position for t, account in self.accounts.items()}
+        positions[ticker] += signed
+        if sum(abs(pos) for pos in positions.values()) > GROSS_LIMIT:
+            raise SimulatorError(400, 'GROSS_LIMIT', 'Order would exceed the gross trading limit of %d' % GROSS_LIMIT)
+        if abs(sum(positions.values())) > NET_LIMIT:
+            raise SimulatorError(400, 'NET_LIMIT', 'Order would exceed the net trading limit of %d' % NET_LIMIT)
+
+    def _throttle(self, bucket):
+        if bucket is not None:
+            wait = bucket.take()
+            if wait:
+                raise SimulatorError(429, 'TOO_MANY_REQUESTS', 'Rate limit exceeded, retry in %.3f seconds' % wait, wait)
+
+    def _order(self, order_id):
+        try:
+            return self.orders[int(order_id)]
+        except (KeyError, ValueError):
+            raise SimulatorError(404, 'NOT_FOUND', 'Order %s was not found' % order_id)
+
+    def case(self, query):
+        return {'name': 'LOCAL SIMULATOR', 'period': 1, 'tick': self.tick, 'ticks_per_period': self.ticks_per_period,
+                'total_periods': 1, 'status': self.status, 'is_enforce_trading_limits': True}
+
+    def securities(self, query):
+        rows = []
+        for ticker, spec in SECURITIES.items():
+            if 'ticker' in query and query['ticker'] != ticker:
+                continue
+            book = self.books[ticker]
+            account = self.accounts[ticker]
+            rows.append({
+                'ticker': ticker, 'type': 'STOCK', 'position': account.position, 'vwap': round(account.cost, 4),
+                'realized': round(account.realized + account.fees, 2),
+                'unrealized': round((self.last[ticker] - account.cost) * account.position, 2),
+                'last': self.last[ticker], 'volume': self.volume[ticker],
+                'bid': book.bids[0].price if book.bids else 0, 'bid_size': book.bids[0].remaining if book.bids else 0,
+                'ask': book.asks[0].price if book.asks else 0, 'ask_size': book.asks[0].remaining if book.asks else 0,
+                'trading_fee': spec['fee'], 'limit_order_rebate': spec['rebate'], 'max_trade_size': MAX_ORDER_SIZE,
+            })
+        return rows
+
+    def securities_book(self, query):
+        book = self.books[self._ticker(query)]
+        limit = int(query.get('limit', 20))
+        return {'bids': [order.to_json() for order in book.bids[:limit]],
+                'asks': [order.to_json() for order in book.asks[:limit]]}
+
+    def securities_tas(self, query):
+        tape = self.tape[self._ticker(query)]
+        after = int(query.get('after', 0))
+        start = bisect.bisect_right(tape, after, key=lambda item: item['id'])  # Tape ids are increasing
+        prints = tape[start:]
+        if 'limit' in query:
+            prints = prints[-int(query['limit']):]
+        return prints[::-1]  # Newest first, like the RIT client
+
+    def get_orders(self, query):
+        status = query.get('status', 'OPEN')
+        return [order.to_json() for order in self.orders.values() if order.status == status]
+
+    def post_order(self, query):
+        self._throttle(self.order_bucket)
+        ticker = self._ticker(query)
+        order_type = query.get('type', '').upper()
+        action = query.get('action', '').upper()
+        try:
+            quantity = int(float(query['quantity']))
+            price = float(query['price']) if order_type == 'LIMIT' else None
+        except (KeyError, ValueError):
+            raise SimulatorError(400, 'BAD_REQUEST', 'quantity and, for LIMIT orders, price are required')
+        if order_type not in ('LIMIT', 'MARKET') or action not in ('BUY', 'SELL'):
+            raise SimulatorError(400, 'BAD_REQUEST', 'type must be LIMIT or MARKET and action BUY or SELL')
+        if not 0 < quantity <= MAX_ORDER_SIZE:
+            raise SimulatorError(400, 'BAD_REQUEST', 'Order quantity must be between 1 and %d' % MAX_ORDER_SIZE)
+        if self.status != 'ACTIVE':
+            raise SimulatorError(400, 'CASE_STOPPED', 'The case is not active')
+        self._check_limits(ticker, quantity, action)
+        order = Order(next(self.ids), self.tick, TRADER_ID, ticker, order_type, quantity, action,
+                      round(price, 2) if price is not None else None)
+        self.orders[order.order_id] = order
+        self._match(order)
+        return order.to_json()
+
+    def get_order(self, order_id):
+        return self._order(order_id).to_json()
+
+    def delete_order(self, order_id):
+        self._throttle(self.order_bucket)
+        if not self._cancel(self._order(order_id)):
+            raise SimulatorError(400, 'ORDER_CLOSED', 'Order %s is not open' % order_id)
+        return {'success': True}
+
+    def cancel_command(self, query):
+        self._throttle(self.order_bucket)
+        open_orders = [order for order in self.orders.values() if order.status == 'OPEN']
+        if 'ids' in query:
+            ids = {int(order_id) for order_id in query['ids'].split(',') if order_id}
+            targets = [order for order in open_orders if order.order_id in ids]
+        elif 'ticker' in query:
+            targets = [order for order in open_orders if order.ticker == query['ticker']]
+        elif query.get('all') in ('1', 'true', 'True'):
+            targets = open_orders
+        else:
+            raise SimulatorError(400, 'BAD_REQUEST', 'One of all, ticker or ids is required')
+        return {'cancelled_order_ids': [order.order_id for order in targets if self._cancel(order)]}
+
+    def _ticker(self, query):
+        ticker = query.get('ticker')
+        if ticker not in SECURITIES:
+            raise SimulatorError(400, 'BAD_REQUEST', 'Unknown ticker %r' % ticker)
+        return ticker
+
+    def dispatch(self, method, path, query):
+        """
+        Routes one request and returns (status, body).
+        """
+        path = path.rstrip('/')
+        order_id = None
+        route = path
+        if path.startswith('/v1/orders/'):
+            order_id = path[len('/v1/orders/'):]
+            route = '/v1/orders/{id}'
+        with self.lock:
+            name = method + ' ' + route
+            self.requests[name] = self.requests.get(name, 0) + 1
+            try:
+                self._throttle(self.request_bucket)
+                if name == 'GET /v1/case':
+                    return 200, self.case(query)
+                if name == 'GET /v1/securities':
+                    return 200, self.securities(query)
+                if name == 'GET /v1/securities/book':
+                    return 200, self.securities_book(query)
+                if name == 'GET /v1/securities/tas':
+                    return 200, self.securities_tas(query)
+                if name == 'GET /v1/orders':
+                    return 200, self.get_orders(query)
+                if name == 'POST /v1/orders':
+                    return 200, self.post_order(query)
+                if name == 'GET /v1/orders/{id}':
+                    return 200, self.get_order(order_id)
+                if name == 'DELETE /v1/orders/{id}':
+                    return 200, self.delete_order(order_id)
+                if name == 'POST /v1/commands/cancel':
+                    return 200, self.cancel_command(query)
+                raise SimulatorError(404, 'NOT_FOUND', 'No route for %s %s' % (method, path))
+            except SimulatorError as error:
+                body = {'code': error.code, 'message': error.message}
+                if error.wait is not None:
+                    body['wait'] = round(error.wait, 3)
+                return error.status, body
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled clients reuse connections
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't let them wait on delayed ACKs
+    simulator = None
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)  # Parameters travel in the query string, like the RIT client
+        status, body = self.simulator.dispatch(method, url.path, query)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 429:
+            self.send_header('Retry-After', '%.3f' % body.get('wait', 0))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        pass  # Per-request logging would dominate the cost of a fast case
+
+
+def serve(simulator, host='localhost', port=9999):
+    """
+    Starts the HTTP server on a daemon thread and returns it; port 0 picks a free port.
+    """
+    handler = type('BoundHandler', (Handler,), {'simulator': simulator})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='simulator-http', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local RIT-compatible case simulator')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--ticks', type=int, default=600, help='ticks in the period')
+    parser.add_argument('--tick-seconds', type=float, default=1.0, help='wall-clock length of a tick')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--volatility', type=float, default=1.0, help='multiplier on every security volatility')
+    parser.add_argument('--taker-rate', type=float, default=2.0, help='mean background market orders per ticker per tick')
+    parser.add_argument('--order-rate', type=float, default=0, help='order-entry requests per second, 0 for unlimited')
+    parser.add_argument('--request-rate', type=float, default=0, help='requests per second of any kind, 0 for unlimited')
+    args = parser.parse_args()
+
+    simulator = Simulator(ticks=args.ticks, seed=args.seed, volatility=args.volatility, taker_rate=args.taker_rate,
+                          order_rate=args.order_rate, request_rate=args.request_rate)
+    server = serve(simulator, args.host, args.port)
+    print('Serving on http://%s:%d/v1' % server.server_address[:2])
+    try:
+        simulator.run_clock(args.tick_seconds)
+        time.sleep(1.0)  # Let the client observe STOPPED before shutting down
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    for ticker, account in simulator.accounts.items():
+        print('%-5s position %7d  realized %10.2f  fees/rebates %9.2f' % (ticker, account.position, account.realized, account.fees))
+
+
+if __name__ == '__main__':
+    main()
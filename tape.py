@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental time-and-sales consumption.
+
+The TapeFollower asks /securities/tas only for prints newer than the last id
+it has seen, so a poll late in the case costs the same as one early on, and
+feeds each print into per-ticker TradeFlow statistics that are maintained
+incrementally over a rolling window of ticks.
+"""
+
+from collections import deque
+from math import isnan, nan
+
+
+class TradeFlow:
+    """
+    Rolling trade statistics for one ticker over the last `window` ticks.
+
+    Signed flow is positive for buyer-initiated prints. A print is flagged as
+    large when it is at least `large_multiple` times the average print size.
+    """
+
+    def __init__(self, window=20, large_multiple=5.0, size_span=50):
+        self.window = window
+        self.large_multiple = large_multiple
+        self.size_alpha = 2.0 / (size_span + 1)
+        self.buckets = deque()  # [tick, volume, signed volume, notional, prints, large prints]
+        self.volume = 0.0
+        self.signed = 0.0
+        self.notional = 0.0
+        self.prints = 0
+        self.large = 0
+        self.total_volume = 0.0  # Whole-case totals for the session VWAP
+        self.total_notional = 0.0
+        self.average_size = nan
+        self.last_price = nan
+        self.last_large = None  # (tick, price, quantity, sign) of the most recent large print
+        self.tick = 0
+
+    def advance(self, tick):
+        """
+        Drops buckets that have left the window, even if no prints arrived.
+        """
+        self.tick = max(self.tick, tick)
+        oldest = self.tick - self.window + 1
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, volume, signed, notional, prints, large = self.buckets.popleft()
+            self.volume -= volume
+            self.signed -= signed
+            self.notional -= notional
+            self.prints -= prints
+            self.large -= large
+
+    def add(self, tick, price, quantity, sign):
+        self.advance(tick)
+        tick = self.tick  # A late print joins the newest bucket, so the buckets stay in tick order for advance()
+        if not self.buckets or self.buckets[-1][0] != tick:
+            self.buckets.append([tick, 0.0, 0.0, 0.0, 0, 0])
+        bucket = self.buckets[-1]
+        is_large = not isnan(self.average_size) and quantity >= self.large_multiple * self.average_size
+        bucket[1] += quantity
+        bucket[2] += sign * quantity
+        bucket[3] += price * quantity
+        bucket[4] += 1
+        bucket[5] += is_large
+        self.volume += quantity
+        self.signed += sign * quantity
+        self.notional += price * quantity
+        self.prints += 1
+        self.large += is_large
+        self.total_volume += quantity
+        self.total_notional += price * quantity
+        if is_large:
+            self.last_large = (tick, price, quantity, sign)
+        if isnan(self.average_size):
+            self.average_size = quantity
+        else:
+            self.average_size += self.size_alpha * (quantity - self.average_size)
+        self.last_price = price
+
+    def vwap(self):
+        """
+        VWAP over the window, NaN if nothing traded in it.
+        """
+        return self.notional / self.volume if self.volume else nan
+
+    def session_vwap(self):
+        return self.total_notional / self.total_volume if self.total_volume else nan
+
+    def imbalance(self):
+        """
+        Signed volume over total volume in the window, from -1 (all selling) to 1 (all buying).
+        """
+        return self.signed / self.volume if self.volume else 0.0
+
+    def rate(self):
+        """
+        Prints per tick over the window.
+        """
+        return self.prints / self.window
+
+
+class TapeFollower:
+    """
+    Polls /securities/tas with `after` and keeps a TradeFlow per ticker.
+    """
+
+    def __init__(self, session, base_url, tickers, window=20, large_multiple=5.0, recorder=None):
+        self.session = session
+        self.base_url = base_url
+        self.last_id = {ticker: 0 for ticker in tickers}
+        self.flows = {ticker: TradeFlow(window, large_multiple) for ticker in tickers}
+        self.recorder = recorder
+
+    def poll(self, ticker, tick, quote=None):
+        """
+        Fetches and absorbs the prints newer than the last one seen; returns them oldest first.
+
+        Prints are classified against the quote's mid when one is given,
+        otherwise by the tick rule against the previous print.
+        """
+        resp = self.session.get(self.base_url + '/securities/tas',
+                                params={'ticker': ticker, 'after': self.last_id[ticker]})
+        if not resp.ok:
+            return []
+        prints = sorted(resp.json(), key=lambda item: item['id'])
+        flow = self.flows[ticker]
+        mid = (quote.bid + quote.ask) / 2 if quote is not None else None
+        for item in prints:
+            price = item['price']
+            reference = mid if mid is not None else flow.last_price
+            sign = 1 if price > reference else -1 if price < reference else 0
+            flow.add(item.get('tick', tick), price, item['quantity'], sign)
+        flow.advance(tick)
+        if prints:
+            self.last_id[ticker] = prints[-1]['id']
+            if self.recorder is not None:
+                self.recorder.tape(ticker, prints)
+        return prints
+
+    def poll_all(self, snapshot, executor):
+        """
+        Polls every ticker in the snapshot concurrently on `executor`.
+        """
+        futures = [executor.submit(self.poll, ticker, snapshot.tick, quote)
+                   for ticker, quote in snapshot.quotes.items()]
+        return [future.result() for future in futures]
+
+    def __getitem__(self, ticker):
+        return self.flows[ticker]
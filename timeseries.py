@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling-window price store.
+
+Keeps one bounded ring buffer per ticker with incrementally maintained
+statistics over any set of window lengths: sum/mean, variance, min/max,
+VWAP and EWMAs. Every update and query is O(1) (amortized for min/max), and
+memory does not grow with the length of the case.
+
+Samples are one per tick. Repeated updates within a tick overwrite a pending
+sample, which is committed when a later tick arrives; ticks that were never
+seen are committed as NaN and counted as missing instead of being treated as
+a zero price.
+"""
+
+from collections import deque
+from math import isnan, nan, sqrt
+
+import numpy as np
+
+
+class Window:
+    """
+    Running statistics over the last `length` committed samples.
+    """
+
+    __slots__ = ('length', 'total', 'squares', 'valid', 'notional', 'volume', 'highs', 'lows')
+
+    def __init__(self, length):
+        self.length = length
+        self.total = 0.0
+        self.squares = 0.0
+        self.valid = 0
+        self.notional = 0.0
+        self.volume = 0.0
+        self.highs = deque()  # (index, value), values decreasing
+        self.lows = deque()  # (index, value), values increasing
+
+    def add(self, index, value, volume):
+        if isnan(value):
+            return
+        self.total += value
+        self.squares += value * value
+        self.valid += 1
+        self.notional += value * volume
+        self.volume += volume
+        while self.highs and self.highs[-1][1] <= value:
+            self.highs.pop()
+        self.highs.append((index, value))
+        while self.lows and self.lows[-1][1] >= value:
+            self.lows.pop()
+        self.lows.append((index, value))
+
+    def remove(self, index, value, volume):
+        if not isnan(value):
+            self.total -= value
+            self.squares -= value * value
+            self.valid -= 1
+            self.notional -= value * volume
+            self.volume -= volume
+        if self.highs and self.highs[0][0] <= index:
+            self.highs.popleft()
+        if self.lows and self.lows[0][0] <= index:
+            self.lows.popleft()
+
+
+class Series:
+    """
+    One ticker's price history and statistics.
+    """
+
+    def __init__(self, windows=(10, 30, 60), spans=(10, 30), history=None):
+        self.capacity = max(max(windows), history or 0)
+        self.values = np.full(self.capacity, nan)
+        self.volumes = np.zeros(self.capacity)
+        self.windows = {length: Window(length) for length in windows}
+        self.alphas = {span: 2.0 / (span + 1) for span in spans}
+        self.ewmas = {span: nan for span in spans}
+        self.ewvars = {span: 0.0 for span in spans}
+        self.count = 0  # Samples committed so far; the next one gets this index
+        self.tick = None  # Tick of the pending sample
+        self.pending = (nan, 0.0)
+
+    def update(self, tick, price, volume=0.0):
+        """
+        Sets the sample for `tick`; a new tick commits the previous one. Older ticks are ignored.
+        """
+        if self.tick is not None and tick < self.tick:
+            return
+        if self.tick is not None and tick > self.tick:
+            self._commit(*self.pending)
+            for _ in range(min(tick - self.tick - 1, self.capacity)):
+                self._commit(nan, 0.0)  # Ticks we never saw are explicit gaps
+        self.tick = tick
+        self.pending = (price, volume)
+
+    def _commit(self, value, volume):
+        index = self.count
+        slot = index % self.capacity
+        for window in self.windows.values():
+            leaving = index - window.length
+            if leaving >= 0:
+                old = leaving % self.capacity
+                window.remove(leaving, self.values[old], self.volumes[old])
+            window.add(index, value, volume)
+        self.values[slot] = value
+        self.volumes[slot] = volume
+        self.count += 1
+        if not isnan(value):
+            for span, alpha in self.alphas.items():
+                mean = self.ewmas[span]
+                if isnan(mean):
+                    self.ewmas[span] = value
+                else:
+                    delta = value - mean
+                    self.ewmas[span] = mean + alpha * delta
+                    self.ewvars[span] = (1 - alpha) * (self.ewvars[span] + alpha * delta * delta)
+        if self.count % self.capacity == 0:
+            self._resum()
+
+    def _resum(self):
+        # Rebuilds the running sums from the buffer once per lap so float drift stays bounded
+        for length, window in self.windows.items():
+            start = self.count - min(length, self.count)
+            slots = [index % self.capacity for index in range(start, self.count)]
+            values = self.values[slots]
+            volumes = self.volumes[slots]
+            valid = ~np.isnan(values)
+            window.total = float(values[valid].sum())
+            window.squares = float((values[valid] ** 2).sum())
+            window.valid = int(valid.sum())
+            window.notional = float((values[valid] * volumes[valid]).sum())
+            window.volume = float(volumes[valid].sum())
+
+    def export(self):
+        """
+        Returns (tick, committed values, volumes, pending) to rebuild the series from, oldest first.
+        """
+        kept = min(self.count, self.capacity)
+        slots = [index % self.capacity for index in range(self.count - kept, self.count)]
+        return self.tick, self.values[slots].tolist(), self.volumes[slots].tolist(), self.pending
+
+    def restore(self, exported):
+        """
+        Replays an export() into this (empty) series; windows and EWMAs are rebuilt from the samples.
+        """
+        tick, values, volumes, pending = exported
+        if tick is None:
+            return
+        start = tick - len(values)
+        for offset, (value, volume) in enumerate(zip(values, volumes)):
+            self.update(start + offset, value, volume)
+        self.update(tick, *pending)
+
+    # --- Queries -----------------------------------------------------------
+
+    def last(self):
+        """
+        The current tick's price (pending sample), NaN if none has been seen.
+        """
+        return self.pending[0]
+
+    def at(self, tick):
+        """
+        Price stored for `tick`; NaN if missing, not seen yet or older than the buffer.
+        """
+        if self.tick is None or tick > self.tick:
+            return nan
+        if tick == self.tick:
+            return self.pending[0]
+        back = self.tick - tick  # 1 is the last committed sample: committed ticks are contiguous up to self.tick
+        if back > min(self.count, self.capacity):
+            return nan
+        return self.values[(self.count - back) % self.capacity]
+
+    def lag(self, ticks):
+        """
+        Price `ticks` ticks before the newest tick updated; NaN if missing or older than the buffer.
+
+        Until the current tick's first update() that newest tick is the
+        previous one, so read lags after updating, or use at() with the tick.
+        """
+        return nan if self.tick is None else self.at(self.tick - ticks)
+
+    def mean(self, length):
+        window = self.windows[length]
+        return window.total / window.valid if window.valid else nan
+
+    def std(self, length):
+        window = self.windows[length]
+        if window.valid < 2:
+            return nan
+        mean = window.total / window.valid
+        return sqrt(max(0.0, (window.squares - window.valid * mean * mean) / (window.valid - 1)))
+
+    def min(self, length):
+        lows = self.windows[length].lows
+        return lows[0][1] if lows else nan
+
+    def max(self, length):
+        highs = self.windows[length].highs
+        return highs[0][1] if highs else nan
+
+    def vwap(self, length):
+        window = self.windows[length]
+        return window.notional / window.volume if window.volume else nan
+
+    def missing(self, length):
+        """
+        Number of gaps among the last `length` committed ticks.
+        """
+        return min(length, self.count) - self.windows[length].valid
+
+    def ewma(self, span):
+        return self.ewmas[span]
+
+    def ewm_std(self, span):
+        return sqrt(self.ewvars[span])
+
+
+class RollingStore:
+    """
+    Series keyed by ticker, all with the same windows and spans.
+    """
+
+    def __init__(self, tickers, windows=(10, 30, 60), spans=(10, 30), history=None):
+        self.series = {ticker: Series(windows, spans, history) for ticker in tickers}
+
+    def update(self, ticker, tick, price, volume=0.0):
+        self.series[ticker].update(tick, price, volume)
+
+    def export(self):
+        return {ticker: series.export() for ticker, series in self.series.items()}
+
+    def restore(self, exported):
+        for ticker, state in exported.items():
+            if ticker in self.series:
+                self.series[ticker].restore(state)
+
+    def __getitem__(self, ticker):
+        return self.series[ticker]
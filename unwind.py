@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Inventory unwind engine.
+
+A ticker that leaves its quoting band with inventory above its policy's
+unwind trigger gets an unwind program instead of a 1000-share MARKET order
+every iteration. A program works the whole position down over a horizon of
+ticks on one of three schedules:
+
+    twap     equal slices per tick over the horizon
+    pov      a fixed share of the volume printing on the tape
+    iceberg  a fixed display size resting at the touch, no time schedule
+
+Every run the program compares the inventory left with what its schedule
+says should be left. Shares it is ahead on are not worked. The next slice
+rests passively at our side of the touch as a wanted quote, so it keeps its
+queue place across requotes and earns the limit rebate. Shares it is behind
+on are taken aggressively, at most once per tick and never more than the
+opposite touch shows, when crossing is cheaper than resting (the fee plus
+half the spread against the rebate) or when the horizon or the case is
+about to run out. A ticker drifting back into its band for a few ticks
+keeps its program; one left idle for longer than its urgency window starts
+a fresh one. Both kinds of child go through the risk engine, so
+unwinds in every ticker stay inside the gross and net limits.
+
+With a SignalMatrix, a position that currently hedges the rest of the book
+(a negative risk contribution) is not crossed for being cheaper, only when
+time runs out: taking it off aggressively would add to the book's risk.
+"""
+
+from math import isnan
+
+STYLES = ('twap', 'pov', 'iceberg')
+
+
+class Program:
+    """
+    One ticker's unwind in progress.
+    """
+
+    __slots__ = ('action', 'style', 'start_tick', 'quantity', 'horizon', 'start_volume', 'last_aggressive', 'last_tick')
+
+    def __init__(self, action, style, start_tick, quantity, horizon, start_volume):
+        self.action = action
+        self.style = style
+        self.start_tick = start_tick
+        self.quantity = quantity  # Inventory when the program started
+        self.horizon = horizon
+        self.start_volume = start_volume  # Tape volume when the program started, for POV
+        self.last_aggressive = None  # Tick of the last aggressive child
+        self.last_tick = start_tick  # Tick the program last ran
+
+    def planned(self, tick, volume, participation):
+        """
+        Inventory the schedule says should be left at `tick`.
+        """
+        elapsed = tick - self.start_tick
+        if elapsed >= self.horizon:
+            return 0
+        if self.style == 'twap':
+            return self.quantity * (1 - elapsed / self.horizon)
+        if self.style == 'pov':
+            return max(self.quantity - participation * (volume - self.start_volume), 0)
+        return self.quantity  # Iceberg: no schedule until the horizon runs out
+
+
+class UnwindEngine:
+    """
+    Unwind programs keyed by ticker.
+
+    `send(ticker, order_type, quantity, price, action)` places an aggressive
+    child and returns something falsy if it was not sent; algorithm.place_order
+    in the strategy. `flows` maps ticker ->
+    tape.TradeFlow and is needed for POV schedules. `signals` is the
+    SignalMatrix whose risk contributions hold back crossing on hedges.
+    """
+
+    def __init__(self, send, flows=None, signals=None):
+        self.send = send
+        self.flows = flows
+        self.signals = signals
+        self.programs = {}
+        self.tick = None
+        self.ticks_left = None  # Ticks to the end of the case, None if unknown
+        self.features = {}
+        self.started = 0
+        self.rests = 0  # Runs that rested a passive child
+        self.aggressive = 0  # Aggressive child shares sent
+        self.children = 0  # Aggressive child orders sent
+
+    def observe(self, snapshot):
+        """
+        Takes the tick, the case length and the book features programs run against this pass.
+        """
+        self.tick = snapshot.tick
+        self.features = snapshot.features
+        if snapshot.ticks_per_period is not None:
+            self.ticks_left = snapshot.ticks_per_period - snapshot.tick
+
+    def _volume(self, ticker):
+        return self.flows[ticker].total_volume if self.flows is not None else 0.0
+
+    def stop(self, ticker):
+        self.programs.pop(ticker, None)
+
+    def work(self, quotes, ticker, position, policy):
+        """
+        Runs one step of the ticker's unwind; returns False once the position is within the trigger.
+
+        Passive children are declared on `quotes` and go out with its next
+        sync; an aggressive child is sent straight away.
+        """
+        if abs(position) <= policy.unwind_trigger:
+            self.stop(ticker)
+            return False
+        features = self.features.get(ticker)
+        if features is None or self.tick is None or isnan(features.bid) or isnan(features.ask):
+            return True  # No two-sided book this pass; keep the program and try again
+        action = 'SELL' if position > 0 else 'BUY'
+        remaining = abs(position)
+        program = self.programs.get(ticker)
+        if program is None or program.action != action or self.tick - program.last_tick > policy.unwind_urgency:
+            horizon = policy.unwind_horizon
+            if self.ticks_left is not None:
+                horizon = max(min(horizon, self.ticks_left), 1)
+            program = Program(action, policy.unwind_style, self.tick, remaining, horizon, self._volume(ticker))
+            self.programs[ticker] = program
+            self.started += 1
+        program.last_tick = self.tick
+
+        bid, ask = features.bid, features.ask
+        behind = remaining - program.planned(self.tick, self._volume(ticker), policy.unwind_participation)
+        ticks_left = program.start_tick + program.horizon - self.tick
+        if self.ticks_left is not None:
+            ticks_left = min(ticks_left, self.ticks_left)
+        half_spread = (ask - bid) / 2
+        cheaper = half_spread + policy.fee <= -policy.rebate - half_spread  # Crossing against resting at the touch
+        if cheaper and self.signals is not None and self.signals.contribution(ticker) < 0:
+            cheaper = False  # The position offsets the rest of the book; only time pressure takes it off
+        if behind > 0 and (cheaper or ticks_left <= policy.unwind_urgency) and program.last_aggressive != self.tick:
+            depth = features.bid_size if action == 'SELL' else features.ask_size
+            quantity = int(min(behind, depth, policy.unwind_size))
+            if quantity > 0 and self.send(ticker, 'MARKET', quantity, bid if action == 'SELL' else ask, action):
+                program.last_aggressive = self.tick
+                remaining -= quantity
+                behind -= quantity
+                self.aggressive += quantity
+                self.children += 1
+
+        if program.style == 'iceberg':
+            clip = min(remaining, policy.unwind_display)
+        else:
+            pace = program.quantity / program.horizon
+            if program.style == 'pov' and self.flows is not None:
+                flow = self.flows[ticker]
+                if flow.volume:  # Without prints in the window POV rests TWAP-sized slices
+                    pace = policy.unwind_participation * flow.volume / flow.window
+            clip = min(remaining, policy.unwind_display, max(behind + pace, 0))
+        clip = int(clip)
+        if clip > 0:
+            quotes.want(ticker, clip, ask if action == 'SELL' else bid, action)
+            self.rests += 1
+        return True
+
+    def report(self):
+        return 'unwind %d programs (%d active), %d passive rests, %d aggressive shares in %d children' % (
+            self.started, len(self.programs), self.rests, self.aggressive, self.children)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process execution mode.
+
+Runs the strategy as one worker process per ticker (or per group of tickers
+with --processes), each with its own session, market data, scheduler and
+quote manager, so a slow ladder on one ticker never delays another. The
+parent process is the coordinator: it owns the global gross/net limits and
+the position feed.
+
+    python workers.py                  # one worker per ticker
+    python workers.py --processes 2    # tickers spread over two workers
+
+State is exchanged through one shared-memory segment laid out as NumPy
+structured arrays, one row per ticker, each row guarded by a seqlock. Every
+row has exactly one writer, so writes take no lock and readers retry only
+if they raced a write:
+
+    quotes   written by the ticker's worker: tick, bid, ask, resting buys and sells
+    limits   written by the coordinator: position and the ticker's long and short caps
+    control  written by the coordinator: tick, status, gross, net
+
+The coordinator turns the global limits into per-ticker caps on
+position + resting buys and position - resting sells. Each ticker keeps its
+current worst case plus an equal share of the remaining headroom, so the
+caps can never add up past the limits. Workers check orders against their
+caps locally, without a round trip.
+"""
+
+import argparse
+import os
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from time import sleep
+
+import numpy as np
+import requests
+
+QUOTE_ROW = np.dtype([('seq', 'u8'), ('tick', 'i8'), ('bid', 'f8'), ('ask', 'f8'), ('buys', 'f8'), ('sells', 'f8'),
+                      ('runs', 'u8'), ('pnl', 'f8')])
+LIMIT_ROW = np.dtype([('seq', 'u8'), ('position', 'f8'), ('max_long', 'f8'), ('max_short', 'f8')])
+CONTROL_ROW = np.dtype([('seq', 'u8'), ('tick', 'i8'), ('active', 'u1'), ('gross', 'f8'), ('net', 'f8')])
+
+
+class Seqlock:
+    """
+    Rows of a structured array in shared memory, each guarded by its 'seq' field.
+
+    The writer makes seq odd, writes the fields and makes it even again; a
+    reader copies the row and retries if seq was odd or changed meanwhile.
+    Correct only with a single writer per row.
+    """
+
+    def __init__(self, buffer, dtype, count, offset):
+        self.rows = np.ndarray(count, dtype=dtype, buffer=buffer, offset=offset)
+        self.seq = self.rows['seq']
+
+    def write(self, index, **fields):
+        seq = self.seq[index]
+        self.seq[index] = seq + 1
+        for name, value in fields.items():
+            self.rows[name][index] = value
+        self.seq[index] = seq + 2
+
+    def read(self, index):
+        while True:
+            seq = self.seq[index]
+            if seq & 1:
+                continue
+            row = self.rows[index].copy()
+            if self.seq[index] == seq:
+                return row
+
+
+class SharedState:
+    """
+    The shared-memory segment: quotes and limits rows per ticker plus one control row.
+    """
+
+    def __init__(self, tickers, name=None):
+        self.tickers = list(tickers)
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        count = len(self.tickers)
+        size = count * (QUOTE_ROW.itemsize + LIMIT_ROW.itemsize) + CONTROL_ROW.itemsize
+        self.owner = name is None
+        self.memory = SharedMemory(name=name, create=self.owner, size=size)
+        if self.owner:
+            self.memory.buf[:size] = bytes(size)
+        self.quotes = Seqlock(self.memory.buf, QUOTE_ROW, count, 0)
+        self.limits = Seqlock(self.memory.buf, LIMIT_ROW, count, count * QUOTE_ROW.itemsize)
+        self.control = Seqlock(self.memory.buf, CONTROL_ROW, 1, count * (QUOTE_ROW.itemsize + LIMIT_ROW.itemsize))
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def close(self):
+        # The structured views hold exports of the buffer; drop them before closing
+        del self.quotes, self.limits, self.control
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def allocate_caps(positions, buys, sells, gross_limit, long_limit, short_limit):
+    """
+    Returns (max_long, max_short) arrays: per-ticker caps on position + buys and position - sells.
+
+    Each ticker keeps its current worst case and gets an equal share of the
+    remaining gross and net headroom.
+    """
+    count = len(positions)
+    long_side = positions + buys
+    short_side = positions - sells
+    contribution = np.maximum(np.abs(long_side), np.abs(short_side))
+    gross_share = max(0.0, gross_limit - contribution.sum()) / count
+    long_share = max(0.0, long_limit - long_side.sum()) / count
+    short_share = max(0.0, short_side.sum() - short_limit) / count
+    ceiling = contribution + gross_share
+    max_long = np.minimum(ceiling, np.maximum(long_side, 0) + long_share)
+    max_short = np.maximum(-ceiling, np.minimum(short_side, 0) - short_share)
+    return max_long, max_short
+
+
+class SharedPositions:
+    """
+    Stands in for algorithm.PositionCache inside a worker: positions come from the coordinator's rows.
+    """
+
+    def __init__(self, state, risk):
+        self.state = state
+        self.risk = risk
+
+    def refresh(self):
+        """
+        Reads every ticker's position and hands them to the worker's risk engine.
+        """
+        positions = {ticker: float(self.state.limits.read(i)['position']) for ticker, i in self.state.index.items()}
+        self.risk.reconcile_positions(positions)
+        return positions
+
+    def invalidate(self):
+        pass  # Always current: the coordinator republishes every cycle
+
+    def position(self, ticker):
+        return float(self.state.limits.read(self.state.index[ticker])['position'])
+
+
+def worker_risk(tickers, state, order_limit):
+    """
+    A RiskEngine for a worker's tickers whose limits are the coordinator's per-ticker caps.
+    """
+    from risk import Check, RiskEngine
+
+    class WorkerRisk(RiskEngine):
+        def check(self, ticker, quantity, action):
+            limits = state.limits.read(state.index[ticker])
+            with self.lock:
+                if action == 'BUY':
+                    room = limits['max_long'] - (self.position[ticker] + self.buys[ticker])
+                else:
+                    room = (self.position[ticker] - self.sells[ticker]) - limits['max_short']
+                approved = int(min(quantity, self.order_limit, room))
+                if approved < quantity:
+                    if approved < min(self.min_quantity, quantity):
+                        self.vetoed += 1
+                        return Check(0, 'cap')
+                    self.resized += 1
+                self._update(ticker, 0, *self._resting(action, approved))
+                return Check(approved, None if approved == quantity else 'resized')
+
+        def unwind_quantity(self, ticker, soft=0.8):
+            control = state.control.read(0)
+            with self.lock:
+                position = self.position[ticker]
+                if not position or not control['gross']:
+                    return 0
+                excess = control['gross'] - soft * self.gross_limit
+                if position > 0:
+                    excess = max(excess * position / control['gross'], control['net'] - soft * self.long_limit)
+                else:
+                    excess = max(excess * -position / control['gross'], soft * self.short_limit - control['net'])
+                if excess <= 0:
+                    return 0
+                quantity = int(min(excess, abs(position), self.order_limit))
+                return -quantity if position > 0 else quantity
+
+    return WorkerRisk(tickers, order_limit=order_limit)
+
+
+def worker_main(tickers, all_tickers, shm_name, base_url, api_key=None):
+    """
+    Quotes `tickers` until the coordinator marks the case inactive.
+    """
+    import algorithm
+    from gateway import OrderGateway
+    from market_data import MarketData
+    from quotes import QuoteManager
+    from scheduler import QuotingScheduler
+    from tape import TapeFollower
+
+    state = SharedState(all_tickers, name=shm_name)
+    if api_key is not None:
+        algorithm.s.headers['X-API-key'] = api_key
+    algorithm.BASE_URL = base_url
+    algorithm.risk = risk = worker_risk(tickers, state, algorithm.ORDER_LIMIT)
+    algorithm.positions = SharedPositions(state, risk)
+    session = algorithm.s
+    market_data = MarketData(session, tickers, base_url)
+    algorithm.tape = tape = TapeFollower(session, base_url, tickers)
+    algorithm.unwinds.flows = tape.flows  # POV unwinds pace themselves on this worker's prints
+    tape_tick = None
+    ledger = algorithm.ledger
+    gateway = OrderGateway(session, base_url, algorithm.ORDER_LIMIT, risk=risk, ledger=ledger)
+    quotes = QuoteManager(session, base_url, tickers, gateway, ledger=ledger)
+    scheduler = QuotingScheduler(tickers, {ticker: algorithm.TICKER_BUDGETS[ticker] for ticker in tickers})
+    rows = [state.index[ticker] for ticker in tickers]
+    algorithm.policies.watch()  # Every worker picks up policy.json edits on its own
+
+    while state.control.read(0)['active']:
+        snapshot = market_data.snapshot()
+        if snapshot.tick is None or snapshot.status != 'ACTIVE':
+            sleep(scheduler.idle_wait)
+            continue
+        if None in snapshot.quotes.values():
+            continue  # A book request failed; decide on the next complete snapshot instead of crashing on it
+        ledger.mark_all(snapshot)
+        algorithm.unwinds.observe(snapshot)
+        if snapshot.tick != tape_tick:  # New prints are absorbed once per tick, as in algorithm.main()
+            tape.poll_all(snapshot, market_data.executor)
+            tape_tick = snapshot.tick
+        averages = {}
+        for ticker in tickers:
+            bid = snapshot[ticker].bid
+            averages[ticker] = algorithm.get_moving_average(ticker, snapshot.tick)
+            if averages[ticker] < bid/2 + 1:
+                averages[ticker] = bid
+            algorithm.prices.update(ticker, snapshot.tick, bid)
+        mids = []
+        for ticker in algorithm.signals.tickers:  # Other workers' tickers come from their quote rows
+            quote = snapshot.quotes.get(ticker)
+            if quote is None:
+                row = state.quotes.read(state.index[ticker])
+                quote = (row['bid'], row['ask'])  # Zeros until the row's worker first writes; skipped as missing
+            mids.append((quote[0] + quote[1]) / 2)
+        algorithm.signals.update(snapshot.tick, mids)
+
+        algorithm.positions.refresh()
+        algorithm.signals.revalue(algorithm.positions.position)
+        due = scheduler.due(snapshot, algorithm.positions.position)
+        if not due:
+            scheduler.idle()
+            continue
+        for ticker in due:
+            bid, ask, _ = snapshot[ticker]
+            algorithm.quote_ticker(quotes, ticker, bid, ask, averages[ticker])
+        for ticker in scheduler.expired(snapshot, due):
+            quotes.discard(ticker)
+            due.remove(ticker)
+        quotes.sync(snapshot.tick, due)
+        scheduler.spent(quotes.ticker_calls)
+        for ticker, row in zip(tickers, rows):
+            quote = snapshot[ticker]
+            state.quotes.write(row, tick=snapshot.tick, bid=quote.bid, ask=quote.ask, buys=risk.buys[ticker],
+                               sells=risk.sells[ticker], runs=scheduler.wakeups[ticker], pnl=ledger[ticker].total())
+
+    market_data.close()
+    gateway.close()
+    state.close()
+
+
+def coordinate(state, session, base_url, gross_limit, long_limit, short_limit, interval=0.05):
+    """
+    Publishes positions, caps and the case status until the case stops.
+    """
+    count = len(state.tickers)
+    positions = np.zeros(count)
+    tick = 0
+    state.control.write(0, active=1)
+    while True:
+        resp = session.get(base_url + '/case')
+        if resp.ok:
+            case = resp.json()
+            if case['status'] != 'ACTIVE':
+                break
+            tick = case['tick']
+        resp = session.get(base_url + '/securities')
+        if resp.ok:
+            for item in resp.json():
+                if item['ticker'] in state.index:
+                    positions[state.index[item['ticker']]] = item['position']
+        rows = [state.quotes.read(i) for i in range(count)]
+        buys = np.array([row['buys'] for row in rows])
+        sells = np.array([row['sells'] for row in rows])
+        max_long, max_short = allocate_caps(positions, buys, sells, gross_limit, long_limit, short_limit)
+        for i in range(count):
+            state.limits.write(i, position=positions[i], max_long=max_long[i], max_short=max_short[i])
+        state.control.write(0, tick=tick, active=1, gross=np.abs(positions).sum(),
+                            net=positions.sum())
+        sleep(interval)
+    state.control.write(0, active=0)
+
+
+def run(tickers, processes=None, base_url='http://localhost:9999/v1', api_key=None, gross_limit=250000,
+        long_limit=250000, short_limit=-250000):
+    """
+    Starts the workers, coordinates them until the case ends and returns the per-ticker quote rows.
+    """
+    processes = min(processes or len(tickers), len(tickers))
+    groups = [tickers[i::processes] for i in range(processes)]
+    state = SharedState(tickers)
+    session = requests.Session()
+    if api_key is not None:
+        session.headers['X-API-key'] = api_key
+    context = get_context('spawn')  # Workers build their own sessions and thread pools
+    workers = [context.Process(target=worker_main, args=(group, tickers, state.name, base_url, api_key),
+                               name='worker-' + '-'.join(group), daemon=True) for group in groups]
+    try:
+        state.control.write(0, active=1)
+        for worker in workers:
+            worker.start()
+        coordinate(state, session, base_url, gross_limit, long_limit, short_limit)
+    finally:
+        state.control.write(0, active=0)
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        rows = {ticker: state.quotes.read(state.index[ticker]) for ticker in tickers}
+        state.close()
+    return rows
+
+
+def main():
+    import algorithm
+
+    parser = argparse.ArgumentParser(description='Run the strategy as one process per ticker with a coordinator')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per ticker)')
+    parser.add_argument('--url', default=algorithm.BASE_URL)
+    parser.add_argument('--api-key', default=None)
+    args = parser.parse_args()
+    rows = run(algorithm.TICKERS, min(args.processes or len(algorithm.TICKERS), os.cpu_count() or 1), args.url,
+               args.api_key, algorithm.MAX_LONG_EXPOSURE, algorithm.MAX_LONG_EXPOSURE, algorithm.MAX_SHORT_EXPOSURE)
+    for ticker, row in rows.items():
+        print('%s tick %d runs %d resting %d/%d pnl %.2f' % (ticker, row['tick'], row['runs'], row['buys'], row['sells'],
+                                                            row['pnl']))
+
+
+if __name__ == '__main__':
+    main()